@@ -9,5 +9,21 @@ celery = Celery(__name__,
                 include=['agentrec-backend.tasks'] # Use include here
                )
 
+# Periodic maintenance, run by `celery beat`
+celery.conf.beat_schedule = {
+    'collect-upload-garbage': {
+        'task': 'tasks.collect_upload_garbage_task',
+        'schedule': Config.UPLOAD_GC_INTERVAL_SECONDS,
+    },
+    'evict-verdict-cache': {
+        'task': 'tasks.evict_verdict_cache_task',
+        'schedule': Config.AI_VERDICT_CACHE_EVICT_INTERVAL_SECONDS,
+    },
+    'collect-kb-index-garbage': {
+        'task': 'tasks.collect_kb_index_garbage_task',
+        'schedule': Config.KB_INDEX_GC_INTERVAL_SECONDS,
+    },
+}
+
 # Optional: Update config further if needed, but basic broker/backend might suffice
 # celery.conf.update(...) # Can add other Celery settings if necessary
\ No newline at end of file
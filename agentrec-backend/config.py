@@ -21,7 +21,62 @@ class Config:
 
     # --- File Uploads / KB ---
     UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')
+    # Uploads are stored once per content (UPLOAD_FOLDER/<sha256>) and reference-counted by jobs;
+    # unreferenced ones are garbage-collected after this grace period
+    UPLOAD_GC_GRACE_SECONDS = int(os.environ.get('UPLOAD_GC_GRACE_SECONDS') or 3600)
+    # How often celery beat runs the upload GC (job deletion also enqueues a run)
+    UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS') or 3600)
     KNOWLEDGE_BASE_PATH = os.path.join(basedir, 'static', 'knowledge_base.txt')
+    # Per-type KB chunk embeddings (memory-mapped .npy), shared by all worker processes
+    KB_INDEX_FOLDER = os.environ.get('KB_INDEX_FOLDER') or os.path.join(basedir, 'instance', 'kb_index')
+    # KB versions no type uses any more are deleted by the KB index GC (celery beat) once unused for this long
+    KB_INDEX_GC_GRACE_SECONDS = int(os.environ.get('KB_INDEX_GC_GRACE_SECONDS') or 86400)
+    KB_INDEX_GC_INTERVAL_SECONDS = int(os.environ.get('KB_INDEX_GC_INTERVAL_SECONDS') or 86400)
+
+    # --- Ingestion ---
+    # CSVs at or above this size are read in chunks and spilled to a memory-mapped Arrow file (0 = never)
+    STREAMING_INGEST_THRESHOLD_MB = int(os.environ.get('STREAMING_INGEST_THRESHOLD_MB') or 256)
+    # Rows per chunk in streaming mode; bounds peak worker memory during ingestion
+    INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS') or 200000)
+    # Stream .xlsx rows through openpyxl's read-only reader (mapped columns only) instead of pd.read_excel
+    EXCEL_STREAMING_INGEST = (os.environ.get('EXCEL_STREAMING_INGEST') or 'true').lower() in ('1', 'true', 'yes')
+    INGEST_FOLDER = os.environ.get('INGEST_FOLDER') or os.path.join(basedir, 'instance', 'ingested')
+    # Rows sample-parsed per file by the upload pre-flight check (header + these rows only)
+    UPLOAD_PREFLIGHT_SAMPLE_ROWS = int(os.environ.get('UPLOAD_PREFLIGHT_SAMPLE_ROWS') or 50)
+    # Reuse normalized parses (Arrow files next to the upload) keyed by file SHA-256 + mapping
+    PARSED_FILE_CACHE_ENABLED = (os.environ.get('PARSED_FILE_CACHE_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+
+    # --- Matching ---
+    # 'band_join' (vectorized pair table for the whole job) or 'index' (per-source indexed lookup)
+    CANDIDATE_ENGINE = os.environ.get('CANDIDATE_ENGINE') or 'band_join'
+    # Rank each source's candidates (amount, date, description-token similarity) and send only the best K to the LLM, best first (0 = off, target-file order)
+    CANDIDATE_TOP_K = int(os.environ.get('CANDIDATE_TOP_K') or 5)
+    # 'greedy' (targets claimed in source order) or 'optimal' (evaluate all candidates, then max-weight one-to-one assignment)
+    MATCH_ASSIGNMENT = os.environ.get('MATCH_ASSIGNMENT') or 'greedy'
+    # Flag repeated rows within a file (same ID/date/amount/normalized description) as Duplicate Transaction
+    DUPLICATE_DETECTION_ENABLED = (os.environ.get('DUPLICATE_DETECTION_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+    # Settle unambiguous exact (amount, date[, reference]) pairs without calling the LLM
+    EXACT_MATCH_FAST_PATH = (os.environ.get('EXACT_MATCH_FAST_PATH') or 'true').lower() in ('1', 'true', 'yes')
+    # Group leftover sources/targets whose amounts add up (batch deposits, split payments) into reviewable aggregate matches
+    AGGREGATE_MATCHING_ENABLED = (os.environ.get('AGGREGATE_MATCHING_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+    # Most transactions summed against one counterpart, and the largest accepted difference of the sum (currency units)
+    AGGREGATE_MAX_GROUP_SIZE = int(os.environ.get('AGGREGATE_MAX_GROUP_SIZE') or 4)
+    AGGREGATE_AMOUNT_TOLERANCE = float(os.environ.get('AGGREGATE_AMOUNT_TOLERANCE') or 0)
+
+    # --- AI Verdict Cache ---
+    AI_VERDICT_CACHE_ENABLED = (os.environ.get('AI_VERDICT_CACHE_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+    AI_VERDICT_CACHE_MAX_ENTRIES = int(os.environ.get('AI_VERDICT_CACHE_MAX_ENTRIES') or 500000)
+    AI_VERDICT_CACHE_MAX_AGE_DAYS = int(os.environ.get('AI_VERDICT_CACHE_MAX_AGE_DAYS') or 90)
+    # How often celery beat applies the age/size limits above
+    AI_VERDICT_CACHE_EVICT_INTERVAL_SECONDS = int(os.environ.get('AI_VERDICT_CACHE_EVICT_INTERVAL_SECONDS') or 3600)
+
+    # --- AI Evaluation ---
+    # Max concurrent LLM calls per job (1 = strictly sequential); ReconciliationType.ai_max_concurrency overrides
+    AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY') or 1)
+    # Max candidates of one source evaluated in a single batched prompt (1 = one pair per call)
+    AI_BATCH_MAX_SIZE = int(os.environ.get('AI_BATCH_MAX_SIZE') or 1)
+    # Per-job LRU of KB context keyed by normalized description text
+    KB_CONTEXT_CACHE_SIZE = int(os.environ.get('KB_CONTEXT_CACHE_SIZE') or 4096)
 
     # --- Azure OpenAI ---
     AZURE_OPENAI_ENDPOINT = os.environ.get('AZURE_OPENAI_ENDPOINT')
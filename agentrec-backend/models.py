@@ -28,6 +28,8 @@ class ReconciliationType(db.Model):
     knowledge_base_content = db.Column(db.Text, nullable=False)
     ai_prompt_template = db.Column(db.Text, nullable=False)
     candidate_selection_strategy = db.Column(db.String(50), default='default_date_amount')
+    candidate_strategy_params = db.Column(db.JSON, nullable=True) # Overrides of the strategy's default parameters (see candidate_service)
+    ai_max_concurrency = db.Column(db.Integer, nullable=True) # Overrides Config.AI_MAX_CONCURRENCY when set
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
@@ -51,6 +53,7 @@ class DataSourceMapping(db.Model):
     source_type = db.Column(db.Enum(MappingSourceType, name='mapping_source_type_enum', native_enum=False), nullable=False)
     column_mappings = db.Column(db.JSON, nullable=False)
     date_format_string = db.Column(db.String(50), nullable=True)
+    reference_patterns = db.Column(db.JSON, nullable=True) # Regexes extracting reference keys from descriptions at ingestion
     reconciliation_type_id = db.Column(db.Integer, db.ForeignKey('reconciliation_type.id'), nullable=True, index=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
@@ -76,6 +79,8 @@ class ReconciliationJob(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     completed_at = db.Column(db.DateTime(timezone=True), nullable=True)
     results_summary = db.Column(db.JSON, nullable=True)
+    # Upload-time ingestion: status plus per-file rows / dropped_rows / parse_seconds
+    ingestion_stats = db.Column(db.JSON, nullable=True)
 
     # --- DEFINE RELATIONSHIP HERE with backref to create ReconciliationType.jobs ---
     reconciliation_type = db.relationship('ReconciliationType', backref=db.backref('jobs', lazy='dynamic'))
@@ -130,7 +135,44 @@ class ReconciliationResultItem(db.Model):
         return {
             "id": self.display_id, "date": date_str, "description": self.description,
             "amount": amount_str, "status": self.status, "action": self.action,
-            "exception_id_display": details_data.get("exception_id_display", None), }
+            "exception_id_display": details_data.get("exception_id_display", None),
+            "group_id": (details_data.get("aggregate") or {}).get("group_id"), }
 
     def __repr__(self):
-        return f'<ReconciliationResultItem {self.id} for Job {self.job_id} ({self.status})>'
\ No newline at end of file
+        return f'<ReconciliationResultItem {self.id} for Job {self.job_id} ({self.status})>'
+
+class AIVerdictCache(db.Model):
+    """Persisted LLM verdicts keyed by normalized transaction pair + KB/prompt hashes."""
+    __tablename__ = 'ai_verdict_cache'
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    reconciliation_type_id = db.Column(db.Integer, db.ForeignKey('reconciliation_type.id'), nullable=True, index=True)
+    kb_hash = db.Column(db.String(64), nullable=False)
+    prompt_hash = db.Column(db.String(64), nullable=False)
+    verdict = db.Column(db.JSON, nullable=False)
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_used_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+    __table_args__ = {'extend_existing': True}
+
+    def __repr__(self):
+        return f'<AIVerdictCache {self.cache_key[:12]} ({(self.verdict or {}).get("status")})>'
+
+
+class UploadedFile(db.Model):
+    """Content-addressed upload blob (stored once under its SHA-256), shared by every job that references it."""
+    __tablename__ = 'uploaded_file'
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    storage_path = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    original_filename = db.Column(db.String(255), nullable=True) # Name it was first uploaded under
+    ref_count = db.Column(db.Integer, default=0, nullable=False) # Jobs whose source_file/target_file point here
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_referenced_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+    __table_args__ = {'extend_existing': True}
+
+    def __repr__(self):
+        return f'<UploadedFile {self.content_hash[:12]} refs={self.ref_count}>'
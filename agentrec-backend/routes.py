@@ -1,13 +1,15 @@
 # agentrec-backend/routes.py
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 # Use relative imports for models and tasks
 from .models import db, ReconciliationJob, JobStatus, ExceptionLog, ReconciliationResultItem, DataSourceMapping, ReconciliationType, MappingSourceType
-from .tasks import run_reconciliation_task
+from .tasks import run_reconciliation_task, ingest_job_files_task, collect_upload_garbage_task, mapping_config_for, ingestion_error, INGESTION_IN_PROGRESS
+from .services.upload_store import store_upload, release_upload
+from .services.verdict_cache import invalidate_type_entries
+from .services.ingestion_service import preflight_check, compile_reference_patterns, PREFLIGHT_ERRORS
+from .services.candidate_service import CANDIDATE_STRATEGIES, resolve_candidate_params
 from sqlalchemy import desc, or_
 import logging
-import os, json
-from werkzeug.utils import secure_filename
-from datetime import datetime
+import json
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +21,9 @@ def get_reconciliation_types():
     # ... (keep existing implementation) ...
     try:
         types = ReconciliationType.query.filter_by(is_active=True).order_by(ReconciliationType.name).all()
-        types_data = [{"id": t.id, "name": t.name, "description": t.description} for t in types]
+        types_data = [{"id": t.id, "name": t.name, "description": t.description,
+                       "candidate_selection_strategy": t.candidate_selection_strategy,
+                       "candidate_strategy_params": t.candidate_strategy_params} for t in types]
         return jsonify(types_data)
     except Exception as e:
         logging.error(f"Error fetching reconciliation types: {e}", exc_info=True)
@@ -40,6 +44,19 @@ def create_reconciliation_type():
     if missing_fields:
         return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
 
+    ai_max_concurrency = data.get('ai_max_concurrency')
+    if ai_max_concurrency is not None and (not isinstance(ai_max_concurrency, int) or ai_max_concurrency < 1):
+        return jsonify({"error": "ai_max_concurrency must be a positive integer"}), 400
+
+    candidate_strategy = data.get('candidate_selection_strategy', 'default_date_amount') # Use default if not provided
+    candidate_params = data.get('candidate_strategy_params')
+    if candidate_params is not None and not isinstance(candidate_params, dict):
+        return jsonify({"error": "candidate_strategy_params must be an object"}), 400
+    try:
+        resolve_candidate_params(candidate_strategy, candidate_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Check for duplicate name
     # Check for duplicate name using filter()
     if ReconciliationType.query.filter(ReconciliationType.name == data['name']).first(): # <-- Use .filter() and Model.attribute
@@ -51,7 +68,9 @@ def create_reconciliation_type():
             description=data.get('description'), # Optional field
             knowledge_base_content=data['knowledge_base_content'],
             ai_prompt_template=data['ai_prompt_template'],
-            candidate_selection_strategy=data.get('candidate_selection_strategy', 'default_date_amount'), # Use default if not provided
+            candidate_selection_strategy=candidate_strategy,
+            candidate_strategy_params=candidate_params, # Optional; unset parameters use the strategy defaults
+            ai_max_concurrency=ai_max_concurrency, # Optional; falls back to Config.AI_MAX_CONCURRENCY
             is_active=data.get('is_active', True) # Default to active
         )
         db.session.add(new_type)
@@ -62,6 +81,9 @@ def create_reconciliation_type():
             "id": new_type.id,
             "name": new_type.name,
             "description": new_type.description,
+            "candidate_selection_strategy": new_type.candidate_selection_strategy,
+            "candidate_strategy_params": new_type.candidate_strategy_params,
+            "ai_max_concurrency": new_type.ai_max_concurrency,
             "is_active": new_type.is_active
             # Avoid sending back large content fields unless necessary
         }), 201 # 201 Created status
@@ -72,6 +94,70 @@ def create_reconciliation_type():
         return jsonify({"error": "Failed to create reconciliation type"}), 500
 # --- END ADD ---
 
+# --- PUT Reconciliation Type (partial update of an existing configuration) ---
+@bp.route('/reconciliation_types/<int:type_id>', methods=['PUT'])
+def update_reconciliation_type(type_id):
+    """Updates the given fields of a reconciliation type; candidate strategy/params are validated together."""
+    recon_type = ReconciliationType.query.get(type_id)
+    if not recon_type:
+        return jsonify({"error": f"Reconciliation Type ID {type_id} not found."}), 404
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid JSON payload required"}), 400
+
+    editable_fields = ['name', 'description', 'knowledge_base_content', 'ai_prompt_template', 'candidate_selection_strategy',
+                       'candidate_strategy_params', 'ai_max_concurrency', 'is_active']
+    unknown_fields = [field for field in data if field not in editable_fields]
+    if unknown_fields:
+        return jsonify({"error": f"Fields cannot be updated: {', '.join(unknown_fields)}"}), 400
+    empty_fields = [field for field in ['name', 'knowledge_base_content', 'ai_prompt_template'] if field in data and not data[field]]
+    if empty_fields:
+        return jsonify({"error": f"Fields cannot be empty: {', '.join(empty_fields)}"}), 400
+
+    ai_max_concurrency = data.get('ai_max_concurrency', recon_type.ai_max_concurrency)
+    if ai_max_concurrency is not None and (not isinstance(ai_max_concurrency, int) or ai_max_concurrency < 1):
+        return jsonify({"error": "ai_max_concurrency must be a positive integer"}), 400
+
+    candidate_strategy = data.get('candidate_selection_strategy', recon_type.candidate_selection_strategy)
+    candidate_params = data.get('candidate_strategy_params', recon_type.candidate_strategy_params)
+    if candidate_params is not None and not isinstance(candidate_params, dict):
+        return jsonify({"error": "candidate_strategy_params must be an object"}), 400
+    try:
+        resolve_candidate_params(candidate_strategy, candidate_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if 'name' in data and ReconciliationType.query.filter(ReconciliationType.name == data['name'], ReconciliationType.id != type_id).first():
+        return jsonify({"error": f"Reconciliation Type name '{data['name']}' already exists."}), 409
+
+    try:
+        # Cached verdicts were produced with the old KB/prompt; their keys can no longer match
+        if any(field in data and data[field] != getattr(recon_type, field) for field in ['knowledge_base_content', 'ai_prompt_template']):
+            invalidate_type_entries(type_id)
+        for field in editable_fields:
+            if field in data:
+                setattr(recon_type, field, data[field])
+        db.session.commit()
+        logging.info(f"Updated Reconciliation Type ID={type_id}: {', '.join(data)}")
+        return jsonify({
+            "id": recon_type.id,
+            "name": recon_type.name,
+            "description": recon_type.description,
+            "candidate_selection_strategy": recon_type.candidate_selection_strategy,
+            "candidate_strategy_params": recon_type.candidate_strategy_params,
+            "ai_max_concurrency": recon_type.ai_max_concurrency,
+            "is_active": recon_type.is_active
+        })
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating reconciliation type {type_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to update reconciliation type"}), 500
+
+# --- GET Candidate Strategies (registry names + default parameters) ---
+@bp.route('/reconciliation_types/candidate_strategies', methods=['GET'])
+def get_candidate_strategies():
+    return jsonify([{"name": name, "default_params": defaults} for name, (_, defaults) in sorted(CANDIDATE_STRATEGIES.items())])
+
 # --- Endpoint to get available mappings, optionally filtered ---
 
 @bp.route('/mappings', methods=['GET'])
@@ -143,6 +229,12 @@ def create_mapping():
          else:
               return jsonify({"error": "Invalid column_mappings format. Must be a non-empty JSON object (dictionary)."}), 400
 
+    # Validate optional reference-extraction regexes (applied to descriptions at ingestion)
+    reference_patterns = data.get('reference_patterns')
+    try:
+        compile_reference_patterns(reference_patterns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Check for duplicate name
     if DataSourceMapping.query.filter(DataSourceMapping.mapping_name == data['mapping_name']).first():
@@ -159,6 +251,7 @@ def create_mapping():
             source_type=source_type_enum,
             column_mappings=column_mappings_data, # Store the validated dictionary
             date_format_string=data.get('date_format_string'), # Optional
+            reference_patterns=reference_patterns or None, # Optional
             reconciliation_type_id=recon_type_id # Optional
         )
         db.session.add(new_mapping)
@@ -169,7 +262,8 @@ def create_mapping():
             "id": new_mapping.id,
             "name": new_mapping.mapping_name,
             "type": new_mapping.source_type.value,
-            "reconciliationTypeId": new_mapping.reconciliation_type_id
+            "reconciliationTypeId": new_mapping.reconciliation_type_id,
+            "referencePatterns": new_mapping.reference_patterns
         }), 201
 
     except Exception as e:
@@ -177,6 +271,30 @@ def create_mapping():
         logging.error(f"Error creating mapping: {e}", exc_info=True)
         return jsonify({"error": "Failed to create mapping"}), 500
 
+@bp.route('/mappings/<int:mapping_id>/reference_patterns', methods=['PUT'])
+def update_mapping_reference_patterns(mapping_id):
+    """Replaces a mapping's reference-extraction regexes (its cached parses are invalidated on update)."""
+    mapping = DataSourceMapping.query.get(mapping_id)
+    if not mapping:
+        return jsonify({"error": f"Mapping ID {mapping_id} not found."}), 404
+    data = request.get_json()
+    if not isinstance(data, dict) or 'reference_patterns' not in data:
+        return jsonify({"error": "JSON payload with reference_patterns required"}), 400
+    try:
+        compile_reference_patterns(data['reference_patterns'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        mapping.reference_patterns = data['reference_patterns'] or None
+        db.session.commit()
+        logging.info(f"Updated reference patterns of DataSourceMapping ID={mapping_id}: {mapping.reference_patterns}")
+        return jsonify({"id": mapping.id, "name": mapping.mapping_name, "referencePatterns": mapping.reference_patterns})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating mapping {mapping_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to update mapping"}), 500
+
 
 # --- Upload Endpoint (Requires Type and Mapping IDs) ---
 @bp.route('/reconciliations/upload', methods=['POST'])
@@ -214,28 +332,46 @@ def upload_files():
         return jsonify({"error": "Invalid target mapping"}), 400
 
     try:
-        ts = datetime.now().strftime('%Y%m%d%H%M%S')
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        source_filename = secure_filename(f"{ts}_r{reconciliation_type_id}_s{source_mapping_id}_{source_file.filename}")
-        target_filename = secure_filename(f"{ts}_r{reconciliation_type_id}_t{target_mapping_id}_{target_file.filename}")
-        source_path = os.path.join(upload_folder, source_filename)
-        target_path = os.path.join(upload_folder, target_filename)
-        
-        source_file.save(source_path)
-        target_file.save(target_path)
+        # Stored once per content (hashed while streaming to disk) and reference-counted per job
+        source_upload = store_upload(source_file)
+        target_upload = store_upload(target_file)
+
+        # Pre-flight: header + a few sample rows against each mapping, before the job takes a worker
+        for side, upload, file, mapping in (('Source', source_upload, source_file, source_map),
+                                            ('Target', target_upload, target_file, target_map)):
+            try:
+                preflight_check(upload.storage_path, mapping_config_for(mapping))
+            except PREFLIGHT_ERRORS as e_check:
+                # Both references go, so new content is left at ref_count 0 for upload GC instead of as a row-less blob
+                release_upload(source_upload.storage_path)
+                release_upload(target_upload.storage_path)
+                db.session.commit()
+                logging.info(f"Upload rejected by pre-flight check ({side} '{file.filename}', mapping {mapping.id}): {e_check}")
+                return jsonify({"error": f"{side} file '{file.filename}' does not match mapping "
+                                         f"'{mapping.mapping_name}': {e_check}"}), 400
         
         new_job = ReconciliationJob(
             reconciliation_type_id=reconciliation_type_id,
-            source_file=source_path,
-            target_file=target_path,
+            source_file=source_upload.storage_path,
+            target_file=target_upload.storage_path,
             source_mapping_id=source_mapping_id,
-            target_mapping_id=target_mapping_id
+            target_mapping_id=target_mapping_id,
+            ingestion_stats={'status': 'PENDING'}
         )
         
         db.session.add(new_job)
         db.session.commit()
         logging.info(f"Created Job ID: {new_job.id} Type: {reconciliation_type_id}")
-        return jsonify({"message": "Files uploaded successfully", "jobId": new_job.id}), 201
+
+        # Parse/normalize in the background now, so Run only pays for matching + AI
+        ingestion_task_id = None
+        try:
+            ingestion_task_id = ingest_job_files_task.delay(new_job.id).id
+        except Exception as e_ingest:
+            logging.warning(f"Could not enqueue ingestion for Job {new_job.id}; files will be parsed at run time: {e_ingest}")
+            new_job.ingestion_stats = None
+            db.session.commit()
+        return jsonify({"message": "Files uploaded successfully", "jobId": new_job.id, "ingestionTaskId": ingestion_task_id}), 201
     except Exception as e:
         db.session.rollback()
         logging.error(f"Upload Error: {e}", exc_info=True)
@@ -250,6 +386,11 @@ def run_reconciliation(job_id):
             return jsonify({"error": "Job not found"}), 404
         if job.status not in [JobStatus.PENDING, JobStatus.FAILED]:
             return jsonify({"error": f"Job already {job.status.value}"}), 400
+        ingestion_problem = ingestion_error(job.ingestion_stats)
+        if ingestion_problem:
+            # 409 while upload-time parsing is queued/running (retry later); 400 when it failed
+            status_code = 409 if job.ingestion_stats.get('status') in INGESTION_IN_PROGRESS else 400
+            return jsonify({"error": ingestion_problem, "ingestion": job.ingestion_stats}), status_code
         
         task = run_reconciliation_task.delay(job.id)
         job.status = JobStatus.PENDING
@@ -316,6 +457,34 @@ def get_reconciliation_results():
         logging.error(f"Error fetching reconciliation results: {e}", exc_info=True)
         return jsonify({"error": "Failed"}), 500
 
+# --- DELETE job endpoint ---
+@bp.route('/reconciliations/<int:job_id>', methods=['DELETE'])
+def delete_reconciliation_job(job_id):
+    """Deletes a job with its results/exceptions and releases its stored uploads."""
+    try:
+        job = ReconciliationJob.query.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job.status == JobStatus.PROCESSING:
+            return jsonify({"error": "Job is processing; try again when it has finished"}), 409
+
+        release_upload(job.source_file)
+        release_upload(job.target_file)
+        db.session.delete(job)
+        db.session.commit()
+        logging.info(f"Deleted Job ID: {job_id}")
+
+        # Released blobs are removed by the upload GC once their grace period ends (celery beat runs it too)
+        try:
+            collect_upload_garbage_task.delay()
+        except Exception as e_gc:
+            logging.warning(f"Could not enqueue upload GC after deleting Job {job_id}: {e_gc}")
+        return jsonify({"message": "Job deleted", "jobId": job_id}), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error deleting job {job_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to delete job"}), 500
+
 # --- /status endpoint ---
 @bp.route('/reconciliations/<int:job_id>/status', methods=['GET'])
 def get_job_status(job_id):
@@ -328,7 +497,8 @@ def get_job_status(job_id):
             "status": job.status.value,
             "createdAt": job.created_at.isoformat() if job.created_at else None,
             "completedAt": job.completed_at.isoformat() if job.completed_at else None,
-            "summary": job.results_summary
+            "summary": job.results_summary,
+            "ingestion": job.ingestion_stats
         }), 200
     except Exception as e:
         logging.error(f"Error fetching status job {job_id}: {e}", exc_info=True)
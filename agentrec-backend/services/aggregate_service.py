@@ -0,0 +1,124 @@
+# agentrec-backend/services/aggregate_service.py
+# --- Imports ---
+from decimal import Decimal
+from functools import lru_cache
+from itertools import combinations
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+AGGREGATE_EXCEPTION_TYPE = "Aggregate Match"
+# Most live members searched per anchor; bounds every search to a fixed number of subsets
+AGGREGATE_MAX_CANDIDATES = 64
+
+
+@lru_cache(maxsize=None)
+def _subset_table(n, max_size):
+    """ Every subset of range(n) with 1..max_size members: (members padded with n, sizes, first member, last member). """
+    subsets = [subset for size in range(1, max_size + 1) for subset in combinations(range(n), size)]
+    members = np.full((len(subsets), max_size), n, dtype=np.int64)
+    for row, subset in enumerate(subsets):
+        members[row, :len(subset)] = subset
+    sizes = np.array([len(subset) for subset in subsets], dtype=np.int64)
+    last = np.array([subset[-1] for subset in subsets], dtype=np.int64)
+    return members, sizes, members[:, 0], last
+
+
+def best_subset(amounts, need, tolerance, max_group_size):
+    """ Positions of the one subset of 2..max_group_size amounts summing to need within tolerance;
+    None when no subset fits, or when several do (the sum is ambiguous).
+
+    Meet in the middle: all subsets of up to half the group size are summed once and
+    sorted; each subset (the group's first members) then looks up the complementary
+    sums (its remaining, later members) with a binary search.
+    Amounts, need and tolerance are non-negative int cents.
+    """
+    n = len(amounts)
+    members, sizes, first, last = _subset_table(n, (max_group_size + 1) // 2)
+    sums = np.append(amounts, 0)[members].sum(axis=1)
+    order = np.argsort(sums, kind='stable')
+    sorted_sums = sums[order]
+
+    left = np.flatnonzero(sizes <= max_group_size // 2)
+    lo = np.searchsorted(sorted_sums, need - tolerance - sums[left], side='left')
+    hi = np.searchsorted(sorted_sums, need + tolerance - sums[left], side='right')
+    counts = np.maximum(hi - lo, 0)
+    if not counts.any():
+        return None
+    left_rows = np.repeat(left, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_rows = order[np.repeat(lo, counts) + offsets]
+    # Each subset splits once: the left half holds its first floor(size/2) members, the right half the rest
+    extra = sizes[right_rows] - sizes[left_rows]
+    valid = (first[right_rows] > last[left_rows]) & (extra >= 0) & (extra <= 1)
+    if valid.sum() != 1:
+        return None
+    best = np.flatnonzero(valid)[0]
+    positions = np.concatenate([members[left_rows[best]], members[right_rows[best]]])
+    return positions[positions < n]
+
+
+def find_aggregate_groups(anchor_set, anchor_rows, member_set, member_live, date_window_days, tolerance_cents,
+                          max_group_size, max_candidates=AGGREGATE_MAX_CANDIDATES):
+    """ Groups of live members whose amounts sum to an anchor's amount, as [(anchor_row, member_rows, difference_cents)].
+
+    Members must have the anchor's sign and lie within date_window_days of it. An
+    anchor with more than max_candidates such members is skipped: a fit is only
+    accepted when the search has seen every member it could be confused with.
+    Anchors are taken in order and consume their members (member_live is updated).
+    """
+    by_day = np.argsort(member_set.days, kind='stable')
+    member_days = member_set.days[by_day]
+    groups = []
+    for anchor in anchor_rows:
+        need, day = int(anchor_set.cents[anchor]), int(anchor_set.days[anchor])
+        if need == 0:
+            continue
+        window = by_day[np.searchsorted(member_days, day - date_window_days, side='left'):
+                        np.searchsorted(member_days, day + date_window_days, side='right')]
+        window = window[member_live[window]]
+        amounts = member_set.cents[window] * np.sign(need)
+        # Same sign and no larger than the anchor itself (within tolerance), or the member cannot be part of its sum
+        fits = (amounts > 0) & (amounts <= abs(need) + tolerance_cents)
+        window, amounts = window[fits], amounts[fits]
+        if len(window) < 2 or np.sort(amounts)[-max_group_size:].sum() < abs(need) - tolerance_cents:
+            continue
+        if len(window) > max_candidates:
+            continue # Too crowded to tell a unique fit; a later pass may see fewer live members
+        positions = best_subset(amounts, abs(need), tolerance_cents, max_group_size)
+        if positions is None:
+            continue
+        rows = np.sort(window[positions])
+        member_live[rows] = False
+        groups.append((int(anchor), rows.tolist(), int(abs(amounts[positions].sum() - abs(need)))))
+    return groups
+
+
+def find_aggregate_matches(source_set, source_rows, target_set, target_rows, date_window_days, amount_tolerance, max_group_size):
+    """ Many-to-one matches among leftover (unmatched) sources and targets, as [(source_rows, target_rows, difference_cents)].
+
+    First one source against several targets (e.g. a batch deposit paying several
+    invoices), then one of the remaining targets against several remaining sources
+    (e.g. a split payment), repeated while a pass still finds groups. Every
+    transaction joins at most one group.
+    """
+    tolerance_cents = int((Decimal(str(amount_tolerance)) * 100).to_integral_value())
+    source_live = np.zeros(len(source_set), dtype=bool); source_live[list(source_rows)] = True
+    target_live = np.zeros(len(target_set), dtype=bool); target_live[list(target_rows)] = True
+    groups = []
+    for group_size in range(2, max_group_size + 1): # Small groups first: they are the least likely to fit by chance
+        found = True
+        while found: # Each pass consumes members, which can leave once-ambiguous sums with a single fit
+            found = False
+            for source_row, members, difference in find_aggregate_groups(source_set, np.flatnonzero(source_live), target_set,
+                                                                         target_live, date_window_days, tolerance_cents, group_size):
+                source_live[source_row] = False; found = True
+                groups.append(([source_row], members, difference))
+            for target_row, members, difference in find_aggregate_groups(target_set, np.flatnonzero(target_live), source_set,
+                                                                         source_live, date_window_days, tolerance_cents, group_size):
+                target_live[target_row] = False; found = True
+                groups.append((members, [target_row], difference))
+    logging.info(f"Aggregate matching: {len(groups)} groups from {len(source_rows)} leftover sources "
+                 f"and {len(target_rows)} leftover targets.")
+    return groups
@@ -1,5 +1,8 @@
 # agentrec-backend/services/ai_service.py
 import logging
+import threading
+import re
+import functools
 # Azure/Langchain Imports
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from langchain_community.embeddings import OllamaEmbeddings
@@ -9,16 +12,10 @@ from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field, validator
 # Config
 from ..config import Config # Relative import
+from .columns import INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC, INTERNAL_REF, INTERNAL_AMOUNT_CENTS
 
 logging.basicConfig(level=logging.INFO)
 
-# Define Standard Internal Semantic Names (Must match parser output)
-INTERNAL_ID = 'internal_id'
-INTERNAL_DATE = 'internal_date'
-INTERNAL_AMOUNT = 'internal_amount'
-INTERNAL_DESC = 'internal_description'
-# Add others if defined and used in mappings (e.g., INTERNAL_REF1)
-
 # Define Pydantic Model for Expected Output
 class ReconciliationOutput(BaseModel):
     status: str = Field(description="Reconciliation status: Must be one of 'Matched', 'Partial Match', or 'Exception'.")
@@ -29,6 +26,31 @@ class ReconciliationOutput(BaseModel):
         if field not in ["Matched", "Partial Match", "Exception"]: raise ValueError("status must be 'Matched', 'Partial Match', or 'Exception'")
         return field
 
+# Batched mode: one verdict per numbered candidate, parsed back into ReconciliationOutput fields
+class BatchReconciliationVerdict(ReconciliationOutput):
+    candidate_index: int = Field(description="Number of the candidate target transaction this verdict is for, exactly as given in the candidate list.")
+
+class BatchReconciliationOutput(BaseModel):
+    verdicts: list[BatchReconciliationVerdict] = Field(description="Exactly one verdict per candidate target transaction.")
+
+# Batched mode reuses the type's prompt: its target fields point at the numbered candidates, and this
+# section (with the batch format instructions) replaces its {format_instructions}
+BATCH_TARGET_PLACEHOLDER = re.compile(r'(?<!\{)((?:\{\{)*)\{(internal_\w+)_target\}') # Not {{escaped}} braces
+BATCH_PROMPT_SECTION = """**Candidate Target Transactions** (the target transaction above stands for each of these in turn):
+{candidates}
+
+**Batch Instructions:**
+Follow all of the instructions above for every numbered candidate independently, as if it were the only target transaction. Return exactly one verdict per candidate and set candidate_index to the candidate's number.
+
+{format_instructions}"""
+
+
+def batch_prompt_template(prompt_template_str):
+    """ Batched-mode prompt derived from a type's single-pair prompt (same KB rules, source fields and instructions). """
+    template = BATCH_TARGET_PLACEHOLDER.sub(lambda m: f"{m.group(1)}see {m.group(2).replace('internal_', '')} of each candidate below",
+                                            prompt_template_str)
+    return template.replace('{format_instructions}', BATCH_PROMPT_SECTION)
+
 # --- Initialize LLM and Embeddings (attempt once globally) ---
 llm = None
 embeddings = None
@@ -63,74 +85,66 @@ else:
     logging.warning("Skipping Ollama Embeddings initialization due to missing config.")
 # --- End Embeddings Initialization ---
 
-# --- Main Function to Call ---
-def get_reconciliation_status(source_tx_internal, target_tx_internal, kb_retriever, prompt_template_str):
-    """ Uses the AI RAG chain with specific KB/Prompt to determine status. """
-    if not llm or not embeddings:
-        logging.error("AI Service LLM or Embeddings not available.")
-        return { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "LLM/Embeddings service not initialized." }
-    if not kb_retriever:
-        logging.error("AI Service Knowledge Base Retriever not available for this call.")
-        return { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "Knowledge Base retriever failed to initialize." }
-    if not prompt_template_str:
-        logging.error("AI Service Prompt Template string is missing.")
-        return { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "Prompt template missing." }
+# --- Job-Scoped Evaluator ---
+def format_docs(docs): return "\n\n".join(doc.page_content for doc in docs)
 
-    try:
-        template_core = """
-        You are an expert financial reconciliation agent... [Intro text as before] ...
-
-        **Knowledge Base Rules (Use ONLY these):**
-        ---------------------
-        {context}
-        ---------------------
-
-        **Source Transaction:**
-        ID: {{{internal_id_source}}}
-        Date: {{{internal_date_source}}}
-        Amount: {{{internal_amount_source}}}
-        Description: {{{internal_description_source}}}
-
-        **Target Transaction:**
-        ID: {{{internal_id_target}}}
-        Date: {{{internal_date_target}}}
-        Amount: {{{internal_amount_target}}}
-        Description: {{{internal_description_target}}}
-
-        **Instructions:**
-        1. Carefully analyze the Source and Target transaction details.
-        2. Apply *only* the rules provided in the 'Knowledge Base Rules' section. Do not use any other external knowledge or assumptions.
-        3. Determine the reconciliation status: 'Matched', 'Partial Match', or 'Exception'.
-        4. **For ALL statuses ('Matched', 'Partial Match', 'Exception'), provide a brief 'Reason' explaining *which specific Knowledge Base rule(s)* led to your conclusion.** (e.g., "Exact match on amount and date per Rule KB-BG-003", "Amount difference within tolerance per Rule KB-BG-004", "Date difference exceeds tolerance per Rule KB-BG-102").
-        5. If 'Exception' or 'Partial Match', *also* specify the 'Exception Type' based *strictly* on the KB Rules (e.g., 'Amount Mismatch', 'Date Tolerance'). If status is 'Matched', 'Exception Type' should be null.
-        6. **CRITICAL: Your entire response must be ONLY the valid JSON object specified below.**
-
-        {format_instructions}
-
-        **Analysis Result (JSON Object Only):**
-        """
-        # --- Dynamically create parser and prompt ---
-        output_parser = JsonOutputParser(pydantic_object=ReconciliationOutput)
+class ReconciliationEvaluator:
+    """ RAG evaluator built once per job from the KB retriever and prompt template.
+
+    The output parser, prompt (with format instructions) and chain are created and
+    validated in __init__; evaluate() only prepares the input and invokes the chain.
+    """
+    def __init__(self, kb_retriever, prompt_template_str):
+        self.kb_retriever = kb_retriever
+        self.prompt_template_str = prompt_template_str
+        self.rag_chain = None
+        self.batch_chain = None
+        self.unavailable_result = None
+        self.llm_calls = 0
+        self.batch_fallbacks = 0
+        self._stats_lock = threading.Lock()
+        # LRU memo of formatted KB context per normalized description query
+        self._retrieve_context = functools.lru_cache(maxsize=Config.KB_CONTEXT_CACHE_SIZE)(self._fetch_context)
+
+        if not llm or not embeddings:
+            logging.error("AI Service LLM or Embeddings not available.")
+            self.unavailable_result = { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "LLM/Embeddings service not initialized." }
+            return
+        if not kb_retriever:
+            logging.error("AI Service Knowledge Base Retriever not available for this job.")
+            self.unavailable_result = { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "Knowledge Base retriever failed to initialize." }
+            return
+        if not prompt_template_str:
+            logging.error("AI Service Prompt Template string is missing.")
+            self.unavailable_result = { "status": "Error", "exception_type": "AI Service Unavailable", "reason": "Prompt template missing." }
+            return
+
+        # --- Validate and build parser/prompt once ---
+        self.output_parser = JsonOutputParser(pydantic_object=ReconciliationOutput)
         try:
-            prompt = ChatPromptTemplate.from_template(
+            self.prompt = ChatPromptTemplate.from_template(
                 prompt_template_str,
-                partial_variables={"format_instructions": output_parser.get_format_instructions()}
+                partial_variables={"format_instructions": self.output_parser.get_format_instructions()}
             )
         except Exception as e_prompt:
             logging.error(f"Error creating prompt template: {e_prompt}", exc_info=True)
             raise ValueError(f"Invalid prompt template structure: {e_prompt}")
-
-        # --- Dynamically create the RAG chain ---
-        def format_docs(docs): return "\n\n".join(doc.page_content for doc in docs)
+        if "context" not in self.prompt.input_variables:
+            raise ValueError("Invalid prompt template structure: missing {context} placeholder.")
 
         # Ensure retriever is valid before using it
         if not hasattr(kb_retriever, 'invoke') and not hasattr(kb_retriever, 'get_relevant_documents'):
              raise TypeError("Provided kb_retriever is not a valid LangChain retriever instance.")
 
+        self.rag_chain = self._build_chain()
+        self.batch_chain = self._build_batch_chain()
+        logging.info("Reconciliation evaluator chain built.")
+
+    def _build_chain(self):
         retrieve_context = RunnablePassthrough.assign(
             # Use .get with default '' to handle potentially missing description fields gracefully
             context_input_str=lambda x: (x.get(INTERNAL_DESC + '_source', '') or '') + " " + (x.get(INTERNAL_DESC + '_target', '') or '')
-        ) | (lambda x: x['context_input_str']) | kb_retriever | format_docs
+        ) | (lambda x: self.retrieve_context(x['context_input_str']))
 
         # Define how internal inputs are passed through using .get for safety
         passthrough_inputs = RunnablePassthrough.assign(
@@ -145,7 +159,7 @@ def get_reconciliation_status(source_tx_internal, target_tx_internal, kb_retriev
         )
 
         # Combine context retrieval and passthrough
-        rag_chain = RunnableParallel(
+        return RunnableParallel(
             {"context": retrieve_context, "inputs": passthrough_inputs}
         ) | RunnablePassthrough.assign(
              internal_id_source=lambda x: x['inputs']['internal_id_source'],
@@ -156,38 +170,133 @@ def get_reconciliation_status(source_tx_internal, target_tx_internal, kb_retriev
              internal_date_target=lambda x: x['inputs']['internal_date_target'],
              internal_amount_target=lambda x: x['inputs']['internal_amount_target'],
              internal_description_target=lambda x: x['inputs']['internal_description_target']
-         ) | prompt | llm | output_parser # Chain ends with parser
+         ) | self.prompt | llm | self.output_parser # Chain ends with parser
 
+    def _build_batch_chain(self):
+        self.batch_output_parser = JsonOutputParser(pydantic_object=BatchReconciliationOutput)
+        batch_prompt = ChatPromptTemplate.from_template(
+            batch_prompt_template(self.prompt_template_str),
+            partial_variables={"format_instructions": self.batch_output_parser.get_format_instructions()}
+        )
+        retrieve_context = lambda x: self.retrieve_context(x['context_query'])
+        return RunnablePassthrough.assign(context=retrieve_context) | batch_prompt | llm | self.batch_output_parser
 
-        # --- Prepare input_data ---
-        input_data = {}
-        required_internal_keys = [INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC] # Extend if needed
-        for key in required_internal_keys:
-            input_data[key + "_source"] = str(source_tx_internal.get(key, 'N/A')) # Use .get and str()
-            input_data[key + "_target"] = str(target_tx_internal.get(key, 'N/A'))
+    def _fetch_context(self, normalized_query):
+        return format_docs(self.kb_retriever.invoke(normalized_query))
 
-        logging.debug(f"Invoking dynamic RAG chain with input: {input_data}")
+    def retrieve_context(self, query):
+        """ KB context for a description query; repeated descriptions skip embedding and similarity search. """
+        return self._retrieve_context(' '.join(str(query).lower().split()))
 
-        # --- Invoke Chain ---
-        result_json = rag_chain.invoke(input_data) # Output parser returns dict
-        logging.debug(f"Parsed AI Response: {result_json}")
+    def _count_call(self):
+        with self._stats_lock: self.llm_calls += 1
 
-        # --- Validate Parsed Output ---
-        if not isinstance(result_json, dict) or 'status' not in result_json:
-            raise ValueError("AI output parser did not return a dictionary with 'status'.")
+    def evaluate(self, source_tx_internal, target_tx_internal):
+        """ Determines the status of one source/target pair using the prebuilt chain. """
+        if self.unavailable_result:
+            return dict(self.unavailable_result)
+
+        try:
+            # --- Prepare input_data ---
+            input_data = {}
+            required_internal_keys = [INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC] # Extend if needed
+            for key in required_internal_keys:
+                input_data[key + "_source"] = str(source_tx_internal.get(key, 'N/A')) # Use .get and str()
+                input_data[key + "_target"] = str(target_tx_internal.get(key, 'N/A'))
 
-        valid_statuses = ["Matched", "Partial Match", "Exception"]
-        if result_json['status'] not in valid_statuses:
-            logging.warning(f"AI returned invalid status: {result_json['status']}. Treating as Exception.")
-            result_json['reason'] = f"AI invalid status '{result_json['status']}'. Original: {result_json.get('reason', 'N/A')}"
-            result_json['status'] = "Exception"; result_json['exception_type'] = "AI Invalid Status"
+            logging.debug(f"Invoking RAG chain with input: {input_data}")
 
-        result_json.setdefault('exception_type', None)
-        result_json.setdefault('reason', "N/A")
+            # --- Invoke Chain ---
+            self._count_call()
+            result_json = self.rag_chain.invoke(input_data) # Output parser returns dict
+            logging.debug(f"Parsed AI Response: {result_json}")
+            return validate_ai_result(result_json)
 
-        logging.info(f"AI Analysis Result: Status={result_json['status']}, Type={result_json['exception_type']}")
-        return result_json
+        except Exception as e:
+            logging.error(f"Error in ReconciliationEvaluator.evaluate: {e}", exc_info=True)
+            return { "status": "Error", "exception_type": "AI Processing Error", "reason": f"Core AI processing/parsing failed: {e}" }
 
+    def evaluate_batch(self, source_tx_internal, target_txs_internal):
+        """ Evaluates one source against several candidates in a single LLM call.
+
+        Returns one verdict dict per target, in order. Candidates the model skipped or
+        answered with an unparsable verdict (or all of them, if the batch call fails)
+        are re-evaluated with single-pair calls. The batch call uses batch_prompt_template()
+        of the type's prompt (the verdict cache keys batch-mode jobs on it).
+        """
+        if len(target_txs_internal) == 1:
+            return [self.evaluate(source_tx_internal, target_txs_internal[0])]
+        if self.unavailable_result:
+            return [dict(self.unavailable_result) for _ in target_txs_internal]
+
+        verdicts = {}
+        try:
+            input_data = {}
+            for key in [INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC]:
+                input_data[key + "_source"] = str(source_tx_internal.get(key, 'N/A'))
+            input_data['candidates'] = "\n".join(
+                f"[{n}] ID: {t.get(INTERNAL_ID, 'N/A')} | Date: {t.get(INTERNAL_DATE, 'N/A')} | "
+                f"Amount: {t.get(INTERNAL_AMOUNT, 'N/A')} | Description: {t.get(INTERNAL_DESC, 'N/A')}"
+                for n, t in enumerate(target_txs_internal)
+            )
+            input_data['context_query'] = " ".join(
+                str(tx.get(INTERNAL_DESC, '') or '') for tx in [source_tx_internal, *target_txs_internal])
+
+            self._count_call()
+            result_json = self.batch_chain.invoke(input_data)
+            for item in (result_json or {}).get('verdicts') or []:
+                n = item.get('candidate_index') if isinstance(item, dict) else None
+                if not isinstance(n, int) or not 0 <= n < len(target_txs_internal) or n in verdicts:
+                    continue
+                try:
+                    verdicts[n] = validate_ai_result({k: item.get(k) for k in ('status', 'exception_type', 'reason') if k in item})
+                except ValueError:
+                    continue
+        except Exception as e:
+            logging.warning(f"Batch evaluation of {len(target_txs_internal)} candidates failed, falling back to single-pair calls: {e}")
+
+        missing = [n for n in range(len(target_txs_internal)) if n not in verdicts]
+        if missing:
+            with self._stats_lock: self.batch_fallbacks += 1
+            for n in missing:
+                verdicts[n] = self.evaluate(source_tx_internal, target_txs_internal[n])
+        return [verdicts[n] for n in range(len(target_txs_internal))]
+
+    def stats(self):
+        context_cache = self._retrieve_context.cache_info()
+        lookups = context_cache.hits + context_cache.misses
+        return {'ai_llm_calls': self.llm_calls, 'ai_batch_fallbacks': self.batch_fallbacks,
+                'kb_context_cache_hits': context_cache.hits, 'kb_context_cache_misses': context_cache.misses,
+                'kb_context_cache_hit_rate': round(context_cache.hits / lookups, 4) if lookups else 0.0}
+
+
+def validate_ai_result(result_json):
+    """ Normalizes a parsed AI verdict; invalid statuses become 'AI Invalid Status' exceptions. """
+    if not isinstance(result_json, dict) or 'status' not in result_json:
+        raise ValueError("AI output parser did not return a dictionary with 'status'.")
+
+    valid_statuses = ["Matched", "Partial Match", "Exception"]
+    if result_json['status'] not in valid_statuses:
+        logging.warning(f"AI returned invalid status: {result_json['status']}. Treating as Exception.")
+        result_json['reason'] = f"AI invalid status '{result_json['status']}'. Original: {result_json.get('reason', 'N/A')}"
+        result_json['status'] = "Exception"; result_json['exception_type'] = "AI Invalid Status"
+
+    result_json.setdefault('exception_type', None)
+    result_json.setdefault('reason', "N/A")
+
+    logging.info(f"AI Analysis Result: Status={result_json['status']}, Type={result_json['exception_type']}")
+    return result_json
+
+
+# --- Main Function to Call ---
+def get_reconciliation_status(source_tx_internal, target_tx_internal, kb_retriever, prompt_template_str):
+    """ Uses the AI RAG chain with specific KB/Prompt to determine status.
+
+    One-off convenience wrapper; jobs should build a ReconciliationEvaluator once and reuse it.
+    """
+    try:
+        evaluator = ReconciliationEvaluator(kb_retriever, prompt_template_str)
     except Exception as e:
         logging.error(f"Error in get_reconciliation_status: {e}", exc_info=True)
-        return { "status": "Error", "exception_type": "AI Processing Error", "reason": f"Core AI processing/parsing failed: {e}" }
\ No newline at end of file
+        return { "status": "Error", "exception_type": "AI Processing Error", "reason": f"Core AI processing/parsing failed: {e}" }
+    return evaluator.evaluate(source_tx_internal, target_tx_internal)
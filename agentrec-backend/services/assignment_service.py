@@ -0,0 +1,124 @@
+# agentrec-backend/services/assignment_service.py
+# --- Imports ---
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+# Edge weights of evaluated pairs: one Matched outweighs any two Partial Matches;
+# the heuristic candidate score (in [0, 1]) only breaks ties within a status
+VERDICT_WEIGHTS = {'Matched': 4.0, 'Partial Match': 1.0}
+# Components with more sources than this are assigned greedily by weight instead of exactly
+ASSIGNMENT_MAX_COMPONENT_ROWS = 500
+
+
+def connected_components(source_idx, target_idx):
+    """ Component label per edge of the bipartite (source, target) graph.
+
+    Min-label propagation over all edges at once, with pointer jumping, so the
+    number of passes grows with the log of the component diameter.
+    """
+    sources, source_nodes = np.unique(source_idx, return_inverse=True)
+    _, target_nodes = np.unique(target_idx, return_inverse=True)
+    u, v = source_nodes, target_nodes + len(sources)
+    label = np.arange(v.max() + 1 if len(v) else 0)
+    while True:
+        edge_label = np.minimum(label[u], label[v])
+        updated = label.copy()
+        np.minimum.at(updated, u, edge_label)
+        np.minimum.at(updated, v, edge_label)
+        updated = updated[updated]
+        if np.array_equal(updated, label):
+            return label[u]
+        label = updated
+
+
+def _min_cost_assignment(cost):
+    """ Row -> column of a min-cost assignment of every row (rows <= columns); Hungarian method with potentials. """
+    rows, cols = cost.shape
+    u, v = np.zeros(rows + 1), np.zeros(cols + 1)
+    owner = np.zeros(cols + 1, dtype=np.int64)  # owner[j]: 1-based row assigned to column j (0 = none)
+    way = np.zeros(cols + 1, dtype=np.int64)
+    for row in range(1, rows + 1):
+        owner[0], j0 = row, 0
+        min_slack = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used
+            free[0] = False
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, min_slack, np.inf)))
+            delta = min_slack[j1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_slack[free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assignment = np.full(rows, -1, dtype=np.int64)
+    assigned_cols = np.flatnonzero(owner[1:])
+    assignment[owner[1:][assigned_cols] - 1] = assigned_cols
+    return assignment
+
+
+def _max_weight_matching(rows, cols, weights):
+    """ Exact max-weight one-to-one matching of one component; pairs may stay unmatched. """
+    row_ids, row_pos = np.unique(rows, return_inverse=True)
+    col_ids, col_pos = np.unique(cols, return_inverse=True)
+    if len(row_ids) > len(col_ids): # Solve the transposed problem; the smaller side gets the assignment rows
+        return {row: col for col, row in _max_weight_matching(cols, rows, weights).items()}
+    # Each row also gets a private zero-cost "unmatched" column; a missing edge costs more than leaving a row unmatched
+    cost = np.full((len(row_ids), len(col_ids) + len(row_ids)), weights.sum() + 1.0)
+    cost[np.arange(len(row_ids)), len(col_ids) + np.arange(len(row_ids))] = 0.0
+    cost[row_pos, col_pos] = -weights
+    assignment = _min_cost_assignment(cost)
+    matched = assignment < len(col_ids)
+    return dict(zip(row_ids[matched].tolist(), col_ids[assignment[matched]].tolist()))
+
+
+def _greedy_matching(rows, cols, weights):
+    """ Heaviest-edge-first one-to-one matching (fallback for oversized components). """
+    matches, used_cols = {}, set()
+    for edge in np.lexsort((cols, rows, -weights)):
+        row, col = int(rows[edge]), int(cols[edge])
+        if row not in matches and col not in used_cols:
+            matches[row] = col; used_cols.add(col)
+    return matches
+
+
+def optimal_assignment(source_idx, target_idx, weights, max_component_rows=ASSIGNMENT_MAX_COMPONENT_ROWS):
+    """ One-to-one source -> target assignment maximizing total edge weight, as {source_idx: target_idx}.
+
+    The candidate graph is split into connected components, each solved on its own
+    (single-source and single-target components directly, others with the Hungarian
+    method), so large jobs stay a set of small independent problems.
+    """
+    source_idx, target_idx = np.asarray(source_idx, dtype=np.int64), np.asarray(target_idx, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if not len(weights):
+        return {}
+    labels = connected_components(source_idx, target_idx)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    assignment, exact, greedy = {}, 0, 0
+    for component in np.split(order, bounds):
+        rows, cols, component_weights = source_idx[component], target_idx[component], weights[component]
+        if len(component) == 1 or np.all(rows == rows[0]) or np.all(cols == cols[0]):
+            best = int(np.lexsort((cols, rows, -component_weights))[0])
+            assignment[int(rows[best])] = int(cols[best])
+        elif len(np.unique(rows)) > max_component_rows:
+            assignment.update(_greedy_matching(rows, cols, component_weights)); greedy += 1
+        else:
+            assignment.update(_max_weight_matching(rows, cols, component_weights)); exact += 1
+    logging.info(f"Optimal assignment: {len(assignment)} pairs from {len(bounds) + 1} components "
+                 f"({exact} solved exactly, {greedy} oversized ones greedily).")
+    return assignment
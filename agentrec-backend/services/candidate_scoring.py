@@ -0,0 +1,85 @@
+# agentrec-backend/services/candidate_scoring.py
+# --- Imports ---
+from .columns import INTERNAL_DESC
+import logging
+import numpy as np
+import re
+import zlib
+
+logging.basicConfig(level=logging.INFO)
+
+# Weights of the heuristic score; each component is in [0, 1]
+SCORE_WEIGHTS = {'amount': 0.5, 'date': 0.2, 'description': 0.3}
+# Amount difference (cents) / date difference (days) at which that component drops to 0.5
+AMOUNT_SCORE_HALF_CENTS = 100
+DATE_SCORE_HALF_DAYS = 1
+
+# Scores are ranked as integer levels, so every engine orders (near-)equal scores the same way
+SCORE_RANK_LEVELS = 1 << 30
+
+SIGNATURE_WORDS = 4 # 256-bit token bitset per description
+_TOKEN = re.compile(r'\w+')
+_POPCOUNT16 = np.array([bin(v).count('1') for v in range(1 << 16)], dtype=np.uint8)
+
+
+def _token_signature(text):
+    """ Bitset of the casefolded word tokens of one description (crc32 -> bit, stable across processes). """
+    signature = np.zeros(SIGNATURE_WORDS, dtype=np.uint64)
+    for token in set(_TOKEN.findall(str(text).casefold())):
+        bit = zlib.crc32(token.encode()) % (SIGNATURE_WORDS * 64)
+        signature[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    return signature
+
+
+def description_signatures(transaction_set):
+    """ (int codes per row, signature per distinct description); each distinct description is tokenized once. """
+    if not transaction_set.has_column(INTERNAL_DESC):
+        return np.full(len(transaction_set), -1, dtype=np.int32), np.zeros((1, SIGNATURE_WORDS), dtype=np.uint64)
+    codes, distinct = transaction_set.interned(INTERNAL_DESC)
+    signatures = np.zeros((len(distinct), SIGNATURE_WORDS), dtype=np.uint64) # Last entry (code -1, missing) stays empty
+    for code, text in enumerate(distinct[:-1]):
+        if text is not None and text == text: # Skip NaN
+            signatures[code] = _token_signature(text)
+    return codes, signatures
+
+
+def score_levels(scores):
+    """ Scores quantized to int64 levels in [0, SCORE_RANK_LEVELS] (scores are at most 1). """
+    return np.round(scores * SCORE_RANK_LEVELS).astype(np.int64)
+
+
+def _popcount(bitsets):
+    return _POPCOUNT16[bitsets.view(np.uint16)].sum(axis=1, dtype=np.int32)
+
+
+class CandidateScorer:
+    """ Heuristic closeness of (source, target) pairs, vectorized over any number of pairs.
+
+    score = weighted amount closeness + date closeness + description token
+    Jaccard similarity (on 256-bit token bitsets, so a pair costs a few word ops).
+    Used to send a source's most plausible candidates to the LLM first.
+    """
+    def __init__(self, source_set, target_set):
+        self.source_set = source_set
+        self.target_set = target_set
+        self._source_codes, self._source_signatures = description_signatures(source_set)
+        self._target_codes, self._target_signatures = description_signatures(target_set)
+
+    def score(self, source_idx, target_idx):
+        amount_diff = np.abs(self.target_set.cents[target_idx] - self.source_set.cents[source_idx])
+        date_diff = np.abs(self.target_set.days[target_idx].astype(np.int64) - self.source_set.days[source_idx])
+        source_tokens = self._source_signatures[self._source_codes[source_idx]]
+        target_tokens = self._target_signatures[self._target_codes[target_idx]]
+        shared, either = _popcount(source_tokens & target_tokens), _popcount(source_tokens | target_tokens)
+        similarity = np.divide(shared, either, out=np.zeros(len(shared)), where=either > 0)
+        return (SCORE_WEIGHTS['amount'] * AMOUNT_SCORE_HALF_CENTS / (AMOUNT_SCORE_HALF_CENTS + amount_diff)
+                + SCORE_WEIGHTS['date'] * DATE_SCORE_HALF_DAYS / (DATE_SCORE_HALF_DAYS + date_diff)
+                + SCORE_WEIGHTS['description'] * similarity)
+
+    def rank(self, source_idx, target_idx):
+        """ Candidate targets of one source, best score first (ties keep target-file order). """
+        target_idx = np.asarray(target_idx, dtype=np.int64)
+        if len(target_idx) < 2:
+            return target_idx
+        scores = self.score(np.full(len(target_idx), source_idx), target_idx)
+        return target_idx[np.lexsort((target_idx, -score_levels(scores)))]
@@ -0,0 +1,387 @@
+# agentrec-backend/services/candidate_service.py
+# --- Imports ---
+from .columns import INTERNAL_DATE, INTERNAL_AMOUNT_CENTS, INTERNAL_REF
+from .transaction_set import EPOCH
+from .candidate_scoring import CandidateScorer, SCORE_RANK_LEVELS, score_levels
+from .ingestion_service import normalize_reference_keys
+from decimal import Decimal
+from datetime import timedelta
+import logging
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+# --- default_date_amount parameters ---
+DEFAULT_DATE_WINDOW = timedelta(days=7)
+DEFAULT_AMOUNT_TOLERANCE = Decimal('100.00')
+
+# Upper bound on (source, target) pairs expanded at once by the band join
+BAND_JOIN_MAX_BLOCK_PAIRS = 5_000_000
+# A reference shared by more targets than this is too common to be a join key (windows are used instead)
+REFERENCE_JOIN_MAX_TARGETS = 20
+
+
+# --- Indexed candidate lookup ---
+class TargetCandidateIndex:
+    """ Date-sorted index over a job's target TransactionSet, built once per job.
+
+    Each lookup binary-searches the +/- date window and applies the amount band
+    (and sign agreement) to the targets inside it, so a job costs O((N+M) log M)
+    instead of O(N*M). Candidates come back in target-file order, exactly like the
+    original linear scan; with max_candidates only the closest ones are kept.
+    With a scorer (CandidateScorer), candidates come back best score first instead.
+    """
+    def __init__(self, target_set, date_window=DEFAULT_DATE_WINDOW, amount_tolerance=DEFAULT_AMOUNT_TOLERANCE,
+                 amount_tolerance_pct=None, require_same_sign=False, max_candidates=None, scorer=None):
+        self.target_set = target_set
+        self.date_window = date_window
+        self.amount_tolerance = amount_tolerance
+        self.amount_tolerance_pct = amount_tolerance_pct
+        self.require_same_sign = require_same_sign
+        self.max_candidates = max_candidates
+        self.scorer = scorer
+        self._target_indices = np.argsort(target_set.days, kind='stable')
+        self._sorted_days = target_set.days[self._target_indices]
+        logging.info(f"Built candidate index over {len(target_set)} target txns.")
+
+    def candidates(self, source_tx, target_used):
+        """ Returns indices of unused targets within the date window and amount band of source_tx. """
+        source_date = source_tx.get(INTERNAL_DATE)
+        source_cents = source_tx.get(INTERNAL_AMOUNT_CENTS)
+        if not source_date or source_cents is None:
+            return []
+
+        day = (source_date - EPOCH).days
+        window_days = self.date_window.days
+        lo = np.searchsorted(self._sorted_days, day - window_days, side='left')
+        hi = np.searchsorted(self._sorted_days, day + window_days, side='right')
+
+        in_window = self._target_indices[lo:hi]
+        tolerance = _source_tolerance_cents(np.array([source_cents]), self.amount_tolerance, self.amount_tolerance_pct)[0]
+        amount_diff = self.target_set.cents[in_window] - source_cents
+        keep = (np.abs(amount_diff) <= tolerance) & ~target_used.test(in_window)
+        if self.require_same_sign:
+            keep &= _same_sign(np.int64(source_cents), self.target_set.cents[in_window])
+        matches = in_window[keep]
+        if self.scorer:
+            return self.scorer.rank(source_tx.row, matches)[:self.max_candidates].tolist()
+        if self.max_candidates and len(matches) > self.max_candidates:
+            date_diff = self.target_set.days[matches].astype(np.int64) - day
+            closest = np.lexsort((matches, np.abs(date_diff), np.abs(amount_diff[keep])))[:self.max_candidates]
+            matches = matches[closest]
+        return sorted(matches.tolist())  # Keep target-file order for the AI evaluation loop
+
+
+# --- Vectorized band-join engine ---
+def _tolerance_cents(amount_tolerance):
+    return int((Decimal(str(amount_tolerance)) * 100).to_integral_value())
+
+
+def _source_tolerance_cents(source_cents, amount_tolerance, amount_tolerance_pct):
+    """ Per-source amount band in cents: the absolute tolerance, amount_tolerance_pct percent
+    of the source amount, or the tighter of the two when both are set. """
+    bands = []
+    if amount_tolerance is not None:
+        bands.append(np.full(len(source_cents), _tolerance_cents(amount_tolerance), dtype=np.int64))
+    if amount_tolerance_pct is not None:
+        bands.append(np.floor(np.abs(source_cents) * (float(amount_tolerance_pct) / 100)).astype(np.int64))
+    if not bands:
+        raise ValueError("An amount band needs amount_tolerance and/or amount_tolerance_pct")
+    return np.minimum.reduce(bands)
+
+
+def _same_sign(source_cents, target_cents):
+    """ Debits only pair with debits and credits with credits; zero amounts pair with either. """
+    return np.sign(source_cents) * np.sign(target_cents) >= 0
+
+
+def _expand_band(source_rows, source_keys, target_order, sorted_target_keys, width, max_block_pairs):
+    """ Yields (source_idx, target_idx) blocks for targets whose key lies within +/- width of the source key.
+
+    width is a scalar or one value per source row.
+    target_order holds target row positions sorted by key; window bounds come from
+    searchsorted and each source is expanded into its contiguous run of targets.
+    """
+    lo = np.searchsorted(sorted_target_keys, source_keys - width, side='left')
+    hi = np.searchsorted(sorted_target_keys, source_keys + width, side='right')
+    counts = hi - lo
+    cumulative = np.cumsum(counts)
+
+    start, total_sources = 0, len(source_rows)
+    while start < total_sources:
+        already_expanded = cumulative[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cumulative, already_expanded + max_block_pairs, side='right')))
+        block_counts = counts[start:end]
+        block_total = int(block_counts.sum())
+        if block_total:
+            # Offset of every pair within its source's run of targets
+            run_starts = np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            block_sources = np.repeat(np.arange(start, end), block_counts)
+            sorted_pos = lo[block_sources] + (np.arange(block_total) - run_starts)
+            yield source_rows[block_sources], target_order[sorted_pos]
+        start = end
+
+
+def generate_candidate_pairs(source_set, target_set, date_window=DEFAULT_DATE_WINDOW,
+                             amount_tolerance=DEFAULT_AMOUNT_TOLERANCE, amount_tolerance_pct=None,
+                             require_same_sign=False, max_block_pairs=BAND_JOIN_MAX_BLOCK_PAIRS):
+    """ Produces every (source, target) candidate pair for a job in one columnar pass.
+
+    Sort-merge band join: targets are sorted once by date and once by amount, and
+    each source is expanded along whichever band (date window or its amount band,
+    see _source_tolerance_cents) holds fewer targets, then masked on the other one
+    and on sign agreement when required. Expansion runs in blocks of at most
+    max_block_pairs so memory stays bounded.
+    Returns a DataFrame of int32 source_idx/target_idx (row positions), int32
+    date_diff (days, target - source) and int64 amount_diff (cents, target - source),
+    ordered by source_idx then target_idx.
+    """
+    if not len(source_set) or not len(target_set):
+        return _empty_pair_table()
+
+    source_days, source_cents = source_set.days.astype(np.int64), source_set.cents
+    target_days, target_cents = target_set.days.astype(np.int64), target_set.cents
+
+    window_days = date_window.days
+    tolerance_cents = _source_tolerance_cents(source_cents, amount_tolerance, amount_tolerance_pct)
+
+    by_date = np.argsort(target_days, kind='stable')
+    by_amount = np.argsort(target_cents, kind='stable')
+    sorted_days, sorted_cents = target_days[by_date], target_cents[by_amount]
+
+    source_rows = np.arange(len(source_set))
+    date_fanout = (np.searchsorted(sorted_days, source_days[source_rows] + window_days, side='right')
+                   - np.searchsorted(sorted_days, source_days[source_rows] - window_days, side='left'))
+    amount_fanout = (np.searchsorted(sorted_cents, source_cents[source_rows] + tolerance_cents, side='right')
+                     - np.searchsorted(sorted_cents, source_cents[source_rows] - tolerance_cents, side='left'))
+    expand_on_date = date_fanout <= amount_fanout
+    date_rows, amount_rows = source_rows[expand_on_date], source_rows[~expand_on_date]
+
+    expansions = [
+        _expand_band(date_rows, source_days[date_rows], by_date, sorted_days, window_days, max_block_pairs),
+        _expand_band(amount_rows, source_cents[amount_rows], by_amount, sorted_cents, tolerance_cents[amount_rows], max_block_pairs),
+    ]
+    blocks = []
+    for expansion in expansions:
+        for src_idx, tgt_idx in expansion:
+            date_diff = target_days[tgt_idx] - source_days[src_idx]
+            amount_diff = target_cents[tgt_idx] - source_cents[src_idx]
+            keep = (np.abs(date_diff) <= window_days) & (np.abs(amount_diff) <= tolerance_cents[src_idx])
+            if require_same_sign:
+                keep &= _same_sign(source_cents[src_idx], target_cents[tgt_idx])
+            if keep.any():
+                blocks.append(pd.DataFrame({
+                    'source_idx': src_idx[keep].astype(np.int32),
+                    'target_idx': tgt_idx[keep].astype(np.int32),
+                    'date_diff': date_diff[keep].astype(np.int32),
+                    'amount_diff': amount_diff[keep],
+                }))
+
+    if not blocks:
+        return _empty_pair_table()
+    pairs = pd.concat(blocks, ignore_index=True)
+    pairs.sort_values(['source_idx', 'target_idx'], inplace=True, kind='stable')
+    pairs.reset_index(drop=True, inplace=True)
+    logging.info(f"Band join produced {len(pairs)} candidate pairs for {len(source_set)} source x {len(target_set)} target txns.")
+    return pairs
+
+
+def _reference_key_codes(transaction_set):
+    """ Normalized reference key per row; each distinct INTERNAL_REF value is normalized once. """
+    codes, distinct = transaction_set.interned(INTERNAL_REF)
+    return normalize_reference_keys(distinct).to_numpy()[codes] # distinct[-1] (code -1) is None -> ''
+
+
+def generate_reference_pairs(source_set, target_set, max_targets=REFERENCE_JOIN_MAX_TARGETS):
+    """ Hash-joins source and target on their normalized INTERNAL_REF keys (mapped or extracted at ingestion).
+
+    Returns a pair table laid out like generate_candidate_pairs, without any date or
+    amount window; empty keys and keys held by more than max_targets targets never join.
+    """
+    if not source_set.has_column(INTERNAL_REF) or not target_set.has_column(INTERNAL_REF):
+        return _empty_pair_table()
+    targets = pd.DataFrame({'target_idx': np.arange(len(target_set), dtype=np.int32), 'reference': _reference_key_codes(target_set)})
+    targets = targets[targets['reference'] != '']
+    targets = targets[targets.groupby('reference')['target_idx'].transform('size') <= max_targets]
+    sources = pd.DataFrame({'source_idx': np.arange(len(source_set), dtype=np.int32), 'reference': _reference_key_codes(source_set)})
+    sources = sources[sources['reference'] != '']
+
+    joined = sources.merge(targets, on='reference')
+    if joined.empty:
+        return _empty_pair_table()
+    source_idx, target_idx = joined['source_idx'].to_numpy(), joined['target_idx'].to_numpy()
+    pairs = pd.DataFrame({
+        'source_idx': source_idx, 'target_idx': target_idx,
+        'date_diff': (target_set.days[target_idx].astype(np.int64) - source_set.days[source_idx]).astype(np.int32),
+        'amount_diff': target_set.cents[target_idx] - source_set.cents[source_idx],
+    })
+    pairs.sort_values(['source_idx', 'target_idx'], inplace=True, kind='stable')
+    pairs.reset_index(drop=True, inplace=True)
+    logging.info(f"Reference join produced {len(pairs)} candidate pairs for {pairs['source_idx'].nunique()} of {len(source_set)} source txns.")
+    return pairs
+
+
+def _empty_pair_table():
+    """ Pair table with the engine's column layout and no rows. """
+    return pd.DataFrame({
+        'source_idx': np.empty(0, dtype=np.int32), 'target_idx': np.empty(0, dtype=np.int32),
+        'date_diff': np.empty(0, dtype=np.int32), 'amount_diff': np.empty(0, dtype=np.int64),
+    })
+
+
+class CandidatePairTable:
+    """ Per-source view over a band-join pair table, consumed by the AI evaluation loop.
+
+    With max_candidates, each source keeps only its closest live targets (smallest
+    amount difference, then date difference), still returned in target-file order.
+    With a scorer (CandidateScorer), the whole table is scored once up front and each
+    source's live targets come back best score first.
+    """
+    def __init__(self, pairs, source_count, max_candidates=None, scorer=None):
+        self.max_candidates = max_candidates
+        self.ranked = scorer is not None
+        if self.ranked:
+            source_idx, target_idx = pairs['source_idx'].to_numpy(), pairs['target_idx'].to_numpy()
+            scores = np.concatenate([scorer.score(source_idx[start:start + BAND_JOIN_MAX_BLOCK_PAIRS], target_idx[start:start + BAND_JOIN_MAX_BLOCK_PAIRS])
+                                     for start in range(0, len(pairs), BAND_JOIN_MAX_BLOCK_PAIRS)] or [np.zeros(0)])
+            # One stable integer sort on (source, quantized score desc); pairs arrive sorted by (source, target), so ties keep target order
+            rank_key = (source_idx.astype(np.int64) << 32) | (SCORE_RANK_LEVELS - score_levels(scores))
+            pairs = pairs.iloc[np.argsort(rank_key, kind='stable')].reset_index(drop=True)
+        elif max_candidates:
+            closeness = np.lexsort((pairs['target_idx'], pairs['date_diff'].abs(), pairs['amount_diff'].abs(), pairs['source_idx']))
+            pairs = pairs.iloc[closeness].reset_index(drop=True)
+        self.pairs = pairs
+        self._target_idx = pairs['target_idx'].to_numpy()
+        # pairs are sorted by source_idx, so each source owns one contiguous slice
+        self._bounds = np.searchsorted(pairs['source_idx'].to_numpy(), np.arange(source_count + 1), side='left')
+
+    def candidates(self, source_idx, target_used):
+        """ Returns unused target indices paired with source_idx, in target-file (or score) order. """
+        targets = self._target_idx[self._bounds[source_idx]:self._bounds[source_idx + 1]]
+        live = targets[~target_used.test(targets)]
+        if self.ranked:
+            return live[:self.max_candidates].tolist()
+        if self.max_candidates:
+            return sorted(live[:self.max_candidates].tolist())
+        return live.tolist()
+
+
+# --- Candidate-selection strategy registry ---
+CANDIDATE_STRATEGIES = {} # name -> (builder, default params); see register_candidate_strategy
+
+# Parameter name -> (validator, expectation shown in API errors)
+CANDIDATE_PARAM_CHECKS = {
+    'date_window_days': (lambda v: isinstance(v, int) and not isinstance(v, bool) and v >= 0, "a non-negative integer"),
+    'amount_tolerance': (lambda v: v is None or (isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0), "null or a non-negative number"),
+    'amount_tolerance_pct': (lambda v: v is None or (isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0), "null or a non-negative number (percent)"),
+    'require_same_sign': (lambda v: isinstance(v, bool), "true or false"),
+    'max_candidates': (lambda v: v is None or (isinstance(v, int) and not isinstance(v, bool) and v >= 1), "null or a positive integer"),
+    'reference_first': (lambda v: isinstance(v, bool), "true or false"),
+}
+
+
+def register_candidate_strategy(name, **defaults):
+    """ Decorator registering a builder(source_set, target_set, params, engine, scorer) -> select(source_idx, target_used)
+    under a strategy name, with the default parameters a ReconciliationType may override. Given a
+    scorer (CandidateScorer), select must return candidates best score first. """
+    def register(builder):
+        CANDIDATE_STRATEGIES[name] = (builder, defaults)
+        return builder
+    return register
+
+
+def resolve_candidate_params(strategy, params=None):
+    """ Strategy defaults overlaid with a type's stored parameters; raises ValueError for unknown
+    strategies, unknown parameters or invalid values. """
+    if strategy not in CANDIDATE_STRATEGIES:
+        raise ValueError(f"Unknown candidate selection strategy '{strategy}'. Available: {sorted(CANDIDATE_STRATEGIES)}")
+    resolved = dict(CANDIDATE_STRATEGIES[strategy][1])
+    unknown = sorted(set(params or {}) - set(resolved))
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {unknown} for strategy '{strategy}'. Allowed: {sorted(resolved)}")
+    resolved.update(params or {})
+    for name, value in resolved.items():
+        is_valid, expected = CANDIDATE_PARAM_CHECKS[name]
+        if not is_valid(value):
+            raise ValueError(f"Parameter '{name}' must be {expected}, got {value!r}")
+    if resolved.get('amount_tolerance') is None and resolved.get('amount_tolerance_pct') is None:
+        raise ValueError("Set amount_tolerance and/or amount_tolerance_pct")
+    return resolved
+
+
+def build_candidate_selector(strategy, params, source_set, target_set, engine='band_join', top_k=0):
+    """ Builds a job's select(source_idx, target_used) -> candidate target indices for a registered strategy.
+
+    With top_k, candidates are ranked by CandidateScorer and only the best top_k are
+    returned, best first; otherwise they keep the strategy's (target-file) order.
+    """
+    resolved = resolve_candidate_params(strategy, params)
+    builder, _ = CANDIDATE_STRATEGIES[strategy]
+    logging.info(f"Candidate strategy '{strategy}' ({engine}, top_k={top_k or 'off'}) with {resolved}")
+    if not top_k:
+        return builder(source_set, target_set, resolved, engine, None)
+    select = builder(source_set, target_set, resolved, engine, CandidateScorer(source_set, target_set))
+    return lambda source_idx, target_used: select(source_idx, target_used)[:top_k]
+
+
+def _date_amount_band_selector(source_set, target_set, params, engine, scorer):
+    """ Targets within a date window and amount band of the source (band join, or per-source index lookups).
+
+    With reference_first, sources sharing a reference key with live targets get those
+    targets instead; the windows are only the fallback.
+    """
+    date_window = timedelta(days=params['date_window_days'])
+    band = {'amount_tolerance': params['amount_tolerance'], 'amount_tolerance_pct': params['amount_tolerance_pct'],
+            'require_same_sign': params['require_same_sign']}
+    if engine == 'index':
+        index = TargetCandidateIndex(target_set, date_window, max_candidates=params['max_candidates'], scorer=scorer, **band)
+        window_candidates = lambda source_idx, target_used: index.candidates(source_set[source_idx], target_used)
+    else:
+        pairs = generate_candidate_pairs(source_set, target_set, date_window, **band)
+        window_candidates = CandidatePairTable(pairs, len(source_set), max_candidates=params['max_candidates'], scorer=scorer).candidates
+
+    reference_pairs = generate_reference_pairs(source_set, target_set) if params['reference_first'] else _empty_pair_table()
+    if reference_pairs.empty:
+        return window_candidates
+    reference_table = CandidatePairTable(reference_pairs, len(source_set), max_candidates=params['max_candidates'], scorer=scorer)
+    return lambda source_idx, target_used: reference_table.candidates(source_idx, target_used) or window_candidates(source_idx, target_used)
+
+
+# Presets of the date/amount band selector: strategy name -> default params
+DATE_AMOUNT_BAND_PRESETS = {
+    'default_date_amount': dict(date_window_days=DEFAULT_DATE_WINDOW.days, amount_tolerance=float(DEFAULT_AMOUNT_TOLERANCE),
+                                amount_tolerance_pct=None, require_same_sign=False, max_candidates=None, reference_first=True),
+    'exact_amount': dict(date_window_days=DEFAULT_DATE_WINDOW.days, amount_tolerance=0,
+                         amount_tolerance_pct=None, require_same_sign=True, max_candidates=None, reference_first=True),
+    'high_volume': dict(date_window_days=3, amount_tolerance=10, amount_tolerance_pct=1,
+                        require_same_sign=True, max_candidates=5, reference_first=True),
+}
+CANDIDATE_STRATEGIES.update((name, (_date_amount_band_selector, defaults)) for name, defaults in DATE_AMOUNT_BAND_PRESETS.items())
+
+
+# --- Deterministic exact-match fast path ---
+def find_exact_matches(source_set, target_set, exclude_source=None, exclude_target=None):
+    """ Hash-joins source and target on (amount, date), plus INTERNAL_REF when both mappings provide it.
+
+    Only keys that occur exactly once on each side are returned, as {source_idx: target_idx};
+    ambiguous groups and leftovers are left for the candidate/AI stages. Rows flagged in the
+    optional exclude_* boolean masks (e.g. duplicates) take no part in the join.
+    """
+    if not len(source_set) or not len(target_set):
+        return {}
+    key_columns = ['day', 'amount_cents']
+    if source_set.has_column(INTERNAL_REF) and target_set.has_column(INTERNAL_REF):
+        key_columns.append('reference')
+
+    def key_frame(transaction_set, exclude):
+        keys = pd.DataFrame({'row': np.arange(len(transaction_set)), 'day': transaction_set.days, 'amount_cents': transaction_set.cents})
+        if 'reference' in key_columns:
+            keys['reference'] = _reference_key_codes(transaction_set) # Same key form as the reference join
+        if exclude is not None:
+            keys = keys[~exclude]
+        return keys[~keys.duplicated(key_columns, keep=False)]
+
+    joined = key_frame(source_set, exclude_source).merge(key_frame(target_set, exclude_target), on=key_columns, suffixes=('_source', '_target'))
+    logging.info(f"Exact-match fast path settled {len(joined)} of {len(source_set)} source txns on {key_columns}.")
+    return dict(zip(joined['row_source'].tolist(), joined['row_target'].tolist()))
@@ -0,0 +1,12 @@
+# agentrec-backend/services/columns.py
+# Standard internal semantic names shared by the parsers, matching stages and the AI service.
+# Kept free of third-party imports so every stage (and its tests) can use them without the LLM stack.
+
+# Define Standard Internal Semantic Names (Must match parser output)
+INTERNAL_ID = 'internal_id'
+INTERNAL_DATE = 'internal_date'
+INTERNAL_AMOUNT = 'internal_amount'
+INTERNAL_DESC = 'internal_description'
+INTERNAL_REF = 'internal_reference' # Optional shared reference/ID used as an extra exact-match key
+INTERNAL_AMOUNT_CENTS = 'internal_amount_cents' # Parsed amount in int64 minor units; not a mapping target
+# Add others if defined and used in mappings (e.g., INTERNAL_REF1)
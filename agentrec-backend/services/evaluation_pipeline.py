@@ -0,0 +1,171 @@
+# agentrec-backend/services/evaluation_pipeline.py
+# --- Imports ---
+from concurrent.futures import ThreadPoolExecutor, Future
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class PairEvaluationPipeline:
+    """ Feeds candidate pairs to the job's evaluator with bounded parallelism.
+
+    The reconciliation loop still consumes verdicts one source at a time, in
+    candidate order, so its decision rules (Matched wins, Partial Match fallback,
+    first Exception recorded) and target_used bookkeeping are unchanged. With
+    max_concurrency > 1, the sources in a window of 2 x max_concurrency starting at
+    the current one are evaluated speculatively on a thread pool while the loop
+    waits, at most max_concurrency x batch_size pairs in flight; a source gets no
+    further candidates once one of its verdicts is Matched. A speculative verdict
+    whose target gets used in the meantime is never consumed (it is still cached,
+    and counted in ai_discarded_evaluations).
+    With batch_size > 1, up to batch_size candidates of one source share a single
+    LLM call (evaluator.evaluate_batch).
+    Verdict cache reads/writes and DB access stay on the calling thread.
+    """
+    def __init__(self, evaluator, source_transactions, target_transactions, select_candidates,
+                 verdict_cache=None, max_concurrency=1, batch_size=1):
+        self.evaluator = evaluator
+        self.source_transactions = source_transactions
+        self.target_transactions = target_transactions
+        self.select_candidates = select_candidates # select_candidates(source_idx) -> live target indices
+        self.verdict_cache = verdict_cache
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+        self.batch_size = max(1, int(batch_size or 1))
+        self.window = self.max_concurrency * 2 # Sources evaluated ahead, the current one included
+        self.max_in_flight = self.max_concurrency * self.batch_size
+        self._executor = None
+        if self.max_concurrency > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='ai-eval')
+        self._futures = {}      # (source_idx, target_idx) -> Future of the verdict
+        self._submitted = {}    # source_idx -> target indices submitted so far, in candidate order
+        self._uncached = set()  # keys whose verdict comes from the LLM and still has to be cached
+        self._stats_lock = threading.Lock()
+        self.ai_pairs = 0
+        self.discarded = 0
+
+    # --- Submission ---
+    def _run_chunk(self, i, chunk, futures):
+        """ Evaluates one source against a chunk of its candidates and resolves their futures. """
+        live = [(j, future) for j, future in zip(chunk, futures) if future.set_running_or_notify_cancel()]
+        if not live:
+            return # Everything was cancelled before it started
+        with self._stats_lock: self.ai_pairs += len(live)
+        source_tx = self.source_transactions[i] # Read-only row views; no per-pair copies
+        targets = [self.target_transactions[j] for j, _ in live]
+        try:
+            if len(targets) == 1:
+                verdicts = [self.evaluator.evaluate(source_tx, targets[0])]
+            else:
+                verdicts = self.evaluator.evaluate_batch(source_tx, targets)
+        except Exception as e:
+            logging.error(f"Error evaluating candidates for source {i}: {e}", exc_info=True)
+            verdicts = [{ "status": "Error", "exception_type": "AI Processing Error", "reason": f"Core AI processing/parsing failed: {e}" }] * len(targets)
+        for (_, future), verdict in zip(live, verdicts):
+            future.set_result(verdict)
+
+    def _submit(self, i, target_indices):
+        """ Resolves cache hits immediately and sends the rest to the LLM in chunks of batch_size. """
+        pending = []
+        for j in target_indices:
+            key = (i, j)
+            if key in self._futures:
+                continue
+            self._submitted.setdefault(i, []).append(j)
+            cached = None
+            if self.verdict_cache:
+                cached = self.verdict_cache.get(self.source_transactions[i], self.target_transactions[j])
+            if cached is not None:
+                future = Future(); future.set_result(cached)
+                self._futures[key] = future
+            else:
+                pending.append(j)
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            futures = [Future() for _ in chunk]
+            for j, future in zip(chunk, futures):
+                self._futures[(i, j)] = future
+                self._uncached.add((i, j))
+            if self._executor:
+                self._executor.submit(self._run_chunk, i, chunk, futures)
+            else:
+                self._run_chunk(i, chunk, futures)
+
+    def _in_flight(self):
+        return sum(1 for future in self._futures.values() if not future.done())
+
+    def _has_match(self, k):
+        """ Whether a finished verdict of source k is Matched (its later candidates will not be consumed). """
+        for j in self._submitted.get(k, ()):
+            future = self._futures[(k, j)]
+            if future.done() and future.result().get('status') == 'Matched':
+                return True
+        return False
+
+    def prefetch(self, current_idx):
+        """ Keeps the pool busy with candidates of the sources in the window starting at current_idx. """
+        if not self._executor:
+            return
+        for k in range(current_idx, min(current_idx + self.window, len(self.source_transactions))):
+            if self._has_match(k):
+                continue
+            remaining = [j for j in self.select_candidates(k) if (k, j) not in self._futures]
+            while remaining:
+                if self._in_flight() >= self.max_in_flight:
+                    return # Resume on the next call
+                self._submit(k, remaining[:self.batch_size])
+                remaining = remaining[self.batch_size:]
+
+    # --- Consumption ---
+    def _store(self, key, verdict):
+        if key in self._uncached:
+            self._uncached.discard(key)
+            if self.verdict_cache:
+                i, j = key
+                self.verdict_cache.put(self.source_transactions[i], self.target_transactions[j], verdict)
+
+    def verdicts(self, i, candidate_indices):
+        """ Yields (target_idx, verdict) for source i in candidate order; stop iterating once decided. """
+        for pos, j in enumerate(candidate_indices):
+            key = (i, j)
+            if key not in self._futures:
+                not_submitted = [c for c in candidate_indices[pos:] if (i, c) not in self._futures]
+                self._submit(i, not_submitted[:self.batch_size])
+            self.prefetch(i)
+            verdict = self._futures[key].result() # Kept until discard(i) so prefetch never resubmits it
+            self._store(key, verdict)
+            yield j, verdict
+
+    def _drop(self, key, future):
+        """ Forgets an unconsumed pair: a finished LLM verdict is cached, queued work is cancelled. """
+        if key not in self._uncached:
+            return # Consumed or cache hit
+        if future.done():
+            self._store(key, future.result())
+        else:
+            self._uncached.discard(key)
+            if future.cancel():
+                return # Never reached the LLM
+        self.discarded += 1
+
+    def discard(self, i):
+        """ Drops speculative work for sources up to i once their decision is final. """
+        for key in [key for key in self._futures if key[0] <= i]:
+            self._drop(key, self._futures.pop(key))
+        for k in [k for k in self._submitted if k <= i]:
+            del self._submitted[k]
+
+    def close(self):
+        """ Caches any finished speculative verdicts and shuts the pool down (safe to call again). """
+        for key, future in list(self._futures.items()):
+            self._drop(key, future)
+        self._futures, self._submitted = {}, {}
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True); self._executor = None
+
+    def stats(self):
+        stats = {'ai_evaluated_pairs': self.ai_pairs, 'ai_discarded_evaluations': self.discarded}
+        if hasattr(self.evaluator, 'stats'):
+            stats.update(self.evaluator.stats())
+        return stats
@@ -0,0 +1,627 @@
+# agentrec-backend/services/ingestion_service.py
+# --- Imports ---
+from .columns import INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS, INTERNAL_REF
+from ..utils.parsers import parse_amount_cents
+from ..config import Config
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import zstandard
+import pandas as pd
+from openpyxl import load_workbook
+from collections import namedtuple
+from contextlib import contextmanager
+import shutil
+import gzip
+import zipfile
+import zlib
+import logging
+import hashlib
+import json
+import glob
+import uuid
+import re
+import os
+
+logging.basicConfig(level=logging.INFO)
+
+REQUIRED_INTERNAL_NAMES = {INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC}
+
+
+# --- Mapping helpers ---
+def mapping_read_plan(mapping_config):
+    """ Validates a mapping and returns (rename_dict, output_columns, pandas read options). """
+    mapping_id = mapping_config.get('id', 'N/A')
+    column_map = mapping_config.get('column_mappings', {})
+    if not column_map:
+        raise ValueError(f"No mappings in config ID: {mapping_id}")
+
+    rename_dict = {orig: internal for orig, internal in column_map.items()}
+    internal_names_expected = list(rename_dict.values())
+    if not REQUIRED_INTERNAL_NAMES.issubset(internal_names_expected):
+        raise ValueError(f"Mapping {mapping_id} must map to: {REQUIRED_INTERNAL_NAMES}")
+
+    read_options = {'keep_default_na': False, 'na_values': [''], 'usecols': list(column_map.keys())}
+    original_id_header = next((orig for orig, internal in column_map.items() if internal == INTERNAL_ID), None)
+    if original_id_header:
+        read_options['dtype'] = {original_id_header: str}
+
+    # Amounts stay as int64 cents in parsed frames; Decimal is only built for records/persistence
+    output_columns = [INTERNAL_AMOUNT_CENTS if name == INTERNAL_AMOUNT else name for name in internal_names_expected]
+    if compile_reference_patterns(mapping_config.get('reference_patterns')) and INTERNAL_REF not in output_columns:
+        output_columns.append(INTERNAL_REF)
+    return rename_dict, output_columns, read_options
+
+
+# --- Reference extraction ---
+REFERENCE_KEY_STRIP = re.compile(r'[^0-9A-Z]')
+REFERENCE_KEY_LEADING_ZEROS = re.compile(r'^0+(?=.)')
+
+
+def compile_reference_patterns(patterns):
+    """ Compiled (case-insensitive) reference-extraction regexes of a mapping, each with exactly one
+    capture group (a pattern without one captures its whole match). Raises ValueError for invalid patterns. """
+    if not patterns:
+        return []
+    if not isinstance(patterns, list) or not all(isinstance(pattern, str) and pattern for pattern in patterns):
+        raise ValueError("reference_patterns must be a list of regular expressions")
+    compiled = []
+    for pattern in patterns:
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid reference pattern {pattern!r}: {e}")
+        if regex.groups > 1:
+            raise ValueError(f"Reference pattern {pattern!r} may have at most one capture group")
+        compiled.append(regex if regex.groups else re.compile(f"({pattern})", re.IGNORECASE))
+    return compiled
+
+
+def normalize_reference_keys(values):
+    """ Join-key form of references: upper-case alphanumerics without leading zeros ('' when missing). """
+    keys = pd.Series(values, dtype=object).fillna('').astype(str).str.upper().str.replace(REFERENCE_KEY_STRIP, '', regex=True)
+    return keys.str.replace(REFERENCE_KEY_LEADING_ZEROS, '', regex=True)
+
+
+def extract_references(descriptions, patterns):
+    """ Normalized key of the first pattern matching each description ('' when none matches).
+
+    Each distinct description is matched once; patterns run in order, each only over
+    the descriptions still without a reference.
+    """
+    codes, distinct = pd.factorize(pd.Series(descriptions, dtype=object).fillna('').astype(str))
+    distinct = pd.Series(distinct, dtype=object)
+    references = pd.Series('', index=distinct.index, dtype=object)
+    for regex in patterns:
+        pending = references == ''
+        if not pending.any():
+            break
+        references[pending] = distinct[pending].str.extract(regex, expand=False).fillna('')
+    return normalize_reference_keys(references).to_numpy()[codes]
+
+
+def normalize_frame(df, mapping_config, file_path, stats=None):
+    """ Applies column mapping, date parsing and amount cleaning to raw rows; drops unusable rows.
+
+    When a stats dict is given, its 'dropped_rows' counter is incremented.
+    """
+    rename_dict, output_columns, _ = mapping_read_plan(mapping_config)
+    df = df.rename(columns=rename_dict)
+    date_format = mapping_config.get('date_format_string')
+    df[INTERNAL_DATE] = pd.to_datetime(df[INTERNAL_DATE], format=date_format, errors='coerce').dt.date
+
+    df[INTERNAL_AMOUNT_CENTS] = parse_amount_cents(df[INTERNAL_AMOUNT])
+    df[INTERNAL_ID] = df[INTERNAL_ID].astype(str)
+    df[INTERNAL_DESC] = df[INTERNAL_DESC].fillna('').astype(str)
+    reference_patterns = compile_reference_patterns(mapping_config.get('reference_patterns'))
+    if reference_patterns:
+        # Extracted keys fill rows without a mapped reference column value
+        extracted = extract_references(df[INTERNAL_DESC], reference_patterns)
+        if INTERNAL_REF in df.columns:
+            mapped = df[INTERNAL_REF].fillna('').astype(str).str.strip()
+            df[INTERNAL_REF] = mapped.where(mapped != '', extracted)
+        else:
+            df[INTERNAL_REF] = extracted
+
+    original_rows = len(df)
+    logging.debug(f"Data before dropna (Head):\n{df[[INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT]].head().to_string()}")
+    logging.warning(f"NA count in {INTERNAL_ID}: {df[INTERNAL_ID].isna().sum()}")
+    logging.warning(f"NA count in {INTERNAL_DATE}: {df[INTERNAL_DATE].isna().sum()}")
+    logging.warning(f"NA count in {INTERNAL_AMOUNT}: {df[INTERNAL_AMOUNT_CENTS].isna().sum()}")
+    df = df.dropna(subset=[INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT_CENTS])
+    df[INTERNAL_AMOUNT_CENTS] = df[INTERNAL_AMOUNT_CENTS].astype('int64')
+    dropped_rows = original_rows - len(df)
+    if dropped_rows > 0:
+        logging.warning(f"Dropped {dropped_rows} rows missing data in {file_path}")
+    if stats is not None:
+        stats['dropped_rows'] = stats.get('dropped_rows', 0) + dropped_rows
+
+    return df[[name for name in output_columns if name in df.columns]].reset_index(drop=True)
+
+
+def empty_frame(mapping_config):
+    """ Parsed-frame layout of a mapping, with no rows. """
+    return pd.DataFrame(columns=mapping_read_plan(mapping_config)[1])
+
+
+# --- Input format detection / compressed inputs ---
+InputFormat = namedtuple('InputFormat', ['kind', 'compression', 'member'])
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGIC = b'PK\x03\x04'
+# Leading bytes of the (uncompressed) formats parse_file understands; anything else is read as CSV
+FORMAT_MAGICS = ((b'PAR1', 'parquet'), (b'ARROW1', 'arrow'), (b'\xff\xff\xff\xff', 'arrow'),
+                 (b'\xd0\xcf\x11\xe0', 'xls'), (ZIP_MAGIC, 'xlsx'))
+FORMAT_SUFFIXES = {'csv': '.csv', 'xlsx': '.xlsx', 'xls': '.xls', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _zip_data_member(file_path):
+    """ Name of the single data file in a .zip upload (folders and macOS metadata ignored). """
+    with zipfile.ZipFile(file_path) as archive:
+        members = [info.filename for info in archive.infolist()
+                   if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+    if len(members) != 1:
+        raise ValueError(f"Zip archive {os.path.basename(file_path)} must contain exactly one data file, found {len(members)}")
+    return members[0]
+
+
+def detect_input_format(file_path):
+    """ Sniffs an upload by content rather than suffix.
+
+    Returns InputFormat(kind, compression, member): kind is csv/xlsx/xls/parquet/arrow,
+    compression is None, 'gzip', 'zstd' or 'zip' (member = the archived file's name).
+    .xlsx workbooks are zip files too and are recognised by their workbook part.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(8)
+    compression, member = None, None
+    if head.startswith(GZIP_MAGIC):
+        compression = 'gzip'
+    elif head.startswith(ZSTD_MAGIC):
+        compression = 'zstd'
+    elif head.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(file_path) as archive:
+            if 'xl/workbook.xml' in archive.namelist():
+                return InputFormat('xlsx', None, None)
+        compression, member = 'zip', _zip_data_member(file_path)
+    if compression:
+        with open_input(file_path, InputFormat(None, compression, member)) as stream:
+            head = stream.read(8)
+    kind = next((kind for magic, kind in FORMAT_MAGICS if head.startswith(magic)), 'csv')
+    return InputFormat(kind, compression, member)
+
+
+def open_input(file_path, input_format):
+    """ Binary stream of an upload's content, decompressed on the fly. """
+    if input_format.compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if input_format.compression == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+    if input_format.compression == 'zip':
+        with zipfile.ZipFile(file_path) as archive:
+            return archive.open(input_format.member) # The member stream keeps the archive file open
+    return open(file_path, 'rb')
+
+
+@contextmanager
+def seekable_input(file_path, input_format=None):
+    """ Path to parse for an upload: the file itself, or for a compressed workbook / Parquet /
+    Arrow file (formats that need random access) a decompressed temporary copy under INGEST_FOLDER.
+
+    Compressed CSVs are not copied; their readers decompress them as a stream.
+    """
+    input_format = input_format or detect_input_format(file_path)
+    if not input_format.compression or input_format.kind == 'csv':
+        yield file_path
+        return
+    os.makedirs(Config.INGEST_FOLDER, exist_ok=True)
+    plain_path = os.path.join(Config.INGEST_FOLDER, f"{uuid.uuid4().hex}{FORMAT_SUFFIXES[input_format.kind]}")
+    try:
+        with open_input(file_path, input_format) as stream, open(plain_path, 'wb') as plain:
+            shutil.copyfileobj(stream, plain, 1024 * 1024)
+        yield plain_path
+    finally:
+        if os.path.exists(plain_path): os.remove(plain_path)
+
+
+# --- Columnar inputs (Parquet / Arrow IPC) ---
+def _columnar_schema(file_path):
+    if detect_input_format(file_path).kind == 'parquet':
+        return pq.read_schema(file_path, memory_map=True)
+    return _arrow_ipc_table(file_path).schema
+
+
+def _arrow_ipc_table(file_path):
+    """ Zero-copy table over a memory-mapped Arrow IPC file (random-access or stream format). """
+    source = pa.memory_map(file_path, 'r')
+    try:
+        return pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source).read_all()
+
+
+def _check_columnar_columns(file_path, wanted):
+    available = set(_columnar_schema(file_path).names)
+    missing = [name for name in wanted if name not in available]
+    if missing:
+        raise ValueError(f"Mapped columns not found in {os.path.basename(file_path)}: {missing}")
+
+
+def _columnar_frame(table, read_options):
+    """ Projected Arrow data -> raw frame ready for normalize_frame, without string round trips.
+
+    Dates/timestamps stay datetime64 and numeric amounts stay numeric (decimals become
+    float64, exact to the cent like the CSV path); only the ID column is cast to string,
+    matching dtype=str on the text readers.
+    """
+    string_columns = set(read_options.get('dtype', {}))
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in string_columns and not pa.types.is_string(column.type):
+            column = column.cast(pa.string())
+        elif pa.types.is_decimal(column.type):
+            column = column.cast(pa.float64())
+        columns.append(column)
+    return pa.table(columns, names=table.column_names).to_pandas(date_as_object=False)
+
+
+def read_columnar_frame(file_path, read_options):
+    """ Reads only the mapped columns of a Parquet / Arrow IPC file (memory-mapped, projected). """
+    wanted = read_options['usecols']
+    _check_columnar_columns(file_path, wanted)
+    if detect_input_format(file_path).kind == 'parquet':
+        table = pq.read_table(file_path, columns=wanted, memory_map=True)
+    else:
+        table = _arrow_ipc_table(file_path).select(wanted)
+    return _columnar_frame(table, read_options)
+
+
+def _columnar_chunks(file_path, read_options, chunk_rows):
+    """ Raw frames of at most chunk_rows rows from a Parquet / Arrow IPC file, mapped columns only. """
+    wanted = read_options['usecols']
+    _check_columnar_columns(file_path, wanted)
+    if detect_input_format(file_path).kind == 'parquet':
+        batches = pq.ParquetFile(file_path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=wanted)
+    else:
+        batches = _arrow_ipc_table(file_path).select(wanted).to_batches(max_chunksize=chunk_rows)
+    for batch in batches:
+        yield _columnar_frame(pa.Table.from_batches([batch]), read_options)
+
+
+# --- Streaming (chunked) ingestion ---
+def use_streaming_ingest(file_path):
+    """ True for .xlsx workbooks (EXCEL_STREAMING_INGEST), for compressed CSVs (decompressed as
+    a stream; their expanded size is unknown up front) and for CSV / Parquet / Arrow files at or
+    above STREAMING_INGEST_THRESHOLD_MB (0 disables size-based streaming). """
+    input_format = detect_input_format(file_path)
+    if input_format.kind == 'xlsx':
+        return Config.EXCEL_STREAMING_INGEST
+    if input_format.kind == 'csv' and input_format.compression:
+        return True
+    threshold_mb = Config.STREAMING_INGEST_THRESHOLD_MB
+    return (bool(threshold_mb) and input_format.kind in ('csv', 'parquet', 'arrow')
+            and os.path.getsize(file_path) >= threshold_mb * 1024 * 1024)
+
+
+def _excel_cell_to_str(value):
+    """ Matches pd.read_excel(dtype=str) for ID cells: integral numbers lose the '.0'. """
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _xlsx_rows(file_path):
+    """ Streams the first worksheet as tuples of cell values, through openpyxl's read-only reader.
+
+    Rows are parsed lazily from the sheet XML (no cell model is kept) and data_only returns
+    cached formula results. Values keep openpyxl's types: str, int/float, bool, and datetime
+    for date-styled cells in either workbook epoch. Rows missing from the sheet come back empty.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        if not workbook.worksheets:
+            raise ValueError("Workbook has no worksheets")
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions() # Some writers store a wrong used range; read every row and cell present
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _xlsx_header(rows):
+    """ Column names from the first non-blank row of _xlsx_rows (trailing blank cells dropped), or None. """
+    for values in rows:
+        filled = [position for position, value in enumerate(values) if value is not None and value != '']
+        if filled:
+            return [None if value is None else str(value) for value in values[:filled[-1] + 1]]
+    return None
+
+
+def _project(values, positions):
+    """ The cells of one row at positions (0-based), None past the row's last cell. """
+    return [values[position] if position < len(values) else None for position in positions]
+
+
+def _xlsx_chunks(file_path, read_options, chunk_rows):
+    """ Streams the first worksheet of an .xlsx file, keeping only the mapped columns.
+
+    Yields raw DataFrames of at most chunk_rows rows with the workbook's header names,
+    like pd.read_csv(chunksize=...); fully blank rows are skipped as read_excel does.
+    """
+    wanted = read_options['usecols']
+    string_columns = set(read_options.get('dtype', {}))
+    rows = _xlsx_rows(file_path)
+    header = _xlsx_header(rows)
+    if header is None:
+        return
+    positions = {}
+    for position, name in enumerate(header):
+        if name is not None: positions.setdefault(name, position)
+    missing = [name for name in wanted if name not in positions]
+    if missing:
+        rows.close()
+        raise ValueError(f"Mapped columns not found in {os.path.basename(file_path)}: {missing}")
+
+    def to_frame(buffer):
+        frame = pd.DataFrame(buffer, columns=wanted, dtype=object)
+        for name in string_columns:
+            frame[name] = frame[name].map(_excel_cell_to_str)
+        return frame
+
+    wanted_positions = [positions[name] for name in wanted]
+    buffer = []
+    for values in rows:
+        values = _project(values, wanted_positions)
+        if all(value is None or value == '' for value in values):
+            continue
+        buffer.append(values)
+        if len(buffer) >= chunk_rows:
+            yield to_frame(buffer)
+            buffer = []
+    if buffer:
+        yield to_frame(buffer)
+
+
+def _csv_chunks(file_path, read_options, chunk_rows, input_format):
+    with open_input(file_path, input_format) as stream:
+        yield from pd.read_csv(stream, **read_options, on_bad_lines='warn', chunksize=chunk_rows)
+
+
+def _raw_chunks(file_path, read_options, chunk_rows):
+    """ Raw (unmapped) row chunks of a CSV (optionally gzip/zstd/zip-compressed), .xlsx, Parquet or Arrow IPC file. """
+    input_format = detect_input_format(file_path)
+    if input_format.kind == 'xlsx':
+        return _xlsx_chunks(file_path, read_options, chunk_rows)
+    if input_format.kind in ('parquet', 'arrow'):
+        return _columnar_chunks(file_path, read_options, chunk_rows)
+    if input_format.kind != 'csv':
+        raise ValueError(f"Unsupported file type for streaming ingestion: {input_format.kind}")
+    return _csv_chunks(file_path, read_options, chunk_rows, input_format)
+
+
+def _arrow_schema(output_columns):
+    """ Fixed schema so every chunk spills with identical column types. """
+    column_types = {INTERNAL_DATE: pa.date32(), INTERNAL_AMOUNT_CENTS: pa.int64()}
+    return pa.schema([(name, column_types.get(name, pa.string())) for name in output_columns])
+
+
+def _arrow_table(normalized, schema):
+    """ Normalized frame -> Arrow table with the fixed schema (non-date/amount columns as strings). """
+    normalized = normalized.copy()
+    for name in schema.names:
+        if name not in (INTERNAL_DATE, INTERNAL_AMOUNT_CENTS):
+            normalized[name] = normalized[name].astype('string')
+    return pa.Table.from_pandas(normalized, schema=schema, preserve_index=False)
+
+
+def stream_to_arrow(file_path, mapping_config, arrow_path, chunk_rows=None, stats=None):
+    """ Reads an input file in bounded chunks, normalizes each one and appends it to an Arrow IPC file.
+
+    Peak memory is bounded by chunk_rows (INGEST_CHUNK_ROWS) instead of the file size.
+    Returns the number of rows written.
+    """
+    _, output_columns, read_options = mapping_read_plan(mapping_config)
+    chunk_rows = chunk_rows or Config.INGEST_CHUNK_ROWS
+    schema = _arrow_schema(output_columns)
+    total_rows = 0
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(arrow_path) or '.', exist_ok=True)
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in _raw_chunks(file_path, read_options, chunk_rows):
+                normalized = normalize_frame(chunk, mapping_config, file_path, stats=stats)
+                writer.write_table(_arrow_table(normalized, schema))
+                total_rows += len(normalized)
+        os.replace(tmp_path, arrow_path)
+    except Exception:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    logging.info(f"Streamed {total_rows} normalized rows from {file_path} to {arrow_path} in chunks of {chunk_rows}.")
+    return total_rows
+
+
+def load_arrow_frame(arrow_path):
+    """ Memory-maps an ingested Arrow IPC file and returns it as a parsed frame.
+
+    The batches read straight from the mapping (no copy of the file), and date32
+    dates come back as one datetime64 column rather than a Python date per row.
+    """
+    with pa.memory_map(arrow_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(date_as_object=False)
+
+
+def ingest_streaming(file_path, mapping_config, arrow_path=None, stats=None):
+    """ Streams a large input file or an .xlsx workbook through an Arrow file and loads it back memory-mapped.
+
+    With arrow_path (the parsed-file cache entry) the file is kept; otherwise a
+    temporary file under INGEST_FOLDER is used and removed.
+    """
+    keep = arrow_path is not None
+    arrow_path = arrow_path or os.path.join(Config.INGEST_FOLDER, f"{uuid.uuid4().hex}.arrow")
+    try:
+        stream_to_arrow(file_path, mapping_config, arrow_path, stats=stats)
+        if keep: write_cache_stats(arrow_path, stats)
+        return load_arrow_frame(arrow_path)
+    finally:
+        if not keep:
+            try: os.remove(arrow_path)
+            except OSError: pass
+
+
+# --- Upload pre-flight validation ---
+# What a corrupt or mislabeled upload raises while being sampled (bad archives, truncated streams, undecodable text).
+# Not OSError in general: a disk or permission failure is the server's problem, not the upload's.
+PREFLIGHT_ERRORS = (ValueError, gzip.BadGzipFile, zipfile.BadZipFile, zstandard.ZstdError, zlib.error, UnicodeDecodeError, EOFError)
+
+
+def _preflight_sample(file_path, wanted, sample_rows):
+    """ (header names, raw frame of the first sample_rows rows restricted to wanted columns present). """
+    input_format = detect_input_format(file_path)
+    if input_format.kind == 'xlsx':
+        rows = _xlsx_rows(file_path)
+        header = [str(name) for name in _xlsx_header(rows) or []]
+        sample = []
+        for values in rows:
+            values = _project(values, range(len(header)))
+            if any(value is not None and value != '' for value in values):
+                sample.append(values)
+            if len(sample) >= sample_rows:
+                break
+        rows.close()
+        frame = pd.DataFrame(sample, columns=header, dtype=object)
+    elif input_format.kind in ('parquet', 'arrow'):
+        header = _columnar_schema(file_path).names
+        present = [name for name in wanted if name in header]
+        if input_format.kind == 'parquet':
+            batch = next(pq.ParquetFile(file_path, memory_map=True).iter_batches(batch_size=sample_rows, columns=present), None)
+            table = pa.Table.from_batches([batch]) if batch is not None else pq.read_schema(file_path).empty_table().select(present)
+        else:
+            table = _arrow_ipc_table(file_path).select(present).slice(0, sample_rows)
+        return header, table.to_pandas(date_as_object=False)
+    elif input_format.kind == 'xls':
+        frame = pd.read_excel(file_path, nrows=sample_rows, dtype=object)
+        header = [str(name) for name in frame.columns]
+    else:
+        with open_input(file_path, input_format) as stream:
+            frame = pd.read_csv(stream, nrows=sample_rows, dtype=str, keep_default_na=False, na_values=[''], on_bad_lines='skip')
+        header = [str(name) for name in frame.columns]
+    frame.columns = header
+    return header, frame[[name for name in wanted if name in header]]
+
+
+def preflight_check(file_path, mapping_config, sample_rows=None):
+    """ Upload-time check of a file against a mapping, reading only the header and a few rows.
+
+    Verifies that every mapped column exists and that sampled dates parse with the mapping's
+    date_format_string and sampled amounts parse as numbers. Raises ValueError describing the
+    first problem (files that cannot be read at all raise one of PREFLIGHT_ERRORS); returns
+    {'columns': header, 'sampled_rows': n} when the file looks usable.
+    """
+    rename_dict, _, read_options = mapping_read_plan(mapping_config)
+    sample_rows = sample_rows or Config.UPLOAD_PREFLIGHT_SAMPLE_ROWS
+    with seekable_input(file_path) as input_path:
+        header, sample = _preflight_sample(input_path, read_options['usecols'], sample_rows)
+
+    missing = [name for name in read_options['usecols'] if name not in header]
+    if missing:
+        raise ValueError(f"Mapped column(s) {missing} not found in file header {header}")
+
+    original_name = {internal: orig for orig, internal in rename_dict.items()}
+    date_column, amount_column = original_name[INTERNAL_DATE], original_name[INTERNAL_AMOUNT]
+    date_format = mapping_config.get('date_format_string')
+    dates = sample[date_column][sample[date_column].notna() & (sample[date_column].astype(str).str.strip() != '')]
+    if len(dates) and pd.to_datetime(dates, format=date_format, errors='coerce').isna().all():
+        raise ValueError(f"No sampled value of date column '{date_column}' matches date format "
+                         f"'{date_format or 'auto'}' (e.g. {str(dates.iloc[0])!r})")
+    amounts = sample[amount_column][sample[amount_column].notna() & (sample[amount_column].astype(str).str.strip() != '')]
+    if len(amounts) and parse_amount_cents(amounts).isna().all():
+        raise ValueError(f"No sampled value of amount column '{amount_column}' is a number (e.g. {str(amounts.iloc[0])!r})")
+    return {'columns': header, 'sampled_rows': len(sample)}
+
+
+# --- Parsed-file cache ---
+PARSED_CACHE_DIRNAME = '.parsed'
+PARSED_CACHE_VERSION = 1 # Bump when normalization output changes so old entries stop matching
+CONTENT_ADDRESSED_NAME = re.compile(r'[0-9a-f]{64}') # Uploads kept by upload_store are named by their SHA-256
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_content_hash(file_path):
+    """ SHA-256 of a file; content-addressed uploads are named by it, so they are not re-read. """
+    name = os.path.basename(file_path)
+    return name if CONTENT_ADDRESSED_NAME.fullmatch(name) else file_sha256(file_path)
+
+
+def parsed_cache_path(file_path, mapping_config):
+    """ Cache entry for a file parsed with a mapping, stored next to the upload.
+
+    The key covers the file content and the mapping's column_mappings,
+    date_format_string and reference_patterns, so editing a mapping simply stops matching
+    its old entries; those are removed with the upload (the content-hash prefix lets
+    upload garbage collection drop a file's entries).
+    """
+    content_hash = file_content_hash(file_path)
+    fingerprint = [PARSED_CACHE_VERSION, content_hash, mapping_config.get('column_mappings'), mapping_config.get('date_format_string')]
+    if mapping_config.get('reference_patterns'):
+        fingerprint.append(mapping_config['reference_patterns'])
+    fingerprint = json.dumps(fingerprint, sort_keys=True)
+    key = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), PARSED_CACHE_DIRNAME,
+                        f"mapping_{mapping_config.get('id', 'na')}-{content_hash[:16]}-{key}.arrow")
+
+
+def write_cache_stats(arrow_path, stats):
+    """ Keeps parse statistics (dropped rows) next to a cache entry, so cache hits can report them. """
+    if not stats:
+        return
+    try:
+        with open(f"{arrow_path}.json", 'w', encoding='utf-8') as f:
+            json.dump({'dropped_rows': stats.get('dropped_rows', 0)}, f)
+    except OSError as e:
+        logging.warning(f"Could not write parsed-file cache stats for {arrow_path}: {e}")
+
+
+def read_cache_stats(arrow_path):
+    try:
+        with open(f"{arrow_path}.json", encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_parsed_cache(df, mapping_config, arrow_path, stats=None):
+    """ Writes a parsed frame as an Arrow IPC cache entry (atomically); failures only log. """
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+        schema = _arrow_schema(mapping_read_plan(mapping_config)[1])
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(_arrow_table(df, schema))
+        os.replace(tmp_path, arrow_path)
+        write_cache_stats(arrow_path, stats)
+    except Exception as e:
+        logging.warning(f"Could not write parsed-file cache {arrow_path}: {e}")
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+def remove_parsed_cache_for_file(content_hash, upload_folder):
+    """ Removes every cached parse of one (content-addressed) upload, whatever the mapping. """
+    pattern = os.path.join(upload_folder, PARSED_CACHE_DIRNAME, f"mapping_*-{content_hash[:16]}-*.arrow")
+    for path in glob.glob(pattern) + glob.glob(pattern + '.json'):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not remove parsed-file cache {path}: {e}")
+
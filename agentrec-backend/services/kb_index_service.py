@@ -0,0 +1,152 @@
+# agentrec-backend/services/kb_index_service.py
+# --- Imports ---
+from ..models import db, ReconciliationType
+from ..config import Config
+from .ai_service import embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, List
+import numpy as np
+import hashlib
+import logging
+import json
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+KB_CHUNK_SIZE = 1000
+KB_CHUNK_OVERLAP = 150
+KB_RETRIEVER_K = 4
+
+# In-process memo so repeated tasks in one worker skip even the disk load
+_loaded_retrievers = {}
+_loaded_lock = threading.Lock()
+
+
+class CachedVectorRetriever(BaseRetriever):
+    """ Cosine-similarity retriever over a precomputed, L2-normalized embedding matrix.
+
+    The matrix is usually a read-only memory map shared by every worker process;
+    only the query is embedded at retrieval time.
+    """
+    matrix: Any
+    texts: List[str]
+    embedding_model: Any
+    k: int = KB_RETRIEVER_K
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        query_vector = np.asarray(self.embedding_model.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm == 0 or not len(self.texts):
+            return []
+        scores = self.matrix @ (query_vector / norm)
+        top = np.argsort(-scores, kind='stable')[:self.k]
+        return [Document(page_content=self.texts[n]) for n in top]
+
+
+def kb_content_hash(kb_content_str):
+    """ Hash of everything that determines the stored vectors: KB text, chunking and embedding model. """
+    fingerprint = json.dumps([kb_content_str, KB_CHUNK_SIZE, KB_CHUNK_OVERLAP, Config.OLLAMA_EMBEDDING_MODEL_NAME])
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+def _index_paths(reconciliation_type_id, content_hash):
+    type_folder = os.path.join(Config.KB_INDEX_FOLDER, f"type_{reconciliation_type_id}")
+    return type_folder, os.path.join(type_folder, f"{content_hash}.npy"), os.path.join(type_folder, f"{content_hash}.json")
+
+
+def _build_index(kb_content_str, type_folder, matrix_path, texts_path):
+    """ Splits and embeds the KB, then writes chunks + normalized vectors atomically. """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=KB_CHUNK_SIZE, chunk_overlap=KB_CHUNK_OVERLAP)
+    docs = text_splitter.create_documents([kb_content_str])
+    if not docs: raise ValueError("KB content generated no documents.")
+    texts = [doc.page_content for doc in docs]
+    logging.info(f"Embedding {len(texts)} KB chunks into {type_folder}...")
+
+    matrix = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+
+    os.makedirs(type_folder, exist_ok=True)
+    suffix = f".{os.getpid()}.tmp"
+    with open(texts_path + suffix, 'w', encoding='utf-8') as f:
+        json.dump(texts, f)
+    os.replace(texts_path + suffix, texts_path)
+    with open(matrix_path + suffix, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(matrix_path + suffix, matrix_path) # .npy last: its presence marks a complete index
+
+
+def get_kb_retriever(reconciliation_type_id, kb_content_str):
+    """ Returns a retriever for the type's KB, embedding it only when its content hash is new. """
+    if not embeddings:
+        raise ValueError("AI Embeddings Service unavailable.")
+    content_hash = kb_content_hash(kb_content_str)
+    memo_key = (reconciliation_type_id, content_hash)
+    with _loaded_lock:
+        retriever = _loaded_retrievers.get(memo_key)
+    if retriever:
+        return retriever
+
+    type_folder, matrix_path, texts_path = _index_paths(reconciliation_type_id, content_hash)
+    if not os.path.exists(matrix_path):
+        _build_index(kb_content_str, type_folder, matrix_path, texts_path)
+    else:
+        logging.info(f"Loading cached KB vectors for Recon Type {reconciliation_type_id} ({content_hash[:12]}).")
+        try: os.utime(matrix_path) # Restarts the GC grace period of a version still in use
+        except OSError: pass
+
+    with open(texts_path, encoding='utf-8') as f:
+        texts = json.load(f)
+    matrix = np.load(matrix_path, mmap_mode='r')
+    retriever = CachedVectorRetriever(matrix=matrix, texts=texts, embedding_model=embeddings, k=KB_RETRIEVER_K)
+    with _loaded_lock:
+        # Only the current KB version of each type stays in memory
+        for key in [key for key in _loaded_retrievers if key[0] == reconciliation_type_id]:
+            del _loaded_retrievers[key]
+        _loaded_retrievers[memo_key] = retriever
+    return retriever
+
+
+def collect_unreferenced_kb_indexes(grace_seconds=None, index_folder=None):
+    """ Deletes stored KB vectors that no reconciliation type's current KB uses any more.
+
+    A version goes once its .npy was neither built nor loaded for grace_seconds
+    (KB_INDEX_GC_GRACE_SECONDS), so a job that started before its type's KB was edited can
+    still load it; folders of deleted types go the same way. Returns the number of files removed.
+    """
+    grace_seconds = Config.KB_INDEX_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    index_folder = index_folder or Config.KB_INDEX_FOLDER
+    if not os.path.isdir(index_folder):
+        return 0
+    current = {f"type_{type_id}": kb_content_hash(kb_content_str)
+               for type_id, kb_content_str in db.session.query(ReconciliationType.id, ReconciliationType.knowledge_base_content)}
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for folder_name in os.listdir(index_folder):
+        type_folder = os.path.join(index_folder, folder_name)
+        if not folder_name.startswith('type_') or not os.path.isdir(type_folder):
+            continue
+        names = os.listdir(type_folder)
+        for name in names:
+            version = name.split('.', 1)[0]
+            if version == current.get(folder_name):
+                continue
+            # A version's age is its .npy's (built or loaded); its .json and partial writes follow it
+            marker = os.path.join(type_folder, f"{version}.npy")
+            path = os.path.join(type_folder, name)
+            try:
+                if os.path.getmtime(marker if os.path.exists(marker) else path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if folder_name not in current:
+            try: os.rmdir(type_folder) # Only once empty
+            except OSError: pass
+    if removed:
+        logging.info(f"KB index GC removed {removed} unreferenced file(s).")
+    return removed
@@ -1,87 +1,101 @@
 # agentrec-backend/services/reconciliation_service.py
 # --- Imports ---
 from ..models import db, ExceptionLog, ReconciliationResultItem
-from .ai_service import get_reconciliation_status, INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC
+from .ai_service import ReconciliationEvaluator
+from .columns import INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS
+from .evaluation_pipeline import PairEvaluationPipeline
+from .candidate_service import build_candidate_selector, find_exact_matches, resolve_candidate_params
+from .candidate_scoring import CandidateScorer
+from .assignment_service import optimal_assignment, VERDICT_WEIGHTS
+from .transaction_set import TransactionSet, UsedBitmap
+from .duplicate_service import find_duplicate_rows, duplicate_mask, DUPLICATE_EXCEPTION_TYPE
+from .aggregate_service import find_aggregate_matches, AGGREGATE_EXCEPTION_TYPE
+from ..config import Config
+from ..utils.parsers import cents_to_decimal
+from .ingestion_service import (mapping_read_plan, normalize_frame, empty_frame, use_streaming_ingest, ingest_streaming,
+                                parsed_cache_path, load_arrow_frame, write_parsed_cache, read_cache_stats,
+                                read_columnar_frame, detect_input_format, seekable_input)
 import logging
+import numpy as np
 import pandas as pd
-from decimal import Decimal
-from datetime import timedelta
 import uuid
 import json
+import time
+import os
 
 logging.basicConfig(level=logging.INFO)
 
-# --- parse_file helper ---
+FAST_PATH_REASON = "Deterministic exact match: amount and date are identical and the pair is unambiguous (rule-based fast path, AI not consulted)."
+
+# --- parse_file helpers ---
 def parse_file(file_path, mapping_config):
     """Parses file using mapping config into list of dicts with internal semantic names."""
+    return frame_to_transactions(parse_file_frame(file_path, mapping_config))
+
+
+def frame_to_transactions(df):
+    """Converts a parsed frame to per-row dicts, adding the Decimal amount used for display and persistence."""
+    if pd.api.types.is_datetime64_dtype(df[INTERNAL_DATE]): # Arrow-loaded frames keep dates as datetime64
+        df = df.assign(**{INTERNAL_DATE: df[INTERNAL_DATE].dt.date})
+    transactions = df.to_dict('records')
+    for tx in transactions:
+        tx[INTERNAL_AMOUNT] = cents_to_decimal(tx[INTERNAL_AMOUNT_CENTS])
+    return transactions
+
+
+def parse_file_frame(file_path, mapping_config, stats=None, use_cache=None):
+    """Parses file using mapping config into a DataFrame with internal semantic column names.
+
+    If a stats dict is passed it receives rows, dropped_rows, parse_seconds and from_cache.
+    use_cache reads/writes the parsed-file cache entry; None follows PARSED_FILE_CACHE_ENABLED.
+    """
     mapping_id = mapping_config.get('id', 'N/A')
     logging.info(f"Parsing file: {file_path} using mapping ID: {mapping_id}")
+    started = time.perf_counter()
+    parse_stats = {'dropped_rows': 0, 'from_cache': False}
+
+    def finish(df_clean):
+        if stats is not None:
+            stats.update(parse_stats, rows=len(df_clean), parse_seconds=round(time.perf_counter() - started, 3))
+        return df_clean
     
     try:
-        column_map = mapping_config.get('column_mappings', {})
-        if not column_map:
-            raise ValueError(f"No mappings in config ID: {mapping_id}")
-            
-        original_headers = list(column_map.keys())
-        rename_dict = {orig: internal for orig, internal in column_map.items()}
-        internal_names_expected = list(rename_dict.values())
-        required_internal_names = {INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC}
-        
-        if not required_internal_names.issubset(internal_names_expected):
-            raise ValueError(f"Mapping {mapping_id} must map to: {required_internal_names}")
-            
-        file_options = {'keep_default_na': False, 'na_values': [''], 'usecols': original_headers}
-        original_id_header = next((orig for orig, internal in column_map.items() if internal == INTERNAL_ID), None)
-        
-        if original_id_header:
-            file_options['dtype'] = {original_id_header: str}
-            
-        if file_path.lower().endswith('.csv'):
-            df = pd.read_csv(file_path, **file_options, on_bad_lines='warn', low_memory=False)
-        elif file_path.lower().endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_path, **{k: v for k, v in file_options.items() if k != 'on_bad_lines'})
-        else:
-            raise ValueError("Unsupported file type")
+        _, _, file_options = mapping_read_plan(mapping_config)
+
+        use_cache = Config.PARSED_FILE_CACHE_ENABLED if use_cache is None else use_cache
+        cache_path = parsed_cache_path(file_path, mapping_config) if use_cache else None
+        if cache_path and os.path.exists(cache_path):
+            df_clean = load_arrow_frame(cache_path)
+            parse_stats.update(read_cache_stats(cache_path), from_cache=True)
+            logging.info(f"Loaded {len(df_clean)} parsed rows for {file_path} from cache {os.path.basename(cache_path)}")
+            return finish(df_clean)
+
+        # Compressed CSVs are decompressed as a stream by the chunked reader; compressed
+        # workbooks / Parquet / Arrow files are parsed from a temporary decompressed copy
+        with seekable_input(file_path) as input_path:
+            if use_streaming_ingest(input_path):
+                df_clean = ingest_streaming(input_path, mapping_config, arrow_path=cache_path, stats=parse_stats)
+                logging.info(f"Parsed and mapped {len(df_clean)} rows from {file_path} (streaming)")
+                return finish(df_clean)
+
+            input_format = detect_input_format(input_path)
+            if input_format.kind == 'csv':
+                df = pd.read_csv(input_path, **file_options, on_bad_lines='warn', low_memory=False)
+            elif input_format.kind in ('xlsx', 'xls'):
+                df = pd.read_excel(input_path, **{k: v for k, v in file_options.items() if k != 'on_bad_lines'})
+            elif input_format.kind in ('parquet', 'arrow'):
+                df = read_columnar_frame(input_path, file_options)
+            else:
+                raise ValueError("Unsupported file type")
             
         if df.empty:
             logging.warning(f"File empty: {file_path}")
-            return []
+            return finish(empty_frame(mapping_config))
             
-        df.rename(columns=rename_dict, inplace=True)
-        date_format = mapping_config.get('date_format_string')
-        df[INTERNAL_DATE] = pd.to_datetime(df[INTERNAL_DATE], format=date_format, errors='coerce').dt.date
-        
-        def clean_amount(x):
-            if pd.isna(x) or x == '':
-                return None
-            try:
-                cleaned = str(x).replace('$', '').replace(',', '').strip()
-                if cleaned.startswith('(') and cleaned.endswith(')'):
-                    cleaned = '-' + cleaned[1:-1]
-                return Decimal(cleaned)
-            except (ValueError, TypeError):
-                return None
-                
-        df[INTERNAL_AMOUNT] = df[INTERNAL_AMOUNT].apply(clean_amount)
-        df[INTERNAL_ID] = df[INTERNAL_ID].astype(str)
-        df[INTERNAL_DESC] = df[INTERNAL_DESC].fillna('').astype(str)
-        
-        original_rows = len(df)
-        # services/reconciliation_service.py (inside parse_file, before dropna)
-        logging.debug(f"Data before dropna (Head):\n{df[[INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT]].head().to_string()}")
-        logging.warning(f"NA count in {INTERNAL_ID}: {df[INTERNAL_ID].isna().sum()}")
-        logging.warning(f"NA count in {INTERNAL_DATE}: {df[INTERNAL_DATE].isna().sum()}")
-        logging.warning(f"NA count in {INTERNAL_AMOUNT}: {df[INTERNAL_AMOUNT].isna().sum()}")
-        df.dropna(subset=[INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT], inplace=True)
-        dropped_rows = original_rows - len(df)
-        
-        if dropped_rows > 0:
-            logging.warning(f"Dropped {dropped_rows} rows missing data in {file_path}")
-            
-        output_columns = [name for name in internal_names_expected if name in df.columns]
-        df_clean = df[output_columns]
+        df_clean = normalize_frame(df, mapping_config, file_path, stats=parse_stats)
         logging.info(f"Parsed and mapped {len(df_clean)} rows from {file_path}")
-        return df_clean.to_dict('records')
+        if cache_path: write_parsed_cache(df_clean, mapping_config, cache_path, stats=parse_stats)
+        return finish(df_clean)
         
     except pd.errors.EmptyDataError as e:
         logging.error(f"Empty data in file {file_path}: {e}")
@@ -137,19 +151,125 @@ def create_exception_log(job_id, exc_type, priority, details_dict):
         logging.error(f"Error creating ExceptionLog for job {job_id}: {e}", exc_info=True)
         return None
 
+def duplicate_results(job_id, side, transaction_set, duplicates, summary):
+    """ Exception log + result item for each in-file duplicate found by find_duplicate_rows ('Source'/'Target' side). """
+    results = []
+    for row, (first_row, kind) in duplicates.items():
+        tx, original = transaction_set[row], transaction_set[first_row]
+        internal_id, internal_date, internal_amount, internal_desc = tx[INTERNAL_ID], tx[INTERNAL_DATE], tx[INTERNAL_AMOUNT], tx[INTERNAL_DESC]
+        matched_fields = "description" if kind == 'exact' else "normalized ID/description"
+        reason = (f"{kind.capitalize()} duplicate of {side.lower()} transaction {original[INTERNAL_ID]} "
+                  f"(same date, amount and {matched_fields}); excluded from matching.")
+        side_view = {"id": internal_id, "date": str(internal_date), "description": internal_desc, "amount": str(internal_amount)}
+        details_for_log = {
+            "source_internal_id": internal_id if side == 'Source' else None,
+            "target_internal_id": internal_id if side == 'Target' else None,
+            "ai_reason": reason,
+            "exception_type": DUPLICATE_EXCEPTION_TYPE,
+            "title": f"Duplicate {side} Txn {internal_id}",
+            "description": internal_desc,
+            "amount": str(internal_amount),
+            "date": str(internal_date),
+            "duplicate": {"kind": kind, "original_id": original[INTERNAL_ID]},
+            "transaction": dict(side_view, source=side),
+            "discrepancy": {"bank": side_view if side == 'Source' else {}, "erp": side_view if side == 'Target' else {}}
+        }
+        exception_display_id = create_exception_log(job_id=job_id, exc_type=DUPLICATE_EXCEPTION_TYPE, priority=None, details_dict=details_for_log)
+        result_details = {
+            "source_internal_id": details_for_log["source_internal_id"],
+            "target_internal_id": details_for_log["target_internal_id"],
+            "ai_reason": reason,
+            "exception_type": DUPLICATE_EXCEPTION_TYPE,
+            "source_desc": internal_desc if side == 'Source' else '',
+            "target_desc": internal_desc if side == 'Target' else '',
+            "exception_id_display": exception_display_id
+        }
+        results.append(ReconciliationResultItem(
+            job_id=job_id, display_id=f"{'SRC' if side == 'Source' else 'TGT'}-{internal_id}",
+            date=internal_date, description=internal_desc[:200], amount=internal_amount,
+            status="Exception", action="Resolve", details=json.loads(json.dumps(result_details, default=str))
+        ))
+    summary['duplicate_count'] += len(duplicates); summary['exceptions_count'] += len(duplicates)
+    return results
+
+def aggregate_results(job_id, source_set, source_rows, target_set, target_rows, difference_cents, summary):
+    """ Linked result items (sources, targets) for one group found by find_aggregate_matches; they share a group_id. """
+    sources, targets = [source_set[row] for row in source_rows], [target_set[row] for row in target_rows]
+    kind = 'one_to_many' if len(sources) == 1 else 'many_to_one'
+    source_total, target_total = sum(tx[INTERNAL_AMOUNT] for tx in sources), sum(tx[INTERNAL_AMOUNT] for tx in targets)
+    reason = (f"Aggregate match: {len(sources)} source transaction(s) totalling {source_total} against {len(targets)} target "
+              f"transaction(s) totalling {target_total} within the date window (difference {cents_to_decimal(difference_cents)}). "
+              f"Rule-based grouping, AI not consulted; review before accepting.")
+    aggregate = {
+        "group_id": f"GRP-{uuid.uuid4().hex[:8].upper()}",
+        "kind": kind,
+        "source_internal_ids": [tx[INTERNAL_ID] for tx in sources],
+        "target_internal_ids": [tx[INTERNAL_ID] for tx in targets],
+        "source_total": str(source_total),
+        "target_total": str(target_total),
+        "difference": str(cents_to_decimal(difference_cents))
+    }
+
+    def item(side, tx):
+        result_details = {
+            "source_internal_id": tx[INTERNAL_ID] if side == 'Source' else (sources[0][INTERNAL_ID] if len(sources) == 1 else None),
+            "target_internal_id": tx[INTERNAL_ID] if side == 'Target' else (targets[0][INTERNAL_ID] if len(targets) == 1 else None),
+            "ai_reason": reason,
+            "exception_type": AGGREGATE_EXCEPTION_TYPE,
+            "source_desc": tx[INTERNAL_DESC] if side == 'Source' else '',
+            "target_desc": tx[INTERNAL_DESC] if side == 'Target' else '',
+            "exception_id_display": None,
+            "aggregate": aggregate
+        }
+        return ReconciliationResultItem(
+            job_id=job_id, display_id=f"{'SRC' if side == 'Source' else 'TGT'}-{tx[INTERNAL_ID]}",
+            date=tx[INTERNAL_DATE], description=tx[INTERNAL_DESC][:200], amount=tx[INTERNAL_AMOUNT],
+            status="Partial Match", action="Review", details=json.loads(json.dumps(result_details, default=str))
+        )
+
+    # partial_match_count stays a count of source rows; group members are reported on their own
+    summary['aggregate_group_count'] += 1; summary['partial_match_count'] += len(sources)
+    summary['aggregate_source_count'] += len(sources); summary['aggregate_target_count'] += len(targets)
+    return [item('Source', tx) for tx in sources], [item('Target', tx) for tx in targets]
+
+def assign_evaluated_pairs(pipeline, candidate_lists, scorer):
+    """ Evaluates every candidate of every source, then assigns targets one-to-one (optimal assignment mode).
+
+    Matched / Partial Match verdicts become edges weighted by VERDICT_WEIGHTS plus the
+    heuristic candidate score; returns ({source_idx: target_idx}, {source_idx: [(target_idx, verdict), ...]}).
+    """
+    pair_verdicts, edge_sources, edge_targets, edge_weights = {}, [], [], []
+    for i, candidates in candidate_lists.items():
+        pair_verdicts[i] = list(pipeline.verdicts(i, candidates))
+        pipeline.discard(i)
+        for target_idx, verdict in pair_verdicts[i]:
+            weight = VERDICT_WEIGHTS.get(verdict.get('status'))
+            if weight:
+                edge_sources.append(i); edge_targets.append(target_idx); edge_weights.append(weight)
+    if edge_weights:
+        edge_weights = np.asarray(edge_weights) + scorer.score(np.asarray(edge_sources), np.asarray(edge_targets))
+    return optimal_assignment(edge_sources, edge_targets, edge_weights), pair_verdicts
+
 # --- Main Reconciliation Logic ---
 def process_reconciliation(job_id, source_file_path, target_file_path,
                             source_map_config, target_map_config,
                             kb_retriever, prompt_template_str, # Receive retriever & prompt
-                            candidate_strategy='default_date_amount'):
-    """ Uses mappings, specific KB/Prompt via AI service, saves results. """
+                            candidate_strategy='default_date_amount', verdict_cache=None,
+                            max_concurrency=None, candidate_params=None, use_parsed_cache=None):
+    """ Uses mappings, specific KB/Prompt via AI service, saves results.
+
+    use_parsed_cache is passed to parse_file_frame (True loads the upload-time ingestion artifacts).
+    """
     logging.info(f"Processing Job ID: {job_id}, Strategy: {candidate_strategy}")
-    summary = { 'processed_source': 0, 'processed_target': 0, 'matched_count': 0, 'partial_match_count': 0, 'exceptions_count': 0, 'ai_errors': 0 }
+    summary = { 'processed_source': 0, 'processed_target': 0, 'matched_count': 0, 'partial_match_count': 0, 'exceptions_count': 0, 'ai_errors': 0,
+                'duplicate_count': 0, 'aggregate_group_count': 0, 'aggregate_source_count': 0, 'aggregate_target_count': 0, 'fast_path_matched_count': 0, 'ai_matched_count': 0, 'ai_evaluated_pairs': 0, 'ai_llm_calls': 0, 'ai_discarded_evaluations': 0 }
     results_to_add = []
+    pipeline = None
 
     try:
-        source_transactions = parse_file(source_file_path, source_map_config)
-        target_transactions = parse_file(target_file_path, target_map_config)
+        # Columnar stores: rows are decoded on access through read-only views
+        source_transactions = TransactionSet(parse_file_frame(source_file_path, source_map_config, use_cache=use_parsed_cache))
+        target_transactions = TransactionSet(parse_file_frame(target_file_path, target_map_config, use_cache=use_parsed_cache))
         summary['processed_source'] = len(source_transactions); summary['processed_target'] = len(target_transactions)
         logging.info(f"Parsed {summary['processed_source']} source & {summary['processed_target']} target txns.")
 
@@ -160,45 +280,79 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
              logging.info(f"Deleted old items for Job ID: {job_id}")
              db.session.commit()
 
-        target_used = [False] * len(target_transactions)
+        target_used = UsedBitmap(len(target_transactions))
         first_exception_found = {}
+        pending_exceptions = {} # source_idx -> (result position, exception type, log details); logged after aggregate matching
+
+        # --- Build AI Evaluator (once per job; validates the prompt template up front) ---
+        evaluator = ReconciliationEvaluator(kb_retriever, prompt_template_str)
+
+        # --- In-file Duplicate Detection (duplicates never reach the fast path, candidates or the LLM) ---
+        source_duplicates, target_duplicates = {}, {}
+        if Config.DUPLICATE_DETECTION_ENABLED:
+            source_duplicates = find_duplicate_rows(source_transactions)
+            target_duplicates = find_duplicate_rows(target_transactions)
+        for target_idx in target_duplicates: target_used[target_idx] = True
+
+        # --- Exact-Match Fast Path (before any candidate/AI work) ---
+        fast_path_matches = find_exact_matches(source_transactions, target_transactions,
+                                               exclude_source=duplicate_mask(source_duplicates, len(source_transactions)),
+                                               exclude_target=duplicate_mask(target_duplicates, len(target_transactions))) if Config.EXACT_MATCH_FAST_PATH else {}
+        for target_idx in fast_path_matches.values(): target_used[target_idx] = True
+
+        # --- Build Candidate Engine (once per job, from the type's registered strategy + parameters) ---
+        strategy_candidates = build_candidate_selector(candidate_strategy, candidate_params, source_transactions,
+                                                       target_transactions, engine=Config.CANDIDATE_ENGINE,
+                                                       top_k=Config.CANDIDATE_TOP_K)
+
+        def select_candidates(source_idx):
+            """ Live (unused) candidate target indices for a source; fast-path hits and duplicates need none. """
+            if source_idx in fast_path_matches or source_idx in source_duplicates: return []
+            return strategy_candidates(source_idx, target_used)
+
+        # --- AI Evaluation Pipeline (cache + bounded concurrency) ---
+        pipeline = PairEvaluationPipeline(evaluator, source_transactions, target_transactions, select_candidates,
+                                          verdict_cache=verdict_cache, max_concurrency=max_concurrency or Config.AI_MAX_CONCURRENCY,
+                                          batch_size=Config.AI_BATCH_MAX_SIZE)
+
+        # --- Optimal Assignment (opt-in): all candidates are evaluated first, then matched one-to-one per component ---
+        assigned_targets, pair_verdicts = None, {}
+        if Config.MATCH_ASSIGNMENT == 'optimal':
+            candidate_lists = {i: select_candidates(i) for i in range(len(source_transactions)) if i not in source_duplicates}
+            assigned_targets, pair_verdicts = assign_evaluated_pairs(pipeline, {i: c for i, c in candidate_lists.items() if c},
+                                                                     CandidateScorer(source_transactions, target_transactions))
 
         # --- Iterate Source ---
         for i, source_tx in enumerate(source_transactions):
+            if i in source_duplicates: continue # Reported by the duplicate stage below
             source_internal_id=source_tx[INTERNAL_ID]; source_internal_date=source_tx[INTERNAL_DATE]; source_internal_amount=source_tx[INTERNAL_AMOUNT]; source_internal_desc=source_tx[INTERNAL_DESC]
             final_status_for_source, best_target_idx, best_target_tx = "Unmatched", -1, None
             final_reason, final_exception_type, action = "No suitable match found.", "Missing Transaction (Target)", "Resolve"
 
-            potential_target_indices = []
+            fast_path_hit = i in fast_path_matches
+            if fast_path_hit:
+                best_target_idx = fast_path_matches[i]; best_target_tx = target_transactions[best_target_idx]
+                final_status_for_source, final_reason, final_exception_type, action = "Matched", FAST_PATH_REASON, None, "View"
+                summary['fast_path_matched_count'] += 1
+
             # --- Candidate Selection ---
-            # (Keep default_date_amount logic or add others based on candidate_strategy)
-            if candidate_strategy == 'default_date_amount':
-                date_window=timedelta(days=7); amount_tolerance_fixed=Decimal('100.00')
-                for j, target_tx in enumerate(target_transactions):
-                     if not target_used[j]:
-                         target_internal_date=target_tx.get(INTERNAL_DATE); target_internal_amount=target_tx.get(INTERNAL_AMOUNT)
-                         if source_internal_date and target_internal_date: date_diff = abs(source_internal_date - target_internal_date);
-                         else: date_diff = timedelta(days=999)
-                         if date_diff > date_window: continue
-                         if source_internal_amount is not None and target_internal_amount is not None: amount_diff = abs(source_internal_amount - target_internal_amount);
-                         else: amount_diff = Decimal('inf')
-                         if amount_diff > amount_tolerance_fixed: continue
-                         potential_target_indices.append(j)
-            else: logging.warning(f"Candidate strategy '{candidate_strategy}' not implemented.")
+            if assigned_targets is None: potential_target_indices = select_candidates(i)
+            else: potential_target_indices = [target_idx for target_idx, _ in pair_verdicts.get(i, [])]
             # ---
 
             # --- AI Evaluation ---
-            if not potential_target_indices: final_status_for_source = "Exception"
+            if fast_path_hit: pass # Settled by rule, never reaches the LLM
+            elif not potential_target_indices: final_status_for_source = "Exception"
             else:
                 logging.info(f"Evaluating {len(potential_target_indices)} candidates for Src {source_internal_id}...")
                 temp_best_status = "Exception"
-                for target_idx in potential_target_indices:
+                # Verdicts arrive in candidate order (cached, or from the job's evaluator; possibly computed ahead in parallel)
+                verdicts = pipeline.verdicts(i, potential_target_indices) if assigned_targets is None else pair_verdicts[i]
+                for target_idx, ai_result in verdicts:
                     target_tx = target_transactions[target_idx]
-                    ai_source_input = {k: v for k, v in source_tx.items()}
-                    ai_target_input = {k: v for k, v in target_tx.items()}
-                    # Call AI with SPECIFIC retriever and prompt
-                    ai_result = get_reconciliation_status( ai_source_input, ai_target_input, kb_retriever, prompt_template_str )
                     status = ai_result.get('status', 'Error')
+                    if assigned_targets is not None and status in VERDICT_WEIGHTS and assigned_targets.get(i) != target_idx:
+                        continue # The optimal assignment gave this target to another source (or none to this one)
                     if status == 'Error':
                         summary['ai_errors'] += 1
                         if i not in first_exception_found:
@@ -214,11 +368,13 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
                     elif status == 'Exception':
                         if i not in first_exception_found: first_exception_found[i] = {'reason': ai_result.get('reason'), 'type': ai_result.get('exception_type'), 'target_tx': target_tx}
 
+                pipeline.discard(i)
+
             # --- Process Final Result ---
             exception_display_id = None
-            exception_display_id = None
             if final_status_for_source == "Matched":
                 summary['matched_count'] += 1
+                if not fast_path_hit: summary['ai_matched_count'] += 1
                 action = "View"
                 if best_target_idx != -1: target_used[best_target_idx] = True
                 # 'final_reason' already holds the AI reason for the match
@@ -262,7 +418,7 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
                         } if best_target_tx else {}
                     }
                 }
-                exception_display_id = create_exception_log(job_id=job_id, exc_type=final_exception_type, priority=None, details_dict=details_for_log)
+                pending_exceptions[i] = (len(results_to_add), final_exception_type, details_for_log)
                 if best_target_idx != -1 and not target_used[best_target_idx]: target_used[best_target_idx] = True
 
             # Create ReconciliationResultItem
@@ -288,6 +444,26 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
             results_to_add.append(result)
         # --- End Source Loop ---
 
+        # --- Aggregate Matching (leftover sources vs. unused targets: batch deposits, split payments) ---
+        if Config.AGGREGATE_MATCHING_ENABLED and pending_exceptions:
+            window_days = resolve_candidate_params(candidate_strategy, candidate_params)['date_window_days']
+            leftover_targets = [j for j in range(len(target_transactions)) if not target_used[j]]
+            groups = find_aggregate_matches(source_transactions, list(pending_exceptions), target_transactions, leftover_targets,
+                                            window_days, Config.AGGREGATE_AMOUNT_TOLERANCE, Config.AGGREGATE_MAX_GROUP_SIZE)
+            for source_rows, target_rows, difference_cents in groups:
+                source_items, target_items = aggregate_results(job_id, source_transactions, source_rows, target_transactions,
+                                                               target_rows, difference_cents, summary)
+                for source_idx, item in zip(source_rows, source_items):
+                    results_to_add[pending_exceptions.pop(source_idx)[0]] = item
+                    summary['exceptions_count'] -= 1 # Counted as an exception by the source loop
+                for target_idx in target_rows: target_used[target_idx] = True
+                results_to_add.extend(target_items)
+
+        # Exception logs of the sources still unmatched
+        for position, exception_type, details_for_log in pending_exceptions.values():
+            exception_display_id = create_exception_log(job_id=job_id, exc_type=exception_type, priority=None, details_dict=details_for_log)
+            results_to_add[position].details = dict(results_to_add[position].details, exception_id_display=exception_display_id)
+
         # --- Handle Unmatched Targets ---
         for j, target_tx in enumerate(target_transactions):
             if not target_used[j]:
@@ -305,17 +481,29 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
                 result = ReconciliationResultItem( job_id=job_id, display_id=f"TGT-{target_internal_id}", date=target_internal_date, description=target_internal_desc[:200], amount=target_internal_amount, status=status, action=action, details=json.loads(json.dumps(details_for_log, default=str)) )
                 results_to_add.append(result)
 
+        # --- Duplicate Transaction exceptions (bulk, from the detection stage) ---
+        results_to_add.extend(duplicate_results(job_id, 'Source', source_transactions, source_duplicates, summary))
+        results_to_add.extend(duplicate_results(job_id, 'Target', target_transactions, target_duplicates, summary))
+
+        pipeline.close(); summary.update(pipeline.stats())
+
         # --- Final Commit ---
         if results_to_add: db.session.add_all(results_to_add)
         # Commit results and any exceptions added via helper within the try block
         db.session.commit()
         logging.info(f"Saved results and exceptions for Job ID: {job_id}")
+        if verdict_cache:
+            verdict_cache.close(); summary.update(verdict_cache.stats())
 
     except Exception as e: # General error handling for the whole process
         error_msg = str(e)
         logging.error(f"Critical error during reconciliation for Job ID {job_id}: {error_msg}", 
                      exc_info=True)
         db.session.rollback()  # Rollback any partial changes
+        if pipeline:  # Stop queued speculative LLM calls; finished ones still reach the cache
+            pipeline.close()
+        if verdict_cache:  # Keep verdicts already paid for, so a re-run can reuse them
+            verdict_cache.close(); summary.update(verdict_cache.stats())
         
         try:
             # Update summary with error info
@@ -333,6 +521,9 @@ def process_reconciliation(job_id, source_file_path, target_file_path,
             summary['error'] = f"Processing error: {error_msg}"
         
         raise ReconciliationError(f"Reconciliation failed: {error_msg}") from e
+    finally:
+        if pipeline:  # Never leave the evaluation pool running, whatever ended the job
+            pipeline.close()
 
     logging.info(f"Finished reconciliation process for Job ID: {job_id}. Summary: {summary}")
     return {'summary': summary}
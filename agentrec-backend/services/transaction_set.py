@@ -0,0 +1,124 @@
+# agentrec-backend/services/transaction_set.py
+# --- Imports ---
+from .columns import INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_AMOUNT_CENTS
+from ..utils.parsers import cents_to_decimal
+from collections.abc import Mapping
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sys
+
+EPOCH = date(1970, 1, 1)
+
+
+class TransactionSet:
+    """ Column-oriented store for one side of a job's parsed (normalized) transactions.
+
+    Dates are int32 day numbers, amounts int64 cents, IDs one Arrow string array,
+    and descriptions/other mapped columns are interned: int32 codes into a list of
+    distinct values. Rows are read through lightweight TransactionView objects, so
+    nothing is copied per candidate pair.
+    """
+    def __init__(self, df):
+        self.size = len(df)
+        dates = pd.to_datetime(df[INTERNAL_DATE])
+        self.days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int32)
+        self.cents = df[INTERNAL_AMOUNT_CENTS].to_numpy(dtype=np.int64)
+        self.ids = pa.array(df[INTERNAL_ID].astype(str), type=pa.string())
+        self._interned = {}  # column -> (int32 codes, distinct values; code -1 -> None)
+        for name in df.columns:
+            if name in (INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT_CENTS):
+                continue
+            codes, distinct = pd.factorize(df[name])
+            self._interned[name] = (codes.astype(np.int32), list(distinct) + [None])
+        self.columns = (INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_AMOUNT_CENTS, *self._interned)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, row):
+        if row < 0: row += self.size
+        if not 0 <= row < self.size:
+            raise IndexError(row)
+        return TransactionView(self, row)
+
+    def __iter__(self):
+        return (TransactionView(self, row) for row in range(self.size))
+
+    def value(self, row, column):
+        """ One cell, as the Python value the record-based code expects (date, Decimal, str). """
+        if column == INTERNAL_ID:
+            return self.ids[row].as_py()
+        if column == INTERNAL_DATE:
+            return EPOCH + timedelta(days=int(self.days[row]))
+        if column == INTERNAL_AMOUNT:
+            return cents_to_decimal(self.cents[row])
+        if column == INTERNAL_AMOUNT_CENTS:
+            return int(self.cents[row])
+        codes, distinct = self._interned[column]
+        return distinct[codes[row]]
+
+    def column(self, column):
+        """ A whole interned column as an object array (e.g. references for a hash join). """
+        if column == INTERNAL_ID:
+            return np.asarray(self.ids.to_pylist(), dtype=object)
+        codes, distinct = self._interned[column]
+        return np.asarray(distinct, dtype=object)[codes]
+
+    def interned(self, column):
+        """ (int32 codes, distinct values) of an interned column; code -1 is a missing value. """
+        return self._interned[column]
+
+    def has_column(self, column):
+        return column in self.columns
+
+    def nbytes(self):
+        """ Approximate memory held by the columns, interned values included. """
+        interned = sum(codes.nbytes + sum(sys.getsizeof(v) for v in distinct) for codes, distinct in self._interned.values())
+        return self.days.nbytes + self.cents.nbytes + self.ids.nbytes + interned
+
+
+class TransactionView(Mapping):
+    """ Read-only dict-like row of a TransactionSet; values are decoded on access. """
+    __slots__ = ('_set', 'row')
+
+    def __init__(self, transaction_set, row):
+        self._set = transaction_set
+        self.row = row
+
+    def __getitem__(self, column):
+        if not self._set.has_column(column):
+            raise KeyError(column)
+        return self._set.value(self.row, column)
+
+    def __iter__(self):
+        return iter(self._set.columns)
+
+    def __len__(self):
+        return len(self._set.columns)
+
+    def __repr__(self):
+        return f"TransactionView({dict(self)!r})"
+
+
+class UsedBitmap:
+    """ One bit per transaction marking targets already consumed by a match. """
+    def __init__(self, size):
+        self.size = size
+        self._bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def __setitem__(self, index, used):
+        if used: self._bits[index >> 3] |= np.uint8(1 << (index & 7))
+        else: self._bits[index >> 3] &= np.uint8(~(1 << (index & 7)) & 0xFF)
+
+    def test(self, indices):
+        """ Vectorized lookup: bool array of used flags for an int array of indices. """
+        indices = np.asarray(indices, dtype=np.int64)
+        return (self._bits[indices >> 3] >> (indices & 7).astype(np.uint8)) & 1 == 1
@@ -0,0 +1,149 @@
+# agentrec-backend/services/upload_store.py
+# --- Imports ---
+from ..models import db, UploadedFile
+from ..config import Config
+from .ingestion_service import CONTENT_ADDRESSED_NAME, remove_parsed_cache_for_file
+from flask import current_app, has_app_context
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+from datetime import datetime, timedelta, timezone
+import hashlib
+import logging
+import glob
+import time
+import uuid
+import os
+
+logging.basicConfig(level=logging.INFO)
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+INCOMING_PREFIX = '.incoming-' # Partially received uploads, renamed to their hash once complete
+
+
+def _upload_folder():
+    return current_app.config['UPLOAD_FOLDER'] if has_app_context() else Config.UPLOAD_FOLDER
+
+
+def stored_content_hash(file_path):
+    """ Content hash of a content-addressed upload path, or None for legacy per-job files. """
+    name = os.path.basename(file_path or '')
+    return name if CONTENT_ADDRESSED_NAME.fullmatch(name) else None
+
+
+def store_upload(file_storage, upload_folder=None):
+    """ Streams an uploaded file to disk while hashing it, and keeps one copy per distinct content.
+
+    The blob is stored as UPLOAD_FOLDER/<sha256>; re-uploading identical content drops the
+    temporary copy and reuses the existing blob. A job reference is added to its UploadedFile
+    row in the current session, so the caller commits it together with the job.
+
+    The reference is taken before the blob is trusted to exist. On PostgreSQL its UPDATE
+    holds the row lock until the caller commits, and collect_unreferenced_uploads only deletes
+    rows it can lock (FOR UPDATE SKIP LOCKED) and removes the blob before committing, so a
+    blob seen here after the reference stays. SQLite has no row locks; there its single
+    writer serializes the two transactions to the same effect.
+    """
+    upload_folder = upload_folder or _upload_folder()
+    os.makedirs(upload_folder, exist_ok=True)
+    tmp_path = os.path.join(upload_folder, f"{INCOMING_PREFIX}{uuid.uuid4().hex}")
+    digest, size_bytes = hashlib.sha256(), 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            while block := file_storage.stream.read(UPLOAD_BLOCK_SIZE):
+                digest.update(block)
+                out.write(block)
+                size_bytes += len(block)
+        content_hash = digest.hexdigest()
+        blob_path = os.path.join(upload_folder, content_hash)
+        uploaded = _add_reference(content_hash, blob_path, size_bytes, secure_filename(file_storage.filename or ''))
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            os.utime(blob_path) # Restarts the orphan grace period until the caller commits the reference
+            logging.info(f"Upload '{file_storage.filename}' matches stored content {content_hash[:12]}; reusing it.")
+        else:
+            os.replace(tmp_path, blob_path)
+    except Exception:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+    if not os.path.exists(uploaded.storage_path): # e.g. UPLOAD_FOLDER moved since the blob was first stored
+        uploaded.storage_path = blob_path
+    return uploaded
+
+
+def _add_reference(content_hash, blob_path, size_bytes, original_filename):
+    """ ref_count + 1 (as one UPDATE, so concurrent uploads don't lose increments), creating the row if needed. """
+    reference = {UploadedFile.ref_count: UploadedFile.ref_count + 1,
+                 UploadedFile.last_referenced_at: datetime.now(timezone.utc)}
+    updated = UploadedFile.query.filter_by(content_hash=content_hash).update(reference, synchronize_session=False)
+    if not updated:
+        try:
+            with db.session.begin_nested():
+                db.session.add(UploadedFile(content_hash=content_hash, storage_path=blob_path, size_bytes=size_bytes,
+                                            original_filename=original_filename or None, ref_count=1))
+        except IntegrityError: # Same content stored by a concurrent upload
+            UploadedFile.query.filter_by(content_hash=content_hash).update(reference, synchronize_session=False)
+    return UploadedFile.query.filter_by(content_hash=content_hash).populate_existing().one()
+
+
+def release_upload(file_path):
+    """ Drops one job reference to a stored upload; legacy per-job files are ignored. """
+    content_hash = stored_content_hash(file_path)
+    if not content_hash:
+        return False
+    released = UploadedFile.query.filter(UploadedFile.content_hash == content_hash, UploadedFile.ref_count > 0).update(
+        {UploadedFile.ref_count: UploadedFile.ref_count - 1}, synchronize_session=False)
+    return bool(released)
+
+
+def collect_unreferenced_uploads(grace_seconds=None, upload_folder=None):
+    """ Deletes stored uploads that no job references any more.
+
+    A blob goes once its ref_count is 0 and its last reference is older than
+    UPLOAD_GC_GRACE_SECONDS (so content being re-uploaded right now survives), together
+    with its parsed-file cache entries. Abandoned partial uploads and blobs left without a
+    row (upload rolled back) past the grace period are removed as well. Returns the number
+    of referenced-then-released blobs deleted.
+    """
+    grace_seconds = Config.UPLOAD_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    upload_folder = upload_folder or _upload_folder()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    unreferenced = (UploadedFile.ref_count <= 0, UploadedFile.last_referenced_at < cutoff)
+    candidate_ids = [upload_id for (upload_id,) in db.session.query(UploadedFile.id).filter(*unreferenced)]
+    db.session.commit()
+    removed = 0
+    for upload_id in candidate_ids:
+        # Lock and re-check the row: a job may have referenced it meanwhile, and rows an upload
+        # transaction holds right now are skipped until the next run
+        row = db.session.query(UploadedFile.content_hash, UploadedFile.storage_path).filter(
+            UploadedFile.id == upload_id, *unreferenced).with_for_update(skip_locked=True).one_or_none()
+        if row is None:
+            db.session.commit()
+            continue
+        content_hash, storage_path = row
+        UploadedFile.query.filter(UploadedFile.id == upload_id).delete(synchronize_session=False)
+        # Removed while the deleted row is still locked, so a concurrent store_upload waits and re-creates the blob
+        try:
+            os.remove(storage_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove stored upload {storage_path}: {e}")
+        db.session.commit()
+        remove_parsed_cache_for_file(content_hash, os.path.dirname(storage_path))
+        removed += 1
+
+    # Partial uploads, and blobs whose job was never committed (no row), past the grace period
+    known_hashes = {content_hash for (content_hash,) in db.session.query(UploadedFile.content_hash)}
+    for path in glob.glob(os.path.join(upload_folder, '*')) + glob.glob(os.path.join(upload_folder, f"{INCOMING_PREFIX}*")):
+        name = os.path.basename(path)
+        orphan = name.startswith(INCOMING_PREFIX) or (CONTENT_ADDRESSED_NAME.fullmatch(name) and name not in known_hashes)
+        try:
+            if orphan and os.path.getmtime(path) < time.time() - grace_seconds:
+                os.remove(path)
+                if not name.startswith(INCOMING_PREFIX): remove_parsed_cache_for_file(name, upload_folder)
+        except OSError:
+            pass
+    if removed:
+        logging.info(f"Upload GC removed {removed} unreferenced stored file(s).")
+    return removed
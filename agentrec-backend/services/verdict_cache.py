@@ -0,0 +1,186 @@
+# agentrec-backend/services/verdict_cache.py
+# --- Imports ---
+from ..models import db, AIVerdictCache
+from ..config import Config
+from .columns import INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+import hashlib
+import logging
+import json
+
+logging.basicConfig(level=logging.INFO)
+
+CACHEABLE_STATUSES = {"Matched", "Partial Match", "Exception"}
+# Dialects with INSERT ... ON CONFLICT, used to upsert entries on cache_key
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+# Keys per IN (...) list when updating hit counters
+FLUSH_CHUNK_KEYS = 500
+
+
+def content_hash(text):
+    """ SHA-256 hex digest of a KB/prompt string. """
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def _normalize_tx(tx):
+    """ Normalizes the fields the LLM sees so equivalent pairs share one cache key. """
+    amount = tx.get(INTERNAL_AMOUNT)
+    try:
+        amount = str(Decimal(str(amount)).quantize(Decimal('0.01')))
+    except (InvalidOperation, ValueError, TypeError):
+        amount = str(amount)
+    return [
+        str(tx.get(INTERNAL_ID, '')).strip(),
+        str(tx.get(INTERNAL_DATE, '')),
+        amount,
+        ' '.join(str(tx.get(INTERNAL_DESC, '') or '').split()),
+    ]
+
+
+def invalidate_type_entries(reconciliation_type_id):
+    """ Deletes a type's cached verdicts in the current session, for when its KB or prompt changes.
+
+    The caller commits it together with the edit. Returns the number of entries deleted.
+    """
+    deleted = AIVerdictCache.query.filter_by(reconciliation_type_id=reconciliation_type_id).delete(synchronize_session=False)
+    if deleted:
+        logging.info(f"Invalidated {deleted} cached verdicts for Recon Type {reconciliation_type_id} (KB/prompt changed).")
+    return deleted
+
+
+def evict_cache_entries(max_age_days=None, max_entries=None):
+    """ Applies the age and size limits (Config defaults) across the whole cache table and commits.
+
+    Returns the number of entries deleted.
+    """
+    max_age_days = Config.AI_VERDICT_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_entries = Config.AI_VERDICT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    deleted = 0
+    try:
+        if max_age_days:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+            deleted += AIVerdictCache.query.filter(AIVerdictCache.last_used_at < cutoff).delete(synchronize_session=False)
+        if max_entries:
+            overflow_ids = db.session.query(AIVerdictCache.id).order_by(
+                AIVerdictCache.last_used_at.desc(), AIVerdictCache.id.desc()).offset(max_entries).subquery()
+            deleted += AIVerdictCache.query.filter(AIVerdictCache.id.in_(overflow_ids.select())).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error evicting verdict cache entries: {e}", exc_info=True)
+        return 0
+    if deleted:
+        logging.info(f"Verdict cache eviction removed {deleted} entries.")
+    return deleted
+
+
+class VerdictCache:
+    """ Persistent LLM verdict cache for one job's reconciliation type.
+
+    Keys combine the normalized source/target fields with the hashes of the type's
+    KB content and prompt template (plus its batch variant when batching is on),
+    so editing either one, or switching batch mode, stops old entries from
+    matching. Entries are written through a separate session so they survive a
+    failed job. Entries of an edited KB/prompt are dropped by
+    invalidate_type_entries() when the type is updated, and evict_cache_entries()
+    applies the age/size policy from Config (periodic task).
+
+    New verdicts and hit counters are buffered in memory and only written by
+    flush()/close(), after the job's own session has committed or rolled back, so
+    the cache never competes with the job for the database write lock (SQLite).
+    """
+    def __init__(self, reconciliation_type_id, kb_content_str, prompt_template_str, batch_prompt_template_str=None):
+        self.reconciliation_type_id = reconciliation_type_id
+        self.kb_hash = content_hash(kb_content_str)
+        # Batched calls use a prompt derived from the type's one, so batch mode is part of the key
+        self.prompt_hash = content_hash(prompt_template_str if batch_prompt_template_str is None
+                                        else prompt_template_str + '\0' + batch_prompt_template_str)
+        self.hits = 0
+        self.misses = 0
+        self._pending = {} # cache_key -> verdict not yet written
+        self._hit_counts = {} # cache_key -> hits not yet written
+        self._session = Session(bind=db.engine, autoflush=False) # Lookups never write
+
+    def _key(self, source_tx, target_tx):
+        payload = json.dumps([_normalize_tx(source_tx), _normalize_tx(target_tx), self.kb_hash, self.prompt_hash])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, source_tx, target_tx):
+        """ Returns a cached verdict dict for the pair, or None on a miss. """
+        key = self._key(source_tx, target_tx)
+        verdict = self._pending.get(key)
+        if verdict is None:
+            try:
+                entry = self._session.query(AIVerdictCache.verdict).filter_by(cache_key=key).first()
+                verdict = entry.verdict if entry else None
+            except Exception as e:
+                self._session.rollback()
+                logging.error(f"Verdict cache lookup failed: {e}", exc_info=True)
+        if verdict is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._hit_counts[key] = self._hit_counts.get(key, 0) + 1
+        return dict(verdict)
+
+    def put(self, source_tx, target_tx, verdict):
+        """ Buffers a successful verdict until flush(); AI errors are never cached. """
+        if verdict.get('status') not in CACHEABLE_STATUSES:
+            return
+        key = self._key(source_tx, target_tx)
+        if key not in self._pending:
+            self._pending[key] = json.loads(json.dumps(verdict, default=str))
+
+    def _upsert(self, rows):
+        """ Inserts entries, replacing any with the same cache_key (e.g. written by a concurrent job). """
+        insert = UPSERT_INSERTS.get(self._session.get_bind().dialect.name)
+        if insert is None: # No ON CONFLICT: insert only the keys not stored yet
+            stored = set()
+            keys = [row['cache_key'] for row in rows]
+            for start in range(0, len(keys), FLUSH_CHUNK_KEYS):
+                stored.update(key for key, in self._session.query(AIVerdictCache.cache_key).filter(
+                    AIVerdictCache.cache_key.in_(keys[start:start + FLUSH_CHUNK_KEYS])))
+            self._session.add_all(AIVerdictCache(**row) for row in rows if row['cache_key'] not in stored)
+            return
+        statement = insert(AIVerdictCache)
+        statement = statement.on_conflict_do_update(index_elements=[AIVerdictCache.cache_key], set_={
+            'reconciliation_type_id': statement.excluded.reconciliation_type_id, 'kb_hash': statement.excluded.kb_hash,
+            'prompt_hash': statement.excluded.prompt_hash, 'verdict': statement.excluded.verdict,
+            'last_used_at': statement.excluded.last_used_at})
+        self._session.execute(statement, rows)
+
+    def flush(self):
+        """ Writes buffered entries (upserted on cache_key) and hit counters in one commit. """
+        if not self._pending and not self._hit_counts:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            if self._pending:
+                self._upsert([{'cache_key': key, 'reconciliation_type_id': self.reconciliation_type_id, 'kb_hash': self.kb_hash,
+                               'prompt_hash': self.prompt_hash, 'verdict': verdict, 'hit_count': 0, 'created_at': now,
+                               'last_used_at': now} for key, verdict in self._pending.items()])
+            keys_by_hits = {}
+            for key, hits in self._hit_counts.items():
+                keys_by_hits.setdefault(hits, []).append(key)
+            for hits, keys in keys_by_hits.items():
+                for start in range(0, len(keys), FLUSH_CHUNK_KEYS):
+                    self._session.query(AIVerdictCache).filter(AIVerdictCache.cache_key.in_(keys[start:start + FLUSH_CHUNK_KEYS])).update(
+                        {AIVerdictCache.hit_count: AIVerdictCache.hit_count + hits, AIVerdictCache.last_used_at: now},
+                        synchronize_session=False)
+            self._session.commit()
+        except Exception as e:
+            self._session.rollback()
+            logging.error(f"Error saving verdict cache entries: {e}", exc_info=True)
+        finally:
+            self._pending, self._hit_counts = {}, {}
+
+    def close(self):
+        """ Flushes pending entries and releases the session. """
+        self.flush()
+        self._session.close()
+
+    def stats(self):
+        return {'ai_cache_hits': self.hits, 'ai_cache_misses': self.misses}
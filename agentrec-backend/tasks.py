@@ -3,7 +3,12 @@ from .celery_app import celery # Import celery instance from celery_app.py
 # Import models using relative path
 from .models import db, ReconciliationJob, JobStatus, ReconciliationType, DataSourceMapping
 # Import main processing function
-from .services.reconciliation_service import process_reconciliation
+from .services.reconciliation_service import process_reconciliation, parse_file_frame
+from .services.verdict_cache import VerdictCache, evict_cache_entries
+from .services.ai_service import batch_prompt_template
+from .services.candidate_service import resolve_candidate_params
+from .services.upload_store import collect_unreferenced_uploads
+from .config import Config
 # Import factory to create app context
 from . import create_app
 from datetime import datetime, timezone
@@ -11,9 +16,7 @@ import logging
 import os
 
 # --- Imports needed for loading KB IN THE TASK ---
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import InMemoryVectorStore # Corrected import path
+from .services.kb_index_service import get_kb_retriever, collect_unreferenced_kb_indexes # Embeds once per KB version, then loads from disk
 # --- Import Embeddings from ai_service ---
 from .services.ai_service import embeddings # Need the initialized embeddings instance
 
@@ -25,6 +28,28 @@ class ReconciliationError(Exception):
     pass
 
 
+# ingestion_stats['status'] values of upload-time parsing (ingest_job_files_task)
+INGESTION_IN_PROGRESS = ('PENDING', 'PROCESSING')
+INGESTION_FAILED = 'FAILED'
+INGESTION_COMPLETED = 'COMPLETED'
+
+
+def ingestion_error(ingestion_stats):
+    """ Why a job's files cannot be reconciled yet (ingestion queued/running or failed), or None. """
+    status = (ingestion_stats or {}).get('status')
+    if status in INGESTION_IN_PROGRESS:
+        return f"Files are still being ingested (status {status}); run the job once ingestion completes."
+    if status == INGESTION_FAILED:
+        return f"File ingestion failed: {ingestion_stats.get('error', 'unknown error')}"
+    return None
+
+
+def mapping_config_for(mapping):
+    """ Plain-dict mapping config consumed by the parsing functions. """
+    return {'id': mapping.id, 'column_mappings': mapping.column_mappings, 'date_format_string': mapping.date_format_string,
+            'reference_patterns': mapping.reference_patterns}
+
+
 # The @celery.task decorator uses the imported instance
 @celery.task(bind=True, name='tasks.run_reconciliation_task', throws=(ReconciliationError,)) # Define expected exception
 def run_reconciliation_task(self, job_id):
@@ -49,12 +74,20 @@ def run_reconciliation_task(self, job_id):
                  raise ReconciliationError(f"Reconciliation Type missing for Job {job_id}.")
             if not job.source_mapping or not job.target_mapping:
                  raise ReconciliationError(f"Mappings missing for Job {job_id}.")
+            # Upload-time parsing must be done: its artifacts are what this run loads
+            ingestion_problem = ingestion_error(job.ingestion_stats)
+            if ingestion_problem:
+                 raise ReconciliationError(ingestion_problem)
 
             # --- Load Type-Specific Config from DB ---
             recon_type = job.reconciliation_type
-            source_map_config = {'id': job.source_mapping.id, 'column_mappings': job.source_mapping.column_mappings, 'date_format_string': job.source_mapping.date_format_string}
-            target_map_config = {'id': job.target_mapping.id, 'column_mappings': job.target_mapping.column_mappings, 'date_format_string': job.target_mapping.date_format_string}
+            source_map_config = mapping_config_for(job.source_mapping)
+            target_map_config = mapping_config_for(job.target_mapping)
             candidate_strategy = recon_type.candidate_selection_strategy
+            try:
+                candidate_params = resolve_candidate_params(candidate_strategy, recon_type.candidate_strategy_params)
+            except ValueError as e_strategy:
+                raise ReconciliationError(f"Invalid candidate strategy for Recon Type {recon_type.id}: {e_strategy}")
             kb_content_str = recon_type.knowledge_base_content # Get KB content string
             prompt_template_str = recon_type.ai_prompt_template # Get prompt string
             # ---
@@ -67,13 +100,8 @@ def run_reconciliation_task(self, job_id):
                  raise ReconciliationError(f"KB content missing for Recon Type {recon_type.id}")
 
             try:
-                logging.info(f"Initializing KB Retriever from content for Job {job_id}...")
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-                docs = text_splitter.create_documents([kb_content_str])
-                if not docs: raise ValueError("KB content generated no documents.")
-                logging.info(f"Splitting KB content into {len(docs)} documents for Job {job_id}.")
-                vectorstore = InMemoryVectorStore.from_documents(docs, embeddings)
-                kb_retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+                logging.info(f"Initializing KB Retriever for Job {job_id}...")
+                kb_retriever = get_kb_retriever(recon_type.id, kb_content_str)
                 logging.info(f"KB Retriever initialized for Job {job_id}.")
             except Exception as e_kb:
                 logging.error(f"Error initializing KB Retriever for job {job_id}: {e_kb}", exc_info=True)
@@ -85,6 +113,11 @@ def run_reconciliation_task(self, job_id):
                 raise ReconciliationError(f"Invalid Prompt Template for Recon Type {recon_type.id}")
             # ---
 
+            # --- Verdict Cache (keyed by this type's KB/prompt hashes, and the batch prompt when batching) ---
+            batch_prompt_str = batch_prompt_template(prompt_template_str) if Config.AI_BATCH_MAX_SIZE > 1 else None
+            verdict_cache = VerdictCache(recon_type.id, kb_content_str, prompt_template_str, batch_prompt_str) if Config.AI_VERDICT_CACHE_ENABLED else None
+            # ---
+
             # --- Update Job Status to Processing ---
             job.status = JobStatus.PROCESSING
             job.celery_task_id = self.request.id # Store Celery task ID
@@ -103,7 +136,12 @@ def run_reconciliation_task(self, job_id):
                 target_map_config=target_map_config,
                 kb_retriever=kb_retriever,
                 prompt_template_str=prompt_template_str,
-                candidate_strategy=candidate_strategy
+                candidate_strategy=candidate_strategy,
+                candidate_params=candidate_params,
+                verdict_cache=verdict_cache,
+                max_concurrency=recon_type.ai_max_concurrency,
+                # Completed ingestion persisted the parsed files whatever PARSED_FILE_CACHE_ENABLED says
+                use_parsed_cache=True if (job.ingestion_stats or {}).get('status') == INGESTION_COMPLETED else None
             )
             # ---
 
@@ -141,4 +179,73 @@ def run_reconciliation_task(self, job_id):
                  logging.error(f"Job {job_id} not found after error, cannot mark as FAILED.")
 
             # Re-raise the exception to make Celery aware the task failed
-            raise e
\ No newline at end of file
+            raise e
+
+
+@celery.task(bind=True, name='tasks.ingest_job_files_task')
+def ingest_job_files_task(self, job_id):
+    """Parses and normalizes a job's uploaded files right after upload.
+
+    Always leaves the parsed-file cache entries the run will load (even with
+    PARSED_FILE_CACHE_ENABLED off), and records row counts, dropped rows, parse
+    timings (or the mapping/parse error) on job.ingestion_stats.
+    """
+    app = create_app()
+    with app.app_context():
+        job = ReconciliationJob.query.options(
+            db.joinedload(ReconciliationJob.source_mapping),
+            db.joinedload(ReconciliationJob.target_mapping)
+        ).get(job_id)
+        if not job:
+            logging.error(f"Ingestion: Job {job_id} not found in database.")
+            return None
+
+        job.ingestion_stats = {'status': 'PROCESSING'}
+        db.session.commit()
+
+        ingestion_stats = {'status': INGESTION_COMPLETED}
+        started = datetime.now(timezone.utc)
+        try:
+            if not job.source_mapping or not job.target_mapping:
+                raise ReconciliationError(f"Mappings missing for Job {job_id}.")
+            for side, file_path, mapping in (('source', job.source_file, job.source_mapping),
+                                             ('target', job.target_file, job.target_mapping)):
+                file_stats = {}
+                parse_file_frame(file_path, mapping_config_for(mapping), stats=file_stats, use_cache=True)
+                ingestion_stats[side] = file_stats
+        except Exception as e:
+            logging.error(f"Ingestion failed for Job ID {job_id}: {e}", exc_info=True)
+            ingestion_stats.update(status=INGESTION_FAILED, error=f"{type(e).__name__}: {e}")
+
+        ingestion_stats['completed_at'] = datetime.now(timezone.utc).isoformat()
+        ingestion_stats['total_seconds'] = round((datetime.now(timezone.utc) - started).total_seconds(), 3)
+        job = ReconciliationJob.query.get(job_id) # Re-fetch in case the job changed meanwhile
+        if job:
+            job.ingestion_stats = ingestion_stats
+            db.session.commit()
+        logging.info(f"Ingestion for Job ID {job_id} finished: {ingestion_stats}")
+        return ingestion_stats
+
+
+@celery.task(name='tasks.collect_upload_garbage_task')
+def collect_upload_garbage_task():
+    """Deletes stored uploads no job references any more (schedule with celery beat)."""
+    app = create_app()
+    with app.app_context():
+        return collect_unreferenced_uploads()
+
+
+@celery.task(name='tasks.evict_verdict_cache_task')
+def evict_verdict_cache_task():
+    """Applies the AI verdict cache age/size limits (schedule with celery beat)."""
+    app = create_app()
+    with app.app_context():
+        return evict_cache_entries()
+
+
+@celery.task(name='tasks.collect_kb_index_garbage_task')
+def collect_kb_index_garbage_task():
+    """Deletes stored KB vectors of versions no type uses any more (schedule with celery beat)."""
+    app = create_app()
+    with app.app_context():
+        return collect_unreferenced_kb_indexes()
@@ -0,0 +1,95 @@
+# agentrec-backend/utils/parsers.py
+# --- Imports ---
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import csv
+import io
+
+CENTS_PER_UNIT = 100
+
+# Currency symbol and thousands separators, dropped anywhere in a cell (as in the text path)
+_AMOUNT_STRIP = b'$,'
+# '(' -> '-' and ')' / whitespace dropped, in one C-level pass; only trusted for cells shaped '(...)' or free of these bytes
+_AMOUNT_TRANSLATION = bytes.maketrans(b'(', b'-')
+_AMOUNT_DELETE = b') \t\r'
+_AMOUNT_SPECIAL = np.frombuffer(b'() \t\r', dtype=np.uint8)
+
+
+def _to_cents(values):
+    """ float64 amounts -> (int64 cents, valid mask); exact for 2-decimal amounts below ~9e13. """
+    values = np.asarray(values, dtype='float64')
+    valid = np.isfinite(values)
+    cents = np.zeros(len(values), dtype=np.int64)
+    cents[valid] = np.round(values[valid] * CENTS_PER_UNIT)
+    return cents, valid
+
+
+def _parse_amount_text(series):
+    """ General (slower) string path: pandas string cleaning + to_numeric. """
+    text = series.astype('string').str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    negative = (text.str.startswith('(') & text.str.endswith(')')).fillna(False)
+    text = text.mask(negative, '-' + text.str.slice(1, -1))
+    return pd.to_numeric(text, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _irregular_cells(raw, breaks, count):
+    """ Mask of cells holding whitespace or parentheses in any form other than one wrapping '(...)'. """
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(raw)]))
+    special = np.flatnonzero(np.isin(raw, _AMOUNT_SPECIAL))
+    counts = np.bincount(np.searchsorted(breaks, special), minlength=count)
+    padded = np.append(raw, 0) # Empty last cell: starts[-1] == len(raw)
+    wrapped = (ends - starts >= 2) & (padded[starts] == ord('(')) & (padded[np.maximum(ends - 1, 0)] == ord(')'))
+    return (counts > 0) & ~(wrapped & (counts == 2))
+
+
+def _parse_amount_buffer(cells):
+    """ Fast path: cleans all cells as one byte buffer and lets the C CSV parser read the numbers.
+
+    Cells the byte translation could misread (padding, inner spaces, stray or
+    partial parentheses) are re-parsed by the text path, so both give the same
+    result. Returns None when the buffer cannot be used (non-ASCII text or
+    embedded line breaks).
+    """
+    joined = '\n'.join(cells)
+    if joined.count('\n') != len(cells) - 1:
+        return None
+    try:
+        buffer = joined.encode('ascii').translate(None, _AMOUNT_STRIP)
+    except UnicodeEncodeError:
+        return None
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    irregular = _irregular_cells(raw, np.flatnonzero(raw == ord('\n')), len(cells))
+    column = pd.read_csv(io.BytesIO(buffer.translate(_AMOUNT_TRANSLATION, _AMOUNT_DELETE)), header=None, names=['amount'],
+                         skip_blank_lines=False, quoting=csv.QUOTE_NONE, engine='c')['amount']
+    if len(column) != len(cells) or pd.api.types.is_bool_dtype(column): # All-'True'/'False' columns read as booleans
+        return None
+    values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan, copy=True)
+    if irregular.any():
+        values[irregular] = _parse_amount_text(pd.Series(cells[irregular]))
+    return values
+
+
+def parse_amount_cents(series):
+    """ Vectorized amount cleaning into int64 minor units (cents).
+
+    Strips '$', thousands separators and surrounding whitespace, and reads values
+    wrapped in parentheses as negatives ('(1,234.50)' -> -123450). Blank or
+    unparsable cells (inner spaces, unbalanced parentheses) come back as <NA> in
+    the returned nullable Int64 series.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+    else:
+        cells = series.fillna('').astype(str).to_numpy(dtype=object)
+        values = _parse_amount_buffer(cells) if len(cells) else np.empty(0)
+        if values is None:
+            values = _parse_amount_text(series)
+    cents, valid = _to_cents(values)
+    return pd.Series(pd.arrays.IntegerArray(cents, ~valid), index=series.index)
+
+
+def cents_to_decimal(cents):
+    """ int minor units -> Decimal with two places (12345 -> Decimal('123.45')). """
+    return Decimal(int(cents)).scaleb(-2)
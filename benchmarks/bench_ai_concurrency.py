@@ -0,0 +1,39 @@
+# benchmarks/bench_ai_concurrency.py
+# Job wall time with sequential versus concurrent AI evaluation. Each mock LLM call sleeps for
+# --latency seconds; the results of every concurrency level must equal the sequential ones.
+#
+#   python benchmarks/bench_ai_concurrency.py [--rows 300] [--latency 0.01] [--concurrency 1 4 8 16]
+# --- Imports ---
+from common import MockLLMEvaluator, create_benchmark_app, random_rows, run_job, write_csv
+import argparse
+import logging
+import os
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs. concurrent AI evaluation with a mock LLM")
+    parser.add_argument('--rows', type=int, default=300, help="source and target rows")
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds per mock LLM call")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16], help="AI_MAX_CONCURRENCY values to run")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source_path, target_path = os.path.join(workdir, 'source.csv'), os.path.join(workdir, 'target.csv')
+        write_csv(source_path, random_rows(args.rows, 1, 'S'))
+        write_csv(target_path, random_rows(args.rows, 2, 'T'))
+        app = create_benchmark_app(workdir)
+        MockLLMEvaluator.latency = args.latency
+
+        baseline = None
+        for concurrency in args.concurrency:
+            summary, results, seconds = run_job(app, source_path, target_path, max_concurrency=concurrency)
+            baseline = baseline or (results, seconds)
+            print(f"concurrency {concurrency:>3}: {seconds:6.2f}s ({baseline[1] / seconds:4.1f}x)  "
+                  f"LLM pairs {summary['ai_evaluated_pairs']}, discarded {summary['ai_discarded_evaluations']}, "
+                  f"same results: {results == baseline[0]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_evaluator_chain.py
+# Per-call cost of building the RAG chain for every pair (get_reconciliation_status) versus
+# reusing one job-scoped ReconciliationEvaluator. A fake chat model and a one-document
+# retriever stand in for Azure OpenAI and the KB, so only chain construction and invocation
+# overhead is measured.
+#
+#   python benchmarks/bench_evaluator_chain.py [--calls 300]
+# --- Imports ---
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+import argparse
+import importlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ai_service = importlib.import_module('agentrec-backend.services.ai_service')
+
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'agentrec-backend', 'static', 'prompts', 'prompt_bank_gl.txt')
+FAKE_VERDICT = '{"status": "Matched", "exception_type": null, "reason": "Amounts and dates agree."}'
+
+
+class StaticRetriever(BaseRetriever):
+    """ Returns the same KB rule for every query. """
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="Rule KB-1: identical amounts within 3 days match.")]
+
+
+def _per_call_ms(function, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG chain construction: per call vs. once per job")
+    parser.add_argument('--calls', type=int, default=300, help="evaluations timed per variant")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    ai_service.llm = FakeListChatModel(responses=[FAKE_VERDICT])
+    ai_service.embeddings = object() # Only checked for presence; the retriever is fake
+    with open(PROMPT_PATH, encoding='utf-8') as f:
+        prompt_template = f.read()
+    retriever = StaticRetriever()
+    source = {ai_service.INTERNAL_ID: 'S-1', ai_service.INTERNAL_DATE: '2024-07-01',
+              ai_service.INTERNAL_AMOUNT: '125.00', ai_service.INTERNAL_DESC: 'Payment ACME INV#4471'}
+    target = dict(source, **{ai_service.INTERNAL_ID: 'T-1', ai_service.INTERNAL_DESC: 'acme inv 4471'})
+
+    evaluator = ai_service.ReconciliationEvaluator(retriever, prompt_template)
+    assert evaluator.evaluate(source, target)['status'] == 'Matched'
+    rebuilt = _per_call_ms(lambda: ai_service.get_reconciliation_status(source, target, retriever, prompt_template), args.calls)
+    reused = _per_call_ms(lambda: evaluator.evaluate(source, target), args.calls)
+    print(f"{args.calls} calls: chain rebuilt per call {rebuilt:.2f} ms, job-scoped evaluator {reused:.2f} ms "
+          f"({rebuilt / reused:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_excel_ingest.py
+# .xlsx ingestion time and peak memory: pd.read_excel versus the streaming reader
+# (EXCEL_STREAMING_INGEST). Each mode parses the same generated workbook in its own process,
+# so peak RSS is measured per mode; the parsed rows must be equal.
+#
+#   python benchmarks/bench_excel_ingest.py [--rows 200000] [--workbook path.xlsx]
+# --- Imports ---
+import pandas as pd
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('read_excel', 'stream')
+MAPPING = {'id': 1, 'date_format_string': '%Y-%m-%d',
+           'column_mappings': {'transaction_id': 'internal_id', 'date': 'internal_date',
+                               'description': 'internal_description', 'amount': 'internal_amount'}}
+
+
+def write_workbook(path, rows):
+    """ ERP-style export: the four mapped columns plus four unmapped memo columns. """
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['transaction_id', 'date', 'description', 'amount', 'memo1', 'memo2', 'memo3', 'memo4'])
+    rng = random.Random(1)
+    for k in range(rows):
+        sheet.append([100000 + k, datetime.datetime(2024, 7, rng.randint(1, 28)), f'Payment {rng.randint(1, 500)}',
+                      rng.randint(-300000, 300000) / 100, 'lorem ipsum dolor', 'x' * 20, rng.random(), 'y'])
+    workbook.save(path)
+
+
+def measure(mode, workbook_path, frame_path):
+    """ Child process: parse the workbook in one mode and print its timings as JSON. """
+    sys.path.insert(0, ROOT)
+    config = importlib.import_module('agentrec-backend.config')
+    reconciliation_service = importlib.import_module('agentrec-backend.services.reconciliation_service')
+    logging.disable(logging.CRITICAL)
+    config.Config.PARSED_FILE_CACHE_ENABLED = False
+    config.Config.INGEST_FOLDER = os.path.dirname(frame_path)
+    config.Config.EXCEL_STREAMING_INGEST = mode == 'stream'
+    started = time.perf_counter()
+    frame = reconciliation_service.parse_file_frame(workbook_path, MAPPING)
+    seconds = time.perf_counter() - started
+    frame.to_pickle(frame_path)
+    print(json.dumps({'rows': len(frame), 'seconds': seconds,
+                      'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024}))
+
+
+def _comparable(frame_path):
+    """ A pickled parsed frame with datetime64 dates (the streaming path loads them from Arrow as such). """
+    frame = pd.read_pickle(frame_path)
+    return frame.assign(internal_date=pd.to_datetime(frame['internal_date']).astype('datetime64[ns]'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=".xlsx ingestion: pd.read_excel vs. streaming reader")
+    parser.add_argument('--rows', type=int, default=200000, help="rows in the generated workbook")
+    parser.add_argument('--workbook', help="existing .xlsx to parse instead (same column names)")
+    parser.add_argument('--measure', nargs=3, metavar=('MODE', 'WORKBOOK', 'FRAME'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workbook_path = args.workbook
+        if not workbook_path:
+            workbook_path = os.path.join(workdir, f'bench_{args.rows}.xlsx')
+            write_workbook(workbook_path, args.rows)
+        frames = {}
+        for mode in MODES:
+            frames[mode] = os.path.join(workdir, f'{mode}.pkl')
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', mode, workbook_path, frames[mode]],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>10}: {result['rows']} rows in {result['seconds']:6.1f}s, peak RSS {result['peak_rss_mb']} MB")
+        print("same rows:", _comparable(frames['read_excel']).equals(_comparable(frames['stream'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/common.py
+# Shared setup for the end-to-end benchmarks: a throwaway SQLite app, generated CSV files and a
+# mock LLM evaluator standing in for ReconciliationEvaluator, so whole jobs run without Azure,
+# Ollama, Redis or PostgreSQL.
+# --- Imports ---
+from datetime import date, timedelta
+import importlib
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+backend = importlib.import_module('agentrec-backend')
+config = importlib.import_module('agentrec-backend.config')
+models = importlib.import_module('agentrec-backend.models')
+reconciliation_service = importlib.import_module('agentrec-backend.services.reconciliation_service')
+
+CSV_HEADER = 'transaction_id,date,description,amount\n'
+MAPPING = {'id': 1, 'date_format_string': '%Y-%m-%d',
+           'column_mappings': {'transaction_id': 'internal_id', 'date': 'internal_date',
+                               'description': 'internal_description', 'amount': 'internal_amount'}}
+BASE_DATE = date(2024, 7, 1)
+
+
+class MockLLMEvaluator:
+    """ ReconciliationEvaluator stand-in: sleeps `latency` seconds per call (the LLM round trip),
+    then judges the pair on its amounts alone. """
+    latency = 0.0
+
+    def __init__(self, kb_retriever=None, prompt_template_str=None):
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock: self.llm_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _judge(source_tx, target_tx):
+        difference = abs(source_tx['internal_amount'] - target_tx['internal_amount'])
+        if difference < 1:
+            return {'status': 'Matched', 'exception_type': None, 'reason': 'Amounts agree.'}
+        if difference < 30:
+            return {'status': 'Partial Match', 'exception_type': 'Amount Tolerance', 'reason': 'Amounts are close.'}
+        return {'status': 'Exception', 'exception_type': 'Amount Mismatch', 'reason': 'Amounts differ.'}
+
+    def evaluate(self, source_tx, target_tx):
+        self._call()
+        return self._judge(source_tx, target_tx)
+
+    def evaluate_batch(self, source_tx, target_txs):
+        self._call()
+        return [self._judge(source_tx, target_tx) for target_tx in target_txs]
+
+    def stats(self):
+        return {'ai_llm_calls': self.llm_calls}
+
+
+def write_csv(path, rows):
+    """ rows: (transaction_id, day offset from BASE_DATE, description, amount in cents). """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(CSV_HEADER)
+        for transaction_id, offset, description, cents in rows:
+            f.write(f'{transaction_id},{BASE_DATE + timedelta(days=offset)},"{description}",{cents / 100:.2f}\n')
+
+
+def random_rows(count, seed, prefix):
+    """ Loosely similar transactions: many share a date and land within a few units of each other. """
+    rng = random.Random(seed)
+    return [(f'{prefix}-{k}', rng.randint(0, 27), f'Payment {rng.choice("ABCD")} INV#{rng.randint(1, 50)}',
+             rng.randint(-300000, 300000)) for k in range(count)]
+
+
+def create_benchmark_app(workdir):
+    """ App bound to a fresh SQLite database in workdir, seeded with one type and one mapping. """
+    class BenchmarkConfig(config.Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+        UPLOAD_FOLDER = workdir
+
+    app = backend.create_app(BenchmarkConfig)
+    with app.app_context():
+        models.db.create_all()
+        models.db.session.add(models.ReconciliationType(id=1, name='benchmark', knowledge_base_content='-', ai_prompt_template='-'))
+        models.db.session.add(models.DataSourceMapping(id=1, mapping_name='benchmark', source_type=models.MappingSourceType.SOURCE,
+                                                       column_mappings=MAPPING['column_mappings'], date_format_string='%Y-%m-%d'))
+        models.db.session.commit()
+    return app
+
+
+def run_job(app, source_path, target_path, **kwargs):
+    """ Runs process_reconciliation as a new job with MockLLMEvaluator.
+
+    Returns (summary, {display_id: (status, matched target id)}, wall seconds).
+    """
+    reconciliation_service.ReconciliationEvaluator = MockLLMEvaluator
+    with app.app_context():
+        job = models.ReconciliationJob(reconciliation_type_id=1, source_file=source_path, target_file=target_path,
+                                       source_mapping_id=1, target_mapping_id=1)
+        models.db.session.add(job)
+        models.db.session.commit()
+        started = time.perf_counter()
+        summary = reconciliation_service.process_reconciliation(job.id, source_path, target_path, MAPPING, MAPPING,
+                                                                None, '-', **kwargs)['summary']
+        seconds = time.perf_counter() - started
+        items = models.ReconciliationResultItem.query.filter_by(job_id=job.id).all()
+        results = {item.display_id: (item.status, (item.details or {}).get('target_internal_id')) for item in items}
+    return summary, results, seconds
@@ -0,0 +1,32 @@
+# tests/conftest.py
+# Tests import the backend as the 'agentrec-backend' package, the same path the Celery worker uses
+# (agentrec-backend.celery_app), so the modules' relative imports resolve as in production.
+import importlib
+import os
+import pytest
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """ Backend app on a fresh SQLite database, with uploads under tmp_path. """
+    backend = importlib.import_module('agentrec-backend')
+    config = importlib.import_module('agentrec-backend.config')
+
+    class TestConfig(config.Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+
+    app = backend.create_app(TestConfig)
+    with app.app_context():
+        backend.db.create_all()
+        yield app
+        backend.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
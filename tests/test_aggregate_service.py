@@ -0,0 +1,87 @@
+# tests/test_aggregate_service.py
+# --- Imports ---
+from datetime import date, timedelta
+from itertools import combinations
+import importlib
+import numpy as np
+import pandas as pd
+import random
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+aggregate_service = importlib.import_module('agentrec-backend.services.aggregate_service')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+find_aggregate_matches, best_subset = aggregate_service.find_aggregate_matches, aggregate_service.best_subset
+TransactionSet = transaction_set.TransactionSet
+
+BASE_DATE = date(2024, 7, 15)
+DATE_WINDOW_DAYS = 3
+
+
+def _transaction_set(rows, prefix):
+    """ TransactionSet from (day offset, cents) pairs. """
+    return TransactionSet(pd.DataFrame({
+        columns.INTERNAL_ID: [f"{prefix}-{k}" for k in range(len(rows))],
+        columns.INTERNAL_DATE: [BASE_DATE + timedelta(days=offset) for offset, _ in rows],
+        columns.INTERNAL_DESC: [f"Payment {k}" for k in range(len(rows))],
+        columns.INTERNAL_AMOUNT_CENTS: [cents for _, cents in rows],
+    }))
+
+
+def _groups(source_rows, target_rows, amount_tolerance=0, max_group_size=4):
+    sources, targets = _transaction_set(source_rows, 'S'), _transaction_set(target_rows, 'T')
+    return find_aggregate_matches(sources, range(len(sources)), targets, range(len(targets)),
+                                  DATE_WINDOW_DAYS, amount_tolerance, max_group_size)
+
+
+def test_batch_deposit_against_two_targets():
+    assert _groups([(0, 30000)], [(0, 10000), (1, 20000), (0, 55000)]) == [([0], [0, 1], 0)]
+
+
+def test_batch_deposit_against_three_targets():
+    groups = _groups([(0, 60000)], [(-1, 10000), (0, 20000), (2, 30000), (0, 90000)])
+    assert groups == [([0], [0, 1, 2], 0)]
+
+
+def test_split_payment_groups_sources_against_one_target():
+    groups = _groups([(0, 20000), (1, 30000), (0, 7000)], [(0, 50000)])
+    assert groups == [([0, 1], [0], 0)]
+
+
+def test_negative_amounts_group_by_sign():
+    # A refund of -300.00 cannot be made of a +100.00 and a -400.00 row
+    assert _groups([(0, -30000)], [(0, 10000), (0, -40000), (0, -10000), (0, -20000)]) == [([0], [2, 3], 0)]
+
+
+def test_ambiguous_sum_is_rejected():
+    # 100 + 200 and 50 + 250 both make 300.00
+    assert _groups([(0, 30000)], [(0, 10000), (0, 20000), (0, 5000), (0, 25000)]) == []
+
+
+def test_members_outside_the_date_window_are_not_grouped():
+    assert _groups([(0, 30000)], [(0, 10000), (DATE_WINDOW_DAYS + 1, 20000)]) == []
+    assert _groups([(0, 30000)], [(0, 10000), (DATE_WINDOW_DAYS, 20000)]) == [([0], [0, 1], 0)]
+
+
+def test_tolerance_accepts_close_sums_and_reports_the_difference():
+    assert _groups([(0, 30000)], [(0, 10000), (0, 20005)]) == []
+    assert _groups([(0, 30000)], [(0, 10000), (0, 20005)], amount_tolerance=0.05) == [([0], [0, 1], 5)]
+
+
+def test_grouped_members_are_consumed():
+    # T-1 lies in both sources' windows; once S-0 takes it, S-1's otherwise ambiguous sum has a single fit
+    groups = _groups([(0, 30000), (5, 30000)], [(0, 10000), (2, 20000), (5, 10000), (6, 20000)])
+    assert groups == [([0], [0, 1], 0), ([1], [2, 3], 0)]
+
+
+def test_best_subset_matches_brute_force():
+    rng = random.Random(17)
+    for _ in range(300):
+        amounts = np.array([rng.randint(1, 40) for _ in range(rng.randint(2, 9))], dtype=np.int64)
+        need, tolerance, max_group_size = rng.randint(2, 90), rng.choice([0, 0, 1, 2]), rng.randint(2, 5)
+        fits = [subset for size in range(2, max_group_size + 1) for subset in combinations(range(len(amounts)), size)
+                if abs(int(amounts[list(subset)].sum()) - need) <= tolerance]
+        positions = best_subset(amounts, need, tolerance, max_group_size)
+        if len(fits) == 1:
+            assert sorted(positions.tolist()) == list(fits[0])
+        else:
+            assert positions is None
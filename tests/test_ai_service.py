@@ -0,0 +1,152 @@
+# tests/test_ai_service.py
+# --- Imports ---
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+import importlib
+import json
+import os
+import pytest
+
+ai_service = importlib.import_module('agentrec-backend.services.ai_service')
+INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC = (
+    ai_service.INTERNAL_ID, ai_service.INTERNAL_DATE, ai_service.INTERNAL_AMOUNT, ai_service.INTERNAL_DESC)
+
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'agentrec-backend', 'static', 'prompts', 'prompt_bank_gl.txt')
+SOURCE = {INTERNAL_ID: 'S-1', INTERNAL_DATE: '2024-07-01', INTERNAL_AMOUNT: '125.00', INTERNAL_DESC: 'Payment ACME INV#4471'}
+TARGETS = [dict(SOURCE, **{INTERNAL_ID: f"T-{n}", INTERNAL_DESC: f"acme inv {4470 + n}"}) for n in range(3)]
+
+
+class StaticRetriever(BaseRetriever):
+    """ Returns the same KB rule for every query. """
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="Rule KB-1: identical amounts within 3 days match.")]
+
+
+class RecordingRetriever(BaseRetriever):
+    """ Returns one rule per query and records the queries it was asked (i.e. cache misses). """
+    queries: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self.queries.append(query)
+        return [Document(page_content=f"Rule for {query}")]
+
+
+def _verdict(status, **extra):
+    return dict({'status': status, 'exception_type': None if status == 'Matched' else 'Amount Mismatch', 'reason': 'Rule KB-1.'}, **extra)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """ Chat model answering from a list of JSON responses; records every rendered prompt. """
+    class FakeLLM:
+        responses, prompts = [], []
+
+    def answer(prompt_value):
+        FakeLLM.prompts.append(prompt_value.to_string())
+        response = FakeLLM.responses.pop(0)
+        return AIMessage(content=response if isinstance(response, str) else json.dumps(response))
+
+    monkeypatch.setattr(ai_service, 'llm', RunnableLambda(answer))
+    monkeypatch.setattr(ai_service, 'embeddings', object()) # Only checked for presence; the retriever is fake
+    return FakeLLM
+
+
+@pytest.fixture
+def evaluator(fake_llm):
+    with open(PROMPT_PATH, encoding='utf-8') as f:
+        return ai_service.ReconciliationEvaluator(StaticRetriever(), f.read())
+
+
+def test_batch_prompt_is_derived_from_the_type_prompt(evaluator, fake_llm):
+    fake_llm.responses = [{'verdicts': [_verdict('Exception', candidate_index=n) for n in range(3)]}]
+    evaluator.evaluate_batch(SOURCE, TARGETS)
+    prompt = fake_llm.prompts[0]
+    assert 'General Ledger (ERP) Transaction (Target)' in prompt # The type's own wording and instructions
+    assert 'Rule KB-BG-004' in prompt and 'Rule KB-1: identical amounts' in prompt
+    assert 'Description: {Payment ACME INV#4471}' in prompt
+    assert 'Description: {see description of each candidate below}' in prompt
+    assert '[2] ID: T-2 | Date: 2024-07-01 | Amount: 125.00 | Description: acme inv 4472' in prompt
+    assert 'candidate_index' in prompt and prompt.count('**Analysis Result (JSON Object Only):**') == 1
+
+
+def test_batch_prompt_template_keeps_escaped_braces():
+    template = ai_service.batch_prompt_template("{{internal_id_target}} {{{internal_id_target}}} {internal_amount_target}\n{format_instructions}")
+    assert template.startswith("{{internal_id_target}} {{see id of each candidate below}} see amount of each candidate below\n")
+    assert template.endswith(ai_service.BATCH_PROMPT_SECTION)
+
+
+def test_batch_response_is_mapped_by_candidate_index(evaluator, fake_llm):
+    fake_llm.responses = [{'verdicts': [_verdict('Matched', candidate_index=2), _verdict('Exception', candidate_index=0),
+                                        _verdict('Partial Match', candidate_index=1)]}]
+    verdicts = evaluator.evaluate_batch(SOURCE, TARGETS)
+    assert [verdict['status'] for verdict in verdicts] == ['Exception', 'Partial Match', 'Matched']
+    assert verdicts[2]['exception_type'] is None and 'candidate_index' not in verdicts[2]
+    assert evaluator.stats()['ai_llm_calls'] == 1 and evaluator.stats()['ai_batch_fallbacks'] == 0
+
+
+def test_skipped_or_invalid_candidates_fall_back_to_single_pair_calls(evaluator, fake_llm):
+    fake_llm.responses = [
+        {'verdicts': [_verdict('Exception', candidate_index=0), _verdict('Matched', candidate_index=0), # Duplicate index
+                      _verdict('Matched', candidate_index=7), {'candidate_index': 2, 'reason': 'no status'}]},
+        _verdict('Matched'), _verdict('Partial Match'), # Single-pair calls for candidates 1 and 2
+    ]
+    verdicts = evaluator.evaluate_batch(SOURCE, TARGETS)
+    assert [verdict['status'] for verdict in verdicts] == ['Exception', 'Matched', 'Partial Match']
+    assert 'T-1' in fake_llm.prompts[1] and 'T-2' in fake_llm.prompts[2]
+    assert evaluator.stats()['ai_llm_calls'] == 3 and evaluator.stats()['ai_batch_fallbacks'] == 1
+
+
+def test_unparsable_batch_response_falls_back_for_every_candidate(evaluator, fake_llm):
+    fake_llm.responses = ['I think they all match.', _verdict('Matched'), _verdict('Exception'), _verdict('Exception')]
+    verdicts = evaluator.evaluate_batch(SOURCE, TARGETS)
+    assert [verdict['status'] for verdict in verdicts] == ['Matched', 'Exception', 'Exception']
+    assert evaluator.stats()['ai_llm_calls'] == 4 and evaluator.stats()['ai_batch_fallbacks'] == 1
+
+
+def test_single_candidate_uses_the_single_pair_prompt(evaluator, fake_llm):
+    fake_llm.responses = [_verdict('Matched')]
+    assert evaluator.evaluate_batch(SOURCE, TARGETS[:1])[0]['status'] == 'Matched'
+    assert 'Description: {acme inv 4470}' in fake_llm.prompts[0] and 'candidate_index' not in fake_llm.prompts[0]
+
+
+def test_context_is_memoized_per_normalized_description(fake_llm):
+    retriever = RecordingRetriever()
+    evaluator = ai_service.ReconciliationEvaluator(retriever, "{context}\n{format_instructions}")
+    assert evaluator.retrieve_context('ACME  Wire') == 'Rule for acme wire'
+    assert evaluator.retrieve_context(' acme wire\n') == evaluator.retrieve_context('ACME\tWIRE') == 'Rule for acme wire'
+    assert evaluator.retrieve_context('Bank fee') == 'Rule for bank fee'
+    assert retriever.queries == ['acme wire', 'bank fee'] # Case and whitespace variants share one retrieval
+    stats = evaluator.stats()
+    assert (stats['kb_context_cache_hits'], stats['kb_context_cache_misses'], stats['kb_context_cache_hit_rate']) == (2, 2, 0.5)
+
+
+def test_pair_evaluations_share_context_retrievals(fake_llm):
+    retriever = RecordingRetriever()
+    with open(PROMPT_PATH, encoding='utf-8') as f:
+        evaluator = ai_service.ReconciliationEvaluator(retriever, f.read())
+    fake_llm.responses = [_verdict('Matched'), _verdict('Exception'), _verdict('Exception')]
+    evaluator.evaluate(SOURCE, dict(TARGETS[0], **{INTERNAL_DESC: 'ACME inv 4470'}))
+    evaluator.evaluate(dict(SOURCE, **{INTERNAL_DESC: 'payment  acme inv#4471'}), TARGETS[0])
+    evaluator.evaluate(SOURCE, TARGETS[1])
+    assert retriever.queries == ['payment acme inv#4471 acme inv 4470', 'payment acme inv#4471 acme inv 4471']
+    assert 'Rule for payment acme inv#4471 acme inv 4470' in fake_llm.prompts[1]
+    stats = evaluator.stats()
+    assert (stats['kb_context_cache_hits'], stats['kb_context_cache_misses'], stats['kb_context_cache_hit_rate']) == (1, 2, 0.3333)
+
+
+def test_context_memo_is_bounded(fake_llm, monkeypatch):
+    monkeypatch.setattr(ai_service.Config, 'KB_CONTEXT_CACHE_SIZE', 2)
+    retriever = RecordingRetriever()
+    evaluator = ai_service.ReconciliationEvaluator(retriever, "{context}\n{format_instructions}")
+    for query in ('a', 'b', 'a', 'c', 'b'): # 'b' is least recently used when 'c' arrives
+        evaluator.retrieve_context(query)
+    assert retriever.queries == ['a', 'b', 'c', 'b']
+    assert evaluator.stats()['kb_context_cache_hits'] == 1 and evaluator.stats()['kb_context_cache_misses'] == 4
+
+
+def test_stats_without_lookups(fake_llm):
+    stats = ai_service.ReconciliationEvaluator(RecordingRetriever(), "{context}\n{format_instructions}").stats()
+    assert stats['kb_context_cache_hit_rate'] == 0.0 and stats['kb_context_cache_misses'] == 0
@@ -0,0 +1,123 @@
+# tests/test_assignment_service.py
+# --- Imports ---
+import importlib
+import itertools
+import numpy as np
+import random
+
+assignment_service = importlib.import_module('agentrec-backend.services.assignment_service')
+connected_components, optimal_assignment = assignment_service.connected_components, assignment_service.optimal_assignment
+
+
+def _brute_min_cost(cost):
+    """ Lowest total cost over every injective row -> column assignment. """
+    rows, cols = cost.shape
+    return min(sum(cost[row, col] for row, col in enumerate(perm)) for perm in itertools.permutations(range(cols), rows))
+
+
+def _brute_max_weight(rows, cols, weights):
+    """ Highest total weight over every one-to-one matching drawn from the edges (rows may stay unmatched). """
+    edges = {(int(r), int(c)): float(w) for r, c, w in zip(rows, cols, weights)}
+    row_ids, col_ids = sorted(set(r for r, _ in edges)), sorted(set(c for _, c in edges))
+    best = 0.0
+    for perm in itertools.permutations(col_ids + [None] * len(row_ids), len(row_ids)):
+        if all(col is None or (row, col) in edges for row, col in zip(row_ids, perm)):
+            best = max(best, sum(edges[(row, col)] for row, col in zip(row_ids, perm) if col is not None))
+    return best
+
+
+def _brute_components(source_idx, target_idx):
+    """ Component of every edge, by repeated merging of node sets. """
+    groups = []
+    for source, target in zip(source_idx, target_idx):
+        nodes = {('s', int(source)), ('t', int(target))}
+        touching = [group for group in groups if group & nodes]
+        for group in touching:
+            groups.remove(group)
+            nodes |= group
+        groups.append(nodes)
+    return [next(k for k, group in enumerate(groups) if ('s', int(source)) in group) for source in source_idx]
+
+
+def _random_edges(rng, max_rows, max_cols, max_edges):
+    """ Distinct (row, col) edges with distinct random weights, so the optimum is unique. """
+    rows, cols = rng.randint(1, max_rows), rng.randint(1, max_cols)
+    pairs = rng.sample([(r, c) for r in range(rows) for c in range(cols)], rng.randint(1, min(max_edges, rows * cols)))
+    weights = rng.sample(range(1, 1000), len(pairs))
+    return (np.array([r for r, _ in pairs]), np.array([c for _, c in pairs]), np.array(weights, dtype=np.float64) / 100)
+
+
+def _total_weight(assignment, rows, cols, weights):
+    edges = {(int(r), int(c)): float(w) for r, c, w in zip(rows, cols, weights)}
+    assert len(set(assignment.values())) == len(assignment) # one-to-one
+    return sum(edges[(row, col)] for row, col in assignment.items())
+
+
+def test_min_cost_assignment_matches_brute_force():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        rows = int(rng.integers(1, 5))
+        cols = int(rng.integers(rows, 6))
+        cost = rng.integers(-20, 20, size=(rows, cols)).astype(np.float64)
+        assignment = assignment_service._min_cost_assignment(cost)
+        assert sorted(assignment.tolist()) == sorted(set(assignment.tolist())) and (assignment >= 0).all()
+        assert cost[np.arange(rows), assignment].sum() == _brute_min_cost(cost)
+
+
+def test_max_weight_matching_matches_brute_force_on_rectangular_graphs():
+    rng = random.Random(5)
+    for _ in range(200):
+        rows, cols, weights = _random_edges(rng, 5, 5, 9) # both wide and tall (transposed) components
+        matching = assignment_service._max_weight_matching(rows, cols, weights)
+        assert abs(_total_weight(matching, rows, cols, weights) - _brute_max_weight(rows, cols, weights)) < 1e-9
+
+
+def test_connected_components_match_brute_force():
+    rng = random.Random(9)
+    for _ in range(200):
+        edge_count = rng.randint(1, 12)
+        source_idx = np.array([rng.randint(0, 8) for _ in range(edge_count)])
+        target_idx = np.array([rng.randint(0, 8) for _ in range(edge_count)])
+        labels, expected = connected_components(source_idx, target_idx).tolist(), _brute_components(source_idx, target_idx)
+        # Same partition of the edges, whatever the label values
+        assert all((labels[a] == labels[b]) == (expected[a] == expected[b]) for a in range(edge_count) for b in range(edge_count))
+
+
+def test_optimal_assignment_matches_brute_force_across_components():
+    rng = random.Random(13)
+    for _ in range(100):
+        rows, cols, weights = _random_edges(rng, 6, 6, 10)
+        assignment = optimal_assignment(rows, cols, weights)
+        assert abs(_total_weight(assignment, rows, cols, weights) - _brute_max_weight(rows, cols, weights)) < 1e-9
+
+
+def test_degenerate_inputs():
+    empty = np.array([], dtype=np.int64)
+    assert connected_components(empty, empty).tolist() == []
+    assert optimal_assignment(empty, empty, np.array([])) == {}
+    assert optimal_assignment([4], [7], [1.0]) == {4: 7}
+    # Single-source and single-target components take their heaviest edge
+    assert optimal_assignment([0, 0, 0], [5, 6, 7], [1.0, 4.5, 4.0]) == {0: 6}
+    assert optimal_assignment([1, 2, 3], [9, 9, 9], [1.0, 1.2, 4.1]) == {3: 9}
+    # Two disjoint components are solved independently
+    assert optimal_assignment([0, 0, 1, 5], [0, 1, 0, 8], [3.0, 2.0, 2.0, 1.0]) == {0: 1, 1: 0, 5: 8}
+
+
+def test_oversized_components_fall_back_to_greedy():
+    # Heaviest edge first takes 0 -> 0 (3.0); the exact optimum is 0 -> 1 plus 1 -> 0 (4.0)
+    rows, cols, weights = [0, 0, 1], [0, 1, 0], [3.0, 2.0, 2.0]
+    assert optimal_assignment(rows, cols, weights) == {0: 1, 1: 0}
+    assert optimal_assignment(rows, cols, weights, max_component_rows=1) == {0: 0}
+
+
+def test_greedy_switch_is_above_max_component_rows(monkeypatch):
+    calls = []
+    monkeypatch.setattr(assignment_service, '_max_weight_matching', lambda rows, cols, weights: calls.append('exact') or {})
+    monkeypatch.setattr(assignment_service, '_greedy_matching', lambda rows, cols, weights: calls.append('greedy') or {})
+    limit = assignment_service.ASSIGNMENT_MAX_COMPONENT_ROWS
+    for source_count in (limit, limit + 1):
+        # A path s0-t0-s1-t1-...: one component with source_count sources
+        source_idx = np.repeat(np.arange(source_count), 2)[1:]
+        target_idx = np.repeat(np.arange(source_count), 2)[:-1]
+        optimal_assignment(source_idx, target_idx, np.ones(len(source_idx)))
+    assert calls == ['exact', 'greedy']
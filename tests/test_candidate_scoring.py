@@ -0,0 +1,92 @@
+# tests/test_candidate_scoring.py
+# --- Imports ---
+from datetime import date, timedelta
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+candidate_scoring = importlib.import_module('agentrec-backend.services.candidate_scoring')
+candidate_service = importlib.import_module('agentrec-backend.services.candidate_service')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+INTERNAL_ID, INTERNAL_DATE, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS = (
+    columns.INTERNAL_ID, columns.INTERNAL_DATE, columns.INTERNAL_DESC, columns.INTERNAL_AMOUNT_CENTS)
+CandidateScorer = candidate_scoring.CandidateScorer
+TransactionSet, UsedBitmap = transaction_set.TransactionSet, transaction_set.UsedBitmap
+
+BASE_DATE = date(2024, 7, 15)
+
+
+def _transaction_set(rows, prefix):
+    """ TransactionSet from (day offset, cents, description) rows. """
+    return TransactionSet(pd.DataFrame({
+        INTERNAL_ID: [f"{prefix}-{k}" for k in range(len(rows))],
+        INTERNAL_DATE: [BASE_DATE + timedelta(days=offset) for offset, _, _ in rows],
+        INTERNAL_DESC: [description for _, _, description in rows],
+        INTERNAL_AMOUNT_CENTS: [cents for _, cents, _ in rows],
+    }))
+
+
+SOURCES = _transaction_set([(0, 12500, 'Payment ACME INV 4471')], 'S')
+TARGETS = _transaction_set([
+    (6, 20500, 'Office supplies'),          # 0: far on every component
+    (0, 12500, 'acme inv 4471 payment'),    # 1: same amount, day and tokens
+    (2, 12500, 'Payment ACME'),             # 2: same amount, close day, some tokens
+    (0, 12600, 'Payment ACME INV 4471'),    # 3: same day and tokens, 1.00 off
+    (6, 20500, 'Office supplies'),          # 4: ties with 0
+], 'T')
+
+
+def test_identical_pair_scores_one_and_components_decrease_with_distance():
+    scorer = CandidateScorer(SOURCES, TARGETS)
+    scores = scorer.score(np.zeros(5, dtype=np.int64), np.arange(5))
+    assert scores[1] == pytest.approx(1.0) # Token order and case do not matter
+    assert scores[3] == pytest.approx(1.0 - candidate_scoring.SCORE_WEIGHTS['amount'] / 2) # Half-score at AMOUNT_SCORE_HALF_CENTS
+    assert scores[1] > scores[2] > scores[0] and scores[0] == scores[4]
+    assert ((scores >= 0) & (scores <= 1)).all()
+
+
+def test_rank_is_best_first_and_ties_keep_target_order():
+    scorer = CandidateScorer(SOURCES, TARGETS)
+    assert scorer.rank(0, [4, 3, 2, 1, 0]).tolist() == [1, 3, 2, 0, 4]
+    assert scorer.rank(0, [4]).tolist() == [4] and scorer.rank(0, []).tolist() == []
+
+
+def test_missing_descriptions_only_lose_the_description_component():
+    sources = _transaction_set([(0, 12500, None)], 'S')
+    targets = _transaction_set([(0, 12500, None), (0, 12500, 'Payment')], 'T')
+    scores = CandidateScorer(sources, targets).score(np.zeros(2, dtype=np.int64), np.arange(2))
+    expected = candidate_scoring.SCORE_WEIGHTS['amount'] + candidate_scoring.SCORE_WEIGHTS['date']
+    assert scores.tolist() == pytest.approx([expected, expected])
+
+
+def test_descriptions_are_tokenized_once_per_distinct_value(monkeypatch):
+    tokenized, token_signature = [], candidate_scoring._token_signature
+    monkeypatch.setattr(candidate_scoring, '_token_signature', lambda text: tokenized.append(text) or token_signature(text))
+    targets = _transaction_set([(0, 100 * k, f"Card payment {k % 3}") for k in range(30)], 'T')
+    scorer = CandidateScorer(SOURCES, targets)
+    scorer.score(np.zeros(30, dtype=np.int64), np.arange(30))
+    assert sorted(tokenized) == ['Card payment 0', 'Card payment 1', 'Card payment 2', 'Payment ACME INV 4471']
+
+
+@pytest.mark.parametrize('engine', ['band_join', 'index'])
+def test_top_k_sends_the_best_live_candidates_first(engine):
+    select = candidate_service.build_candidate_selector('default_date_amount', None, SOURCES, TARGETS, engine=engine, top_k=2)
+    target_used = UsedBitmap(len(TARGETS))
+    assert select(0, target_used) == [1, 3]
+    target_used[1] = True
+    assert select(0, target_used) == [3, 2] # The next best live target moves up
+    unranked = candidate_service.build_candidate_selector('default_date_amount', None, SOURCES, TARGETS, engine=engine)
+    assert unranked(0, UsedBitmap(len(TARGETS))) == [0, 1, 2, 3, 4] # Without top_k: every candidate, target-file order
+
+
+def test_ranked_pair_table_matches_per_source_ranking():
+    sources = _transaction_set([(0, 12500, 'Payment ACME INV 4471'), (1, 20500, 'Office supplies')], 'S')
+    scorer = CandidateScorer(sources, TARGETS)
+    pairs = candidate_service.generate_candidate_pairs(sources, TARGETS, timedelta(days=7), amount_tolerance=100)
+    table = candidate_service.CandidatePairTable(pairs, len(sources), scorer=scorer)
+    target_used = UsedBitmap(len(TARGETS))
+    for i in range(len(sources)):
+        in_band = pairs['target_idx'][pairs['source_idx'] == i].tolist()
+        assert table.candidates(i, target_used) == scorer.rank(i, in_band).tolist()
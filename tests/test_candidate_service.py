@@ -0,0 +1,184 @@
+# tests/test_candidate_service.py
+# --- Imports ---
+from datetime import date, timedelta
+from decimal import Decimal
+import importlib
+import pandas as pd
+import pytest
+import random
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+candidate_service = importlib.import_module('agentrec-backend.services.candidate_service')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+INTERNAL_ID, INTERNAL_DATE, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS, INTERNAL_REF = (
+    columns.INTERNAL_ID, columns.INTERNAL_DATE, columns.INTERNAL_DESC, columns.INTERNAL_AMOUNT_CENTS, columns.INTERNAL_REF)
+TargetCandidateIndex, CandidatePairTable = candidate_service.TargetCandidateIndex, candidate_service.CandidatePairTable
+generate_candidate_pairs, generate_reference_pairs = candidate_service.generate_candidate_pairs, candidate_service.generate_reference_pairs
+find_exact_matches, resolve_candidate_params = candidate_service.find_exact_matches, candidate_service.resolve_candidate_params
+DEFAULT_DATE_WINDOW, DEFAULT_AMOUNT_TOLERANCE = candidate_service.DEFAULT_DATE_WINDOW, candidate_service.DEFAULT_AMOUNT_TOLERANCE
+TransactionSet, UsedBitmap = transaction_set.TransactionSet, transaction_set.UsedBitmap
+
+BASE_DATE = date(2024, 7, 15)
+
+
+def _transaction_set(rows, prefix, references=None):
+    """ TransactionSet from (day offset, cents) pairs, with optional INTERNAL_REF values. """
+    frame = pd.DataFrame({
+        INTERNAL_ID: [f"{prefix}-{k}" for k in range(len(rows))],
+        INTERNAL_DATE: [BASE_DATE + timedelta(days=offset) for offset, _ in rows],
+        INTERNAL_DESC: [f"Payment {k}" for k in range(len(rows))],
+        INTERNAL_AMOUNT_CENTS: [cents for _, cents in rows],
+    })
+    if references is not None:
+        frame[INTERNAL_REF] = references
+    return TransactionSet(frame)
+
+
+def _linear_candidates(source_tx, targets, target_used):
+    """ The original per-source scan over every target (default_date_amount). """
+    candidates = []
+    for j, target_tx in enumerate(targets):
+        if target_used[j]:
+            continue
+        if abs(source_tx['date'] - target_tx['date']) > DEFAULT_DATE_WINDOW:
+            continue
+        if abs(source_tx['amount'] - target_tx['amount']) > DEFAULT_AMOUNT_TOLERANCE:
+            continue
+        candidates.append(j)
+    return candidates
+
+
+def _as_dicts(rows):
+    return [{'date': BASE_DATE + timedelta(days=offset), 'amount': Decimal(cents) / 100} for offset, cents in rows]
+
+
+def _random_rows(rng, count):
+    # Clustered days and amounts, so many pairs land exactly on the window and tolerance edges
+    return [(rng.randint(-12, 12), rng.choice([1, -1]) * rng.randint(0, 30) * 1000 + rng.choice([0, 1, -1, 5000, 10000, 10001, -10000, -10001]))
+            for _ in range(count)]
+
+
+def _random_used(rng, size):
+    used = UsedBitmap(size)
+    for j in range(size):
+        if rng.random() < 0.2: used[j] = True
+    return used
+
+
+def test_index_matches_linear_scan_on_random_data():
+    rng = random.Random(7)
+    for _ in range(20):
+        source_rows, target_rows = _random_rows(rng, 60), _random_rows(rng, 80)
+        sources, targets = _transaction_set(source_rows, 'S'), _transaction_set(target_rows, 'T')
+        target_used = _random_used(rng, len(targets))
+        index = TargetCandidateIndex(targets)
+        source_dicts, target_dicts = _as_dicts(source_rows), _as_dicts(target_rows)
+        used_list = [target_used[j] for j in range(len(targets))]
+        for i in range(len(sources)):
+            assert index.candidates(sources[i], target_used) == _linear_candidates(source_dicts[i], target_dicts, used_list)
+
+
+def test_index_includes_window_and_tolerance_edges():
+    sources = _transaction_set([(0, 50000)], 'S')
+    targets = _transaction_set([
+        (7, 50000),    # exactly +7 days: in
+        (-7, 50000),   # exactly -7 days: in
+        (8, 50000),    # 8 days: out
+        (-8, 50000),   # -8 days: out
+        (0, 60000),    # exactly +100.00: in
+        (0, 40000),    # exactly -100.00: in
+        (0, 60001),    # +100.01: out
+        (0, 39999),    # -100.01: out
+        (7, 60000),    # both edges at once: in
+    ], 'T')
+    assert TargetCandidateIndex(targets).candidates(sources[0], UsedBitmap(len(targets))) == [0, 1, 4, 5, 8]
+
+
+def test_index_skips_used_targets():
+    sources = _transaction_set([(0, 50000)], 'S')
+    targets = _transaction_set([(0, 50000), (1, 50000), (2, 50000)], 'T')
+    target_used = UsedBitmap(len(targets))
+    target_used[1] = True
+    assert TargetCandidateIndex(targets).candidates(sources[0], target_used) == [0, 2]
+
+
+def test_band_join_matches_linear_scan_on_random_data():
+    rng = random.Random(11)
+    for _ in range(10):
+        source_rows, target_rows = _random_rows(rng, 60), _random_rows(rng, 80)
+        sources, targets = _transaction_set(source_rows, 'S'), _transaction_set(target_rows, 'T')
+        target_used = _random_used(rng, len(targets))
+        table = CandidatePairTable(generate_candidate_pairs(sources, targets), len(sources))
+        source_dicts, target_dicts = _as_dicts(source_rows), _as_dicts(target_rows)
+        used_list = [target_used[j] for j in range(len(targets))]
+        for i in range(len(sources)):
+            assert table.candidates(i, target_used) == _linear_candidates(source_dicts[i], target_dicts, used_list)
+
+
+def test_fast_path_and_reference_join_normalize_references_alike():
+    sources = _transaction_set([(0, 1000), (0, 2000)], 'S', [' inv-4471 ', '000123'])
+    targets = _transaction_set([(0, 1000), (0, 2000)], 'T', ['INV4471', '123'])
+    assert find_exact_matches(sources, targets) == {0: 0, 1: 1}
+    pairs = generate_reference_pairs(sources, targets)
+    assert sorted(zip(pairs['source_idx'].tolist(), pairs['target_idx'].tolist())) == [(0, 0), (1, 1)]
+
+
+
+def _reference_job():
+    """ One source per reference key: a common one at the cap, one over it, a unique one and none. """
+    cap = candidate_service.REFERENCE_JOIN_MAX_TARGETS
+    target_refs = ['BATCH-7'] * cap + ['PAYROLL'] * (cap + 1) + ['INV-1', None]
+    sources = _transaction_set([(0, 1000)] * 4, 'S', ['batch 7', 'payroll', 'inv #1', None])
+    targets = _transaction_set([(k % 3, 1000) for k in range(len(target_refs))], 'T', target_refs)
+    return sources, targets, cap
+
+
+def test_reference_join_skips_keys_held_by_too_many_targets():
+    sources, targets, cap = _reference_job()
+    pairs = generate_reference_pairs(sources, targets)
+    joined = pairs.groupby('source_idx')['target_idx'].apply(list).to_dict()
+    assert joined == {0: list(range(cap)), 2: [2 * cap + 1]} # PAYROLL is over the cap; empty keys never join
+    assert pairs['date_diff'].tolist()[:3] == [0, 1, 2] and (pairs['amount_diff'] == 0).all()
+    assert generate_reference_pairs(sources, targets, max_targets=1)['source_idx'].tolist() == [2]
+
+
+@pytest.mark.parametrize('engine', ['band_join', 'index'])
+def test_reference_first_falls_back_to_windows(engine):
+    sources, targets, cap = _reference_job()
+    select = candidate_service.build_candidate_selector('default_date_amount', None, sources, targets, engine=engine)
+    target_used = UsedBitmap(len(targets))
+    assert select(0, target_used) == list(range(cap)) and select(2, target_used) == [2 * cap + 1]
+    assert select(1, target_used) == select(3, target_used) == list(range(len(targets))) # Window candidates
+    target_used[2 * cap + 1] = True
+    assert len(select(2, target_used)) == len(targets) - 1 # Its reference target is taken: windows again
+    windows_only = candidate_service.build_candidate_selector('default_date_amount', {'reference_first': False},
+                                                              sources, targets, engine=engine)
+    assert windows_only(0, UsedBitmap(len(targets))) == list(range(len(targets)))
+
+def test_presets_share_the_band_selector():
+    assert set(candidate_service.DATE_AMOUNT_BAND_PRESETS) <= set(candidate_service.CANDIDATE_STRATEGIES)
+    for name, defaults in candidate_service.DATE_AMOUNT_BAND_PRESETS.items():
+        assert candidate_service.CANDIDATE_STRATEGIES[name] == (candidate_service._date_amount_band_selector, defaults)
+        assert resolve_candidate_params(name) == defaults
+
+
+def test_resolve_candidate_params_overlays_defaults():
+    resolved = resolve_candidate_params('high_volume', {'date_window_days': 5, 'amount_tolerance': None})
+    assert resolved == dict(candidate_service.DATE_AMOUNT_BAND_PRESETS['high_volume'], date_window_days=5, amount_tolerance=None)
+    assert candidate_service.DATE_AMOUNT_BAND_PRESETS['high_volume']['date_window_days'] == 3 # Defaults untouched
+
+
+@pytest.mark.parametrize('strategy, params, message', [
+    ('nearest', None, "Unknown candidate selection strategy 'nearest'"),
+    ('default_date_amount', {'window': 3}, "Unknown parameter(s) ['window']"),
+    ('default_date_amount', {'date_window_days': -1}, "'date_window_days' must be a non-negative integer"),
+    ('default_date_amount', {'date_window_days': True}, "'date_window_days' must be a non-negative integer"),
+    ('default_date_amount', {'amount_tolerance': '5'}, "'amount_tolerance' must be null or a non-negative number"),
+    ('exact_amount', {'require_same_sign': 1}, "'require_same_sign' must be true or false"),
+    ('high_volume', {'max_candidates': 0}, "'max_candidates' must be null or a positive integer"),
+    ('exact_amount', {'amount_tolerance': None}, "Set amount_tolerance and/or amount_tolerance_pct"),
+])
+def test_resolve_candidate_params_rejects_invalid_params(strategy, params, message):
+    with pytest.raises(ValueError) as excinfo:
+        resolve_candidate_params(strategy, params)
+    assert message in str(excinfo.value)
@@ -0,0 +1,113 @@
+# tests/test_duplicate_service.py
+# --- Imports ---
+from datetime import date
+import importlib
+import pandas as pd
+import pytest
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+config = importlib.import_module('agentrec-backend.config')
+models = importlib.import_module('agentrec-backend.models')
+duplicate_service = importlib.import_module('agentrec-backend.services.duplicate_service')
+reconciliation_service = importlib.import_module('agentrec-backend.services.reconciliation_service')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+find_duplicate_rows, duplicate_mask = duplicate_service.find_duplicate_rows, duplicate_service.duplicate_mask
+TransactionSet = transaction_set.TransactionSet
+
+COLUMN_MAPPINGS = {'transaction_id': 'internal_id', 'date': 'internal_date',
+                   'description': 'internal_description', 'amount': 'internal_amount'}
+HEADER = 'transaction_id,date,description,amount\n'
+
+
+def _transaction_set(rows):
+    """ TransactionSet from (id, day of July 2024, description, cents) rows. """
+    return TransactionSet(pd.DataFrame({
+        columns.INTERNAL_ID: [row[0] for row in rows],
+        columns.INTERNAL_DATE: [date(2024, 7, row[1]) for row in rows],
+        columns.INTERNAL_DESC: [row[2] for row in rows],
+        columns.INTERNAL_AMOUNT_CENTS: [row[3] for row in rows],
+    }))
+
+
+def test_exact_and_near_duplicates():
+    duplicates = find_duplicate_rows(_transaction_set([
+        ('A-1', 15, 'ACME Wire', 10000),
+        ('B-1', 15, 'Fee', 400),
+        ('A-1', 15, 'ACME Wire', 10000),      # exact copy of row 0
+        (' a-1', 15, 'acme  wire!', 10000),   # same after trimming/case-folding the ID and normalizing the text
+        ('A-1', 15, 'ACME Wire', 10000),      # another exact copy: still points at the first occurrence
+    ]))
+    assert duplicates == {2: (0, 'exact'), 3: (0, 'near'), 4: (0, 'exact')}
+    assert duplicate_mask(duplicates, 5).tolist() == [False, False, True, True, True]
+
+
+@pytest.mark.parametrize('changed', [('A-2', 15, 'ACME Wire', 10000), ('A-1', 16, 'ACME Wire', 10000),
+                                     ('A-1', 15, 'ACME Wire', 10001), ('A-1', 15, 'ACME Wire 2', 10000)])
+def test_any_differing_field_is_not_a_duplicate(changed):
+    assert find_duplicate_rows(_transaction_set([('A-1', 15, 'ACME Wire', 10000), changed])) == {}
+
+
+def test_small_inputs_have_no_duplicates():
+    assert find_duplicate_rows(_transaction_set([('A-1', 15, 'ACME Wire', 10000)])) == {}
+    assert duplicate_mask({}, 3).tolist() == [False, False, False]
+
+
+class RecordingEvaluator:
+    """ Stands in for the LLM: matches every pair and records which rows were sent. """
+    pairs = []
+
+    def __init__(self, kb_retriever, prompt_template_str):
+        RecordingEvaluator.pairs = []
+
+    def evaluate(self, source_tx, target_tx):
+        RecordingEvaluator.pairs.append((source_tx.row, target_tx.row))
+        return {'status': 'Matched', 'exception_type': None, 'reason': 'Same payment.'}
+
+    def evaluate_batch(self, source_tx, target_txs):
+        return [self.evaluate(source_tx, target_tx) for target_tx in target_txs]
+
+
+@pytest.fixture
+def reconcile(app, tmp_path, monkeypatch):
+    """ Runs process_reconciliation on CSV rows with the recording evaluator. """
+    monkeypatch.setattr(reconciliation_service, 'ReconciliationEvaluator', RecordingEvaluator)
+    monkeypatch.setattr(config.Config, 'DUPLICATE_DETECTION_ENABLED', True)
+    monkeypatch.setattr(config.Config, 'AGGREGATE_MATCHING_ENABLED', False)
+    monkeypatch.setattr(config.Config, 'AI_MAX_CONCURRENCY', 1)
+    monkeypatch.setattr(config.Config, 'AI_BATCH_MAX_SIZE', 1)
+    map_config = {'id': 1, 'column_mappings': COLUMN_MAPPINGS, 'date_format_string': '%Y-%m-%d'}
+
+    def run(source_lines, target_lines):
+        paths = []
+        for side, lines in (('source', source_lines), ('target', target_lines)):
+            path = str(tmp_path / f'{side}.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(HEADER + ''.join(line + '\n' for line in lines))
+            paths.append(path)
+        return reconciliation_service.process_reconciliation(1, paths[0], paths[1], map_config, map_config, None, '-')['summary']
+    return run
+
+
+SOURCE_LINES = ['S-1,2024-07-15,ACME Wire,100.00', 'S-1,2024-07-15,ACME Wire,100.00',
+                ' s-1,2024-07-15,acme wire!,100.00', 'S-2,2024-07-16,Fee,4.00']
+TARGET_LINES = ['T-1,2024-07-15,ACME wire transfer,100.00', 'T-1,2024-07-15,ACME wire transfer,100.00',
+                'T-2,2024-07-16,Monthly fee,4.00']
+
+
+def test_duplicates_never_reach_candidates_or_the_llm(reconcile, monkeypatch):
+    monkeypatch.setattr(config.Config, 'EXACT_MATCH_FAST_PATH', False)
+    summary = reconcile(SOURCE_LINES, TARGET_LINES)
+    assert sorted(RecordingEvaluator.pairs) == [(0, 0), (3, 2)] # Source rows 1-2 and target row 1 are duplicates
+    assert summary['duplicate_count'] == 3 and summary['ai_matched_count'] == 2
+
+    items = models.ReconciliationResultItem.query.filter_by(job_id=1).all()
+    duplicates = sorted((item.display_id, item.details['exception_type']) for item in items if item.status == 'Exception')
+    assert duplicates == [('SRC- s-1', 'Duplicate Transaction'), ('SRC-S-1', 'Duplicate Transaction'),
+                          ('TGT-T-1', 'Duplicate Transaction')]
+
+
+def test_duplicates_do_not_make_exact_matches_ambiguous(reconcile, monkeypatch):
+    monkeypatch.setattr(config.Config, 'EXACT_MATCH_FAST_PATH', True)
+    summary = reconcile(SOURCE_LINES, TARGET_LINES)
+    assert RecordingEvaluator.pairs == []
+    assert summary['fast_path_matched_count'] == 2 and summary['duplicate_count'] == 3
@@ -0,0 +1,104 @@
+# tests/test_evaluation_pipeline.py
+# --- Imports ---
+import importlib
+import random
+import threading
+import time
+import pytest
+
+evaluation_pipeline = importlib.import_module('agentrec-backend.services.evaluation_pipeline')
+PairEvaluationPipeline = evaluation_pipeline.PairEvaluationPipeline
+
+
+class ScriptedEvaluator:
+    """ Returns verdict_of(source, target) after latency_of(source, target) seconds, recording each pair. """
+    def __init__(self, verdict_of, latency_of=lambda i, j: 0):
+        self.verdict_of, self.latency_of = verdict_of, latency_of
+        self.pairs, self.current = [], 0
+        self.out_of_window = []
+        self._lock = threading.Lock()
+
+    def evaluate(self, source_tx, target_tx):
+        i, j = source_tx['row'], target_tx['row']
+        with self._lock:
+            self.pairs.append((i, j))
+            if i >= self.current + self.window:
+                self.out_of_window.append((i, j))
+        time.sleep(self.latency_of(i, j))
+        return {'status': self.verdict_of(i, j), 'exception_type': None, 'reason': f"{i}-{j}"}
+
+    def evaluate_batch(self, source_tx, target_txs):
+        return [self.evaluate(source_tx, target_tx) for target_tx in target_txs]
+
+
+def _reconcile(evaluator, candidates, target_count, max_concurrency=1, batch_size=1):
+    """ The source loop of process_reconciliation: Matched wins, Partial Match is the fallback. """
+    used = set()
+    select_candidates = lambda k: [j for j in candidates[k] if j not in used]
+    pipeline = PairEvaluationPipeline(evaluator, [{'row': k} for k in range(len(candidates))],
+                                      [{'row': j} for j in range(target_count)], select_candidates,
+                                      max_concurrency=max_concurrency, batch_size=batch_size)
+    evaluator.window = pipeline.window
+    decisions, consumed = [], 0
+    for i in range(len(candidates)):
+        evaluator.current = i
+        best, statuses = None, []
+        for j, verdict in pipeline.verdicts(i, select_candidates(i)):
+            consumed += 1
+            statuses.append((j, verdict['status']))
+            if verdict['status'] == 'Matched':
+                best = j
+                break
+            if verdict['status'] == 'Partial Match' and best is None:
+                best = j
+        if best is not None:
+            used.add(best)
+        decisions.append((best, statuses))
+        pipeline.discard(i)
+    pipeline.close()
+    return decisions, consumed, pipeline.stats()
+
+
+def _random_job(rng, sources=25, targets=20):
+    candidates = [rng.sample(range(targets), rng.randint(0, 6)) for _ in range(sources)]
+    verdicts = {(i, j): rng.choice(['Matched', 'Partial Match', 'Exception', 'Exception'])
+                for i in range(sources) for j in range(targets)}
+    latencies = {key: rng.choice([0, 0.001, 0.003]) for key in verdicts}
+    return candidates, targets, lambda i, j: verdicts[(i, j)], lambda i, j: latencies[(i, j)]
+
+
+@pytest.mark.parametrize('max_concurrency, batch_size', [(2, 1), (4, 1), (8, 1), (4, 3)])
+def test_concurrent_decisions_match_the_serial_path(max_concurrency, batch_size):
+    rng = random.Random(max_concurrency * 10 + batch_size)
+    for _ in range(5):
+        candidates, targets, verdicts, latencies = _random_job(rng)
+        serial, serial_consumed, serial_stats = _reconcile(ScriptedEvaluator(verdicts), candidates, targets)
+        assert serial_stats['ai_evaluated_pairs'] == serial_consumed and serial_stats['ai_discarded_evaluations'] == 0
+
+        evaluator = ScriptedEvaluator(verdicts, latencies)
+        concurrent, consumed, stats = _reconcile(evaluator, candidates, targets, max_concurrency, batch_size)
+        assert concurrent == serial # Same decisions, from the same verdicts consumed in the same order
+        assert consumed == serial_consumed
+        assert stats['ai_evaluated_pairs'] == consumed + stats['ai_discarded_evaluations']
+        assert evaluator.out_of_window == []
+
+
+def test_no_prefetch_past_a_known_match():
+    # Every source's first candidate matches at once; the others would take a while
+    candidates = [[3 * k, 3 * k + 1, 3 * k + 2] for k in range(12)]
+    evaluator = ScriptedEvaluator(lambda i, j: 'Matched' if j == 3 * i else 'Exception',
+                                  lambda i, j: 0 if j == 3 * i else 0.05)
+    decisions, consumed, stats = _reconcile(evaluator, candidates, 36, max_concurrency=2)
+    assert [best for best, _ in decisions] == [3 * k for k in range(12)]
+    # Only candidates submitted while a source's first verdict was still running, bounded by the in-flight limit
+    assert stats['ai_discarded_evaluations'] == len(evaluator.pairs) - consumed <= 12
+    assert all(j - 3 * i < 2 for i, j in evaluator.pairs)
+
+
+def test_serial_pipeline_evaluates_only_consumed_pairs():
+    candidates = [[0, 1, 2], [1, 2], [2]]
+    evaluator = ScriptedEvaluator(lambda i, j: 'Matched' if j == 1 else 'Exception')
+    decisions, consumed, stats = _reconcile(evaluator, candidates, 3)
+    assert evaluator.pairs == [(0, 0), (0, 1), (1, 2), (2, 2)]
+    assert [best for best, _ in decisions] == [1, None, None]
+    assert stats == {'ai_evaluated_pairs': 4, 'ai_discarded_evaluations': 0}
@@ -0,0 +1,355 @@
+# tests/test_ingestion_service.py
+# --- Imports ---
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import gzip
+import importlib
+import io
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import zipfile
+import zstandard
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+config = importlib.import_module('agentrec-backend.config')
+ingestion_service = importlib.import_module('agentrec-backend.services.ingestion_service')
+InputFormat = ingestion_service.InputFormat
+reconciliation_service = importlib.import_module('agentrec-backend.services.reconciliation_service')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+INTERNAL_ID, INTERNAL_DATE, INTERNAL_DESC, INTERNAL_AMOUNT, INTERNAL_AMOUNT_CENTS = (
+    columns.INTERNAL_ID, columns.INTERNAL_DATE, columns.INTERNAL_DESC, columns.INTERNAL_AMOUNT, columns.INTERNAL_AMOUNT_CENTS)
+
+MAPPING = {'id': 1, 'column_mappings': {'ID': INTERNAL_ID, 'Date': INTERNAL_DATE, 'Memo': INTERNAL_DESC, 'Amount': INTERNAL_AMOUNT}}
+
+
+def _parsed_frame(rows=50):
+    return pd.DataFrame({
+        INTERNAL_ID: [f"S-{k}" for k in range(rows)],
+        INTERNAL_DATE: [date(1999, 12, 25) + timedelta(days=7 * k) for k in range(rows)],
+        INTERNAL_DESC: [f"Payment {k % 4}" for k in range(rows)],
+        INTERNAL_AMOUNT_CENTS: [k * 101 - 2000 for k in range(rows)],
+    })
+
+
+def test_arrow_frame_keeps_dates_as_datetime64(tmp_path):
+    frame = _parsed_frame()
+    arrow_path = str(tmp_path / 'parsed.arrow')
+    ingestion_service.write_parsed_cache(frame, MAPPING, arrow_path)
+
+    loaded = ingestion_service.load_arrow_frame(arrow_path)
+    assert pd.api.types.is_datetime64_dtype(loaded[INTERNAL_DATE])
+
+    expected, actual = transaction_set.TransactionSet(frame), transaction_set.TransactionSet(loaded)
+    assert actual.days.tolist() == expected.days.tolist()
+    assert actual.cents.tolist() == expected.cents.tolist()
+    assert actual.value(3, INTERNAL_DATE) == frame[INTERNAL_DATE][3]
+
+
+def test_arrow_frame_records_carry_python_dates(tmp_path):
+    frame = _parsed_frame(rows=3)
+    arrow_path = str(tmp_path / 'parsed.arrow')
+    ingestion_service.write_parsed_cache(frame, MAPPING, arrow_path)
+
+    records = reconciliation_service.frame_to_transactions(ingestion_service.load_arrow_frame(arrow_path))
+    assert [record[INTERNAL_DATE] for record in records] == frame[INTERNAL_DATE].tolist()
+    assert str(records[0][INTERNAL_AMOUNT]) == '-20.00'
+
+
+# --- .xlsx streaming reader ---
+XLSX_PARTS = {
+    '[Content_Types].xml': '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>',
+    '_rels/.rels': '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/_rels/workbook.xml.rels': '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>',
+    # Style 1 shows numbers as dates (built-in format 14, m/d/yyyy)
+    'xl/styles.xml': '<?xml version="1.0" encoding="UTF-8"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts><fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0"/><xf numFmtId="14" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>',
+}
+
+
+def _write_xlsx(path, rows_xml, date1904=False):
+    """ Minimal hand-written workbook, so the sheet XML can use inline strings and sparse rows/cells. """
+    workbook = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<workbookPr date1904="{int(date1904)}"/>'
+                '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>')
+    # A wrong stored used range (A1:A1), as some exporters write it
+    sheet = ('<?xml version="1.0" encoding="UTF-8"?>'
+             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+             f'<dimension ref="A1:A1"/><sheetData>{rows_xml}</sheetData></worksheet>')
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, content in dict(XLSX_PARTS, **{'xl/workbook.xml': workbook, 'xl/worksheets/sheet1.xml': sheet}).items():
+            archive.writestr(name, content)
+
+
+def _inline(reference, text):
+    return f'<c r="{reference}" t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+XLSX_HEADER = ('<row r="1">' + _inline('A1', 'ID') + _inline('B1', 'Cleared') + _inline('C1', 'Date')
+               + _inline('D1', 'Memo') + _inline('E1', 'Amount') + '</row>')
+XLSX_MAPPING = {'id': 1, 'column_mappings': {'ID': INTERNAL_ID, 'Date': INTERNAL_DATE, 'Memo': INTERNAL_DESC, 'Amount': INTERNAL_AMOUNT}}
+
+
+def test_xlsx_reader_decodes_inline_strings_booleans_and_dates(tmp_path):
+    path = str(tmp_path / 'export.xlsx')
+    _write_xlsx(path, XLSX_HEADER
+                + '<row r="2"><c r="A2"><v>1001</v></c><c r="B2" t="b"><v>1</v></c><c r="C2" s="1"><v>45488</v></c>'
+                + _inline('D2', 'Wire ACME') + '<c r="E2"><v>-12.5</v></c></row>'
+                + '<row r="3">' + _inline('A3', 'X-7') + '<c r="B3" t="b"><v>0</v></c><c r="C3" s="1"><v>45489</v></c>'
+                + _inline('D3', 'Card') + _inline('E3', '(3.00)') + '</row>')
+    rows = list(ingestion_service._xlsx_rows(path))
+    assert rows[0] == ('ID', 'Cleared', 'Date', 'Memo', 'Amount')
+    assert rows[1] == (1001, True, datetime(2024, 7, 15), 'Wire ACME', -12.5)
+    assert rows[2] == ('X-7', False, datetime(2024, 7, 16), 'Card', '(3.00)')
+
+    frame = pd.concat(ingestion_service._xlsx_chunks(path, ingestion_service.mapping_read_plan(XLSX_MAPPING)[2], 1))
+    assert list(frame.columns) == ['ID', 'Date', 'Memo', 'Amount'] # Projected to the mapped columns
+    assert frame['ID'].tolist() == ['1001', 'X-7']
+
+
+def test_xlsx_reader_uses_the_1904_epoch(tmp_path):
+    path = str(tmp_path / 'mac.xlsx')
+    _write_xlsx(path, XLSX_HEADER + '<row r="2"><c r="A2"><v>1</v></c><c r="C2" s="1"><v>44026</v></c>'
+                + _inline('D2', 'Fee') + '<c r="E2"><v>4</v></c></row>', date1904=True)
+    assert list(ingestion_service._xlsx_rows(path))[1][2] == datetime(2024, 7, 15)
+
+
+def test_xlsx_reader_handles_sparse_rows_and_cells(tmp_path):
+    path = str(tmp_path / 'sparse.xlsx')
+    # Rows 2-3 and 5 are missing, row 4 has no Cleared cell and row 6 stops after Memo
+    _write_xlsx(path, XLSX_HEADER
+                + '<row r="4"><c r="A4"><v>1</v></c><c r="C4" s="1"><v>45488</v></c>' + _inline('D4', 'Fee')
+                + '<c r="E4"><v>4</v></c></row>'
+                + '<row r="6"><c r="A6"><v>2</v></c><c r="C6" s="1"><v>45490</v></c>' + _inline('D6', 'No amount') + '</row>')
+    frame = ingestion_service.ingest_streaming(path, XLSX_MAPPING)
+    assert frame[INTERNAL_ID].tolist() == ['1'] # Blank rows skipped; the row without an amount is dropped
+    assert frame[INTERNAL_AMOUNT_CENTS].tolist() == [400]
+
+    header, sample = ingestion_service._preflight_sample(path, ['ID', 'Amount'], 10)
+    assert header == ['ID', 'Cleared', 'Date', 'Memo', 'Amount']
+    assert sample['ID'].tolist() == [1, 2] and sample['Amount'].isna().tolist() == [False, True]
+
+
+def test_parsed_cache_key_follows_the_mapping(tmp_path):
+    csv_path = str(tmp_path / 'source.csv')
+    with open(csv_path, 'w', encoding='utf-8') as f:
+        f.write('ID,Date,Memo,Amount\nS-1,2024-07-15,Fee,4.00\n')
+    edited = dict(MAPPING, date_format_string='%d/%m/%Y')
+    assert ingestion_service.parsed_cache_path(csv_path, MAPPING) == ingestion_service.parsed_cache_path(csv_path, dict(MAPPING))
+    assert ingestion_service.parsed_cache_path(csv_path, MAPPING) != ingestion_service.parsed_cache_path(csv_path, edited)
+
+
+PREFLIGHT_MAPPING = dict(MAPPING, date_format_string='%Y-%m-%d')
+
+
+def _csv(tmp_path, text, name='upload.csv'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_preflight_accepts_a_matching_file(tmp_path):
+    path = _csv(tmp_path, 'ID,Date,Memo,Amount,Extra\nS-1,2024-07-15,Fee,"1,204.50",x\nS-2,,Blank date,-3,y\n')
+    assert ingestion_service.preflight_check(path, PREFLIGHT_MAPPING) == {
+        'columns': ['ID', 'Date', 'Memo', 'Amount', 'Extra'], 'sampled_rows': 2}
+
+
+def test_preflight_rejects_a_header_missing_mapped_columns(tmp_path):
+    path = _csv(tmp_path, 'ID,Posted,Memo,Value\nS-1,2024-07-15,Fee,4.00\n')
+    with pytest.raises(ValueError, match=r"Mapped column\(s\) \['Date', 'Amount'\] not found in file header"):
+        ingestion_service.preflight_check(path, PREFLIGHT_MAPPING)
+
+
+def test_preflight_rejects_dates_in_another_format(tmp_path):
+    path = _csv(tmp_path, 'ID,Date,Memo,Amount\nS-1,15/07/2024,Fee,4.00\nS-2,16/07/2024,Fee,5.00\n')
+    with pytest.raises(ValueError, match=r"date column 'Date' matches date format '%Y-%m-%d' \(e.g. '15/07/2024'\)"):
+        ingestion_service.preflight_check(path, PREFLIGHT_MAPPING)
+    # One parsable value is enough: single bad rows are dropped at ingestion, not rejected here
+    path = _csv(tmp_path, 'ID,Date,Memo,Amount\nS-1,15/07/2024,Fee,4.00\nS-2,2024-07-16,Fee,5.00\n')
+    assert ingestion_service.preflight_check(path, PREFLIGHT_MAPPING)['sampled_rows'] == 2
+
+
+def test_preflight_rejects_non_numeric_amounts(tmp_path):
+    path = _csv(tmp_path, 'ID,Date,Memo,Amount\nS-1,2024-07-15,Fee,four\nS-2,2024-07-16,Fee,n/a\n')
+    with pytest.raises(ValueError, match=r"amount column 'Amount' is a number \(e.g. 'four'\)"):
+        ingestion_service.preflight_check(path, PREFLIGHT_MAPPING)
+
+
+def test_preflight_only_reads_the_sample(tmp_path):
+    rows = ''.join(f"S-{k},2024-07-15,Fee,4.00\n" for k in range(5)) + 'S-5,2024-07-15,Fee,four\n' * 5
+    path = _csv(tmp_path, 'ID,Date,Memo,Amount\n' + rows)
+    assert ingestion_service.preflight_check(path, PREFLIGHT_MAPPING, sample_rows=5)['sampled_rows'] == 5
+
+
+def test_preflight_errors_cover_corrupt_uploads_but_not_server_failures(tmp_path):
+    path = tmp_path / 'upload.csv.gz'
+    path.write_bytes(b'\x1f\x8b\x08\x00' + b'not really gzip' * 8)
+    with pytest.raises(ingestion_service.PREFLIGHT_ERRORS):
+        ingestion_service.preflight_check(str(path), PREFLIGHT_MAPPING)
+    assert not issubclass(PermissionError, ingestion_service.PREFLIGHT_ERRORS)
+
+
+# --- Input formats ---
+EXPORT = pa.table({
+    'ID': pa.array([101, 102], pa.int64()),
+    'Date': pa.array([date(2024, 7, 15), date(2024, 7, 16)], pa.date32()),
+    'Memo': ['Fee', 'ACME Wire'],
+    'Amount': pa.array([Decimal('4.00'), Decimal('-1204.50')], pa.decimal128(12, 2)),
+    'Unmapped': ['x', 'y'],
+})
+
+
+def _export_bytes(kind):
+    """ EXPORT serialized as csv / parquet / arrow (IPC file) / arrow_stream (IPC stream). """
+    sink = io.BytesIO()
+    if kind == 'csv':
+        return EXPORT.to_pandas().to_csv(index=False).encode('utf-8')
+    if kind == 'parquet':
+        pq.write_table(EXPORT, sink)
+    else:
+        writer = pa.ipc.new_file if kind == 'arrow' else pa.ipc.new_stream
+        with writer(sink, EXPORT.schema) as ipc:
+            ipc.write_table(EXPORT)
+    return sink.getvalue()
+
+
+@pytest.fixture
+def ingest_folder(tmp_path, monkeypatch):
+    folder = tmp_path / 'ingested'
+    monkeypatch.setattr(config.Config, 'INGEST_FOLDER', str(folder))
+    return folder
+
+
+def _assert_export_rows(frame):
+    assert list(frame.columns) == [INTERNAL_ID, INTERNAL_DATE, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS]
+    assert frame[INTERNAL_ID].tolist() == ['101', '102']
+    assert pd.to_datetime(frame[INTERNAL_DATE]).dt.date.tolist() == [date(2024, 7, 15), date(2024, 7, 16)]
+    assert frame[INTERNAL_DESC].tolist() == ['Fee', 'ACME Wire'] and frame[INTERNAL_AMOUNT_CENTS].tolist() == [400, -120450]
+
+
+@pytest.mark.parametrize('kind, detected', [('parquet', 'parquet'), ('arrow', 'arrow'), ('arrow_stream', 'arrow')])
+def test_columnar_uploads_are_sniffed_and_parsed(tmp_path, ingest_folder, kind, detected):
+    path = tmp_path / 'upload' # Stored uploads are named by their hash, without a suffix
+    path.write_bytes(_export_bytes(kind))
+    assert ingestion_service.detect_input_format(str(path)) == InputFormat(detected, None, None)
+    _assert_export_rows(reconciliation_service.parse_file_frame(str(path), MAPPING, use_cache=False))
+
+
+def test_parquet_reads_only_mapped_columns_memory_mapped(tmp_path, monkeypatch):
+    path = tmp_path / 'upload'
+    path.write_bytes(_export_bytes('parquet'))
+    reads, read_table = [], pq.read_table
+    monkeypatch.setattr(pq, 'read_table', lambda source, **kwargs: reads.append(kwargs) or read_table(source, **kwargs))
+
+    _, _, read_options = ingestion_service.mapping_read_plan(MAPPING)
+    frame = ingestion_service.read_columnar_frame(str(path), read_options)
+    assert reads == [{'columns': ['ID', 'Date', 'Memo', 'Amount'], 'memory_map': True}]
+    assert list(frame.columns) == ['ID', 'Date', 'Memo', 'Amount']
+    # Typed columns skip the string round trip; only the ID becomes text, as with dtype=str on CSVs
+    assert pd.api.types.is_datetime64_dtype(frame['Date']) and frame['Amount'].tolist() == [4.0, -1204.5]
+    assert frame['ID'].tolist() == ['101', '102']
+
+
+@pytest.mark.parametrize('kind', ['parquet', 'arrow'])
+def test_columnar_chunks_are_projected(tmp_path, kind):
+    path = tmp_path / 'upload'
+    path.write_bytes(_export_bytes(kind))
+    _, _, read_options = ingestion_service.mapping_read_plan(MAPPING)
+    chunks = list(ingestion_service._columnar_chunks(str(path), read_options, chunk_rows=1))
+    assert [list(chunk.columns) for chunk in chunks] == [['ID', 'Date', 'Memo', 'Amount']] * 2
+    assert [chunk['ID'].tolist() for chunk in chunks] == [['101'], ['102']]
+
+
+@pytest.mark.parametrize('kind', ['parquet', 'arrow'])
+def test_columnar_upload_missing_a_mapped_column(tmp_path, kind):
+    path = tmp_path / 'upload'
+    path.write_bytes(_export_bytes(kind))
+    mapping = dict(MAPPING, column_mappings={'Ref': INTERNAL_ID, 'Date': INTERNAL_DATE, 'Memo': INTERNAL_DESC, 'Amount': INTERNAL_AMOUNT})
+    _, _, read_options = ingestion_service.mapping_read_plan(mapping)
+    with pytest.raises(ValueError, match=r"Mapped columns not found in upload: \['Ref'\]"):
+        ingestion_service.read_columnar_frame(str(path), read_options)
+
+
+def _compress(data, compression, member='export/statement.dat'):
+    if compression == 'gzip':
+        return gzip.compress(data)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    sink = io.BytesIO()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        archive.writestr('__MACOSX/export/._statement.dat', b'resource fork') # Ignored like folders
+        archive.writestr(member, data)
+    return sink.getvalue()
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd', 'zip'])
+@pytest.mark.parametrize('kind', ['csv', 'parquet', 'arrow'])
+def test_compressed_uploads_are_sniffed_and_parsed(tmp_path, ingest_folder, compression, kind):
+    path = tmp_path / 'upload'
+    path.write_bytes(_compress(_export_bytes(kind), compression))
+    member = 'export/statement.dat' if compression == 'zip' else None
+    assert ingestion_service.detect_input_format(str(path)) == InputFormat(kind, compression, member)
+    _assert_export_rows(reconciliation_service.parse_file_frame(str(path), MAPPING, use_cache=False))
+    # Compressed CSVs stream; random-access formats get a decompressed copy that is removed afterwards
+    assert not ingest_folder.exists() or os.listdir(ingest_folder) == []
+
+
+def test_compressed_workbooks_are_sniffed(tmp_path):
+    path = str(tmp_path / 'upload')
+    _write_xlsx(path, XLSX_HEADER)
+    assert ingestion_service.detect_input_format(path) == InputFormat('xlsx', None, None) # A zip, but a workbook
+    with open(path, 'rb') as f:
+        workbook = f.read()
+    (tmp_path / 'upload.gz').write_bytes(gzip.compress(workbook))
+    assert ingestion_service.detect_input_format(str(tmp_path / 'upload.gz')) == InputFormat('xlsx', 'gzip', None)
+
+
+@pytest.mark.parametrize('name, kind', [('statement.parquet', 'csv'), ('statement.xlsx', 'csv'),
+                                        ('export.csv', 'parquet'), ('export.txt', 'arrow')])
+def test_content_wins_over_a_misleading_extension(tmp_path, ingest_folder, name, kind):
+    path = tmp_path / name
+    path.write_bytes(_export_bytes(kind))
+    assert ingestion_service.detect_input_format(str(path)).kind == kind
+    _assert_export_rows(reconciliation_service.parse_file_frame(str(path), MAPPING, use_cache=False))
+
+
+def test_gzipped_csv_named_as_plain_csv(tmp_path, ingest_folder):
+    path = tmp_path / 'statement.csv'
+    path.write_bytes(gzip.compress(_export_bytes('csv')))
+    assert ingestion_service.detect_input_format(str(path)) == InputFormat('csv', 'gzip', None)
+    _assert_export_rows(reconciliation_service.parse_file_frame(str(path), MAPPING, use_cache=False))
+
+
+def test_zip_must_hold_exactly_one_data_file(tmp_path):
+    sink = io.BytesIO()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        archive.writestr('january.csv', _export_bytes('csv'))
+        archive.writestr('february.csv', _export_bytes('csv'))
+    path = tmp_path / 'upload'
+    path.write_bytes(sink.getvalue())
+    with pytest.raises(ValueError, match="must contain exactly one data file, found 2"):
+        ingestion_service.detect_input_format(str(path))
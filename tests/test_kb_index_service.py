@@ -0,0 +1,108 @@
+# tests/test_kb_index_service.py
+# --- Imports ---
+import importlib
+import numpy as np
+import os
+import time
+import pytest
+
+config = importlib.import_module('agentrec-backend.config')
+models = importlib.import_module('agentrec-backend.models')
+kb_index_service = importlib.import_module('agentrec-backend.services.kb_index_service')
+db = models.db
+
+KB_V1 = "Rule KB-1: identical amounts match.\n\n" + "Bank fees under 5.00 are written off. " * 40
+KB_V2 = KB_V1 + "\n\nRule KB-9: wires settle within 3 days."
+
+
+class LetterEmbeddings:
+    """ Letter-frequency vectors; counts the texts it embeds. """
+    def __init__(self):
+        self.embedded = 0
+
+    def _vector(self, text):
+        counts = np.zeros(26, dtype=np.float32)
+        for char in text.lower():
+            if 'a' <= char <= 'z':
+                counts[ord(char) - ord('a')] += 1
+        return counts.tolist()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def fake_embeddings(tmp_path, monkeypatch):
+    fake = LetterEmbeddings()
+    monkeypatch.setattr(kb_index_service, 'embeddings', fake)
+    monkeypatch.setattr(kb_index_service, '_loaded_retrievers', {})
+    monkeypatch.setattr(config.Config, 'KB_INDEX_FOLDER', str(tmp_path / 'kb_index'))
+    return fake
+
+
+def _versions(type_id=1):
+    type_folder = os.path.join(config.Config.KB_INDEX_FOLDER, f"type_{type_id}")
+    return sorted(os.listdir(type_folder)) if os.path.isdir(type_folder) else []
+
+
+def _age(type_id, seconds):
+    """ Back-dates every stored file of a type. """
+    type_folder = os.path.join(config.Config.KB_INDEX_FOLDER, f"type_{type_id}")
+    for name in os.listdir(type_folder):
+        stamp = time.time() - seconds
+        os.utime(os.path.join(type_folder, name), (stamp, stamp))
+
+
+def test_index_is_embedded_once_and_reused(fake_embeddings, monkeypatch):
+    retriever = kb_index_service.get_kb_retriever(1, KB_V1)
+    embedded = fake_embeddings.embedded
+    assert embedded > 1
+    assert kb_index_service.get_kb_retriever(1, KB_V1) is retriever # In-process memo
+    monkeypatch.setattr(kb_index_service, '_loaded_retrievers', {}) # Another worker process
+    reloaded = kb_index_service.get_kb_retriever(1, KB_V1)
+    assert fake_embeddings.embedded == embedded # Loaded from disk, not re-embedded
+    assert isinstance(reloaded.matrix, np.memmap) and reloaded.texts == retriever.texts
+    assert reloaded.invoke("identical amounts match")[0].page_content.startswith("Rule KB-1")
+
+
+def test_kb_change_builds_a_new_version_and_keeps_the_old_one(fake_embeddings):
+    kb_index_service.get_kb_retriever(1, KB_V1)
+    embedded = fake_embeddings.embedded
+    retriever = kb_index_service.get_kb_retriever(1, KB_V2)
+    assert fake_embeddings.embedded > embedded
+    assert any("Rule KB-9" in text for text in retriever.texts)
+    versions = {kb_index_service.kb_content_hash(kb) for kb in (KB_V1, KB_V2)}
+    # Building never deletes other versions: a job that started on KB_V1 may still load it
+    assert _versions() == sorted(f"{version}.{ext}" for version in versions for ext in ('json', 'npy'))
+    assert list(kb_index_service._loaded_retrievers) == [(1, kb_index_service.kb_content_hash(KB_V2))]
+
+
+def test_gc_removes_versions_no_type_uses(app, fake_embeddings):
+    db.session.add(models.ReconciliationType(id=1, name='type', knowledge_base_content=KB_V2, ai_prompt_template='-'))
+    db.session.commit()
+    kb_index_service.get_kb_retriever(1, KB_V1)
+    kb_index_service.get_kb_retriever(2, KB_V1) # Type 2 no longer exists
+    kb_index_service.get_kb_retriever(1, KB_V2)
+    assert kb_index_service.collect_unreferenced_kb_indexes(grace_seconds=3600) == 0 # All recently used
+
+    _age(1, 7200)
+    _age(2, 7200)
+    assert kb_index_service.collect_unreferenced_kb_indexes(grace_seconds=3600) == 4
+    current = kb_index_service.kb_content_hash(KB_V2)
+    assert _versions(1) == [f"{current}.json", f"{current}.npy"] # The current version stays, however old
+    assert not os.path.exists(os.path.join(config.Config.KB_INDEX_FOLDER, 'type_2'))
+
+
+def test_loading_an_old_version_restarts_its_grace_period(app, fake_embeddings, monkeypatch):
+    db.session.add(models.ReconciliationType(id=1, name='type', knowledge_base_content=KB_V2, ai_prompt_template='-'))
+    db.session.commit()
+    kb_index_service.get_kb_retriever(1, KB_V1)
+    _age(1, 7200)
+    monkeypatch.setattr(kb_index_service, '_loaded_retrievers', {})
+    kb_index_service.get_kb_retriever(1, KB_V1) # A job still on the old KB
+    assert kb_index_service.collect_unreferenced_kb_indexes(grace_seconds=3600) == 0
+    assert len(_versions(1)) == 2
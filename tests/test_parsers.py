@@ -0,0 +1,58 @@
+# tests/test_parsers.py
+# --- Imports ---
+import importlib
+import pandas as pd
+import pytest
+import random
+
+parsers = importlib.import_module('agentrec-backend.utils.parsers')
+parse_amount_cents = parsers.parse_amount_cents
+
+# A non-ASCII cell sends the whole column down the text path instead of the byte buffer
+TEXT_PATH_CELL = 'n/a — pending'
+
+AMOUNT_CASES = [
+    ('12.50', 1250),
+    ('$1,234.56', 123456),
+    ('  12.5 ', 1250),
+    ('-5', -500),
+    ('(12)', -1200),
+    ('(1,234.50)', -123450),
+    ('$(5.00)', -500),
+    ('(12', None),
+    ('12)', None),
+    ('((12))', None),
+    ('( 12 )', None),
+    ('1 000', None),
+    ('- 5', None),
+    ('1\t000', None),
+    ('', None),
+    ('abc', None),
+]
+
+
+def _cents(cells):
+    return [None if pd.isna(value) else int(value) for value in parse_amount_cents(pd.Series(cells))]
+
+
+@pytest.mark.parametrize('cell, expected', AMOUNT_CASES)
+def test_buffer_path_amounts(cell, expected):
+    assert _cents([cell, '1']) == [expected, 100]
+
+
+@pytest.mark.parametrize('cell, expected', AMOUNT_CASES)
+def test_text_path_amounts(cell, expected):
+    assert _cents([cell, TEXT_PATH_CELL]) == [expected, None]
+
+
+def test_buffer_and_text_paths_agree_on_random_cells():
+    rng = random.Random(7)
+    alphabet = list('0123456789' * 3) + list('()$,.- \t+')
+    for _ in range(500):
+        cells = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8))) for _ in range(rng.randint(1, 10))]
+        assert _cents(cells) == _cents(cells + [TEXT_PATH_CELL])[:-1], cells
+
+
+def test_numeric_and_missing_cells():
+    assert _cents([12.5, None, -3]) == [1250, None, -300]
+    assert _cents(['True', 'False']) == [None, None]
@@ -0,0 +1,171 @@
+# tests/test_routes.py
+# --- Imports ---
+import importlib
+import io
+import pytest
+
+models = importlib.import_module('agentrec-backend.models')
+routes = importlib.import_module('agentrec-backend.routes')
+ingestion_service = importlib.import_module('agentrec-backend.services.ingestion_service')
+candidate_service = importlib.import_module('agentrec-backend.services.candidate_service')
+db = models.db
+
+
+@pytest.fixture
+def recon_type(app):
+    db.session.add(models.ReconciliationType(id=1, name='bank', knowledge_base_content='kb', ai_prompt_template='prompt'))
+    db.session.add(models.ReconciliationType(id=2, name='ap', knowledge_base_content='kb', ai_prompt_template='prompt'))
+    db.session.commit()
+
+
+def test_update_reconciliation_type(client, recon_type):
+    response = client.put('/api/reconciliation_types/1', json={
+        'description': 'Bank vs GL', 'candidate_selection_strategy': 'high_volume',
+        'candidate_strategy_params': {'date_window_days': 5}, 'ai_max_concurrency': 4, 'is_active': False})
+    assert response.status_code == 200
+    assert response.get_json() == {'id': 1, 'name': 'bank', 'description': 'Bank vs GL', 'candidate_selection_strategy': 'high_volume',
+                                   'candidate_strategy_params': {'date_window_days': 5}, 'ai_max_concurrency': 4, 'is_active': False}
+    db.session.expire_all()
+    stored = db.session.get(models.ReconciliationType, 1)
+    assert stored.candidate_selection_strategy == 'high_volume' and stored.ai_prompt_template == 'prompt' # Unsent fields kept
+
+
+def test_update_validates_the_strategy_and_params_together(client, recon_type):
+    # Params valid for default_date_amount, but exact_amount has no tolerance left once amount_tolerance is null
+    assert client.put('/api/reconciliation_types/1', json={'candidate_strategy_params': {'amount_tolerance': None, 'amount_tolerance_pct': 2}}).status_code == 200
+    response = client.put('/api/reconciliation_types/1', json={'candidate_selection_strategy': 'exact_amount',
+                                                              'candidate_strategy_params': {'amount_tolerance': None}})
+    assert response.status_code == 400 and 'amount_tolerance_pct' in response.get_json()['error']
+    response = client.put('/api/reconciliation_types/1', json={'candidate_selection_strategy': 'nearest'})
+    assert response.status_code == 400 and "Unknown candidate selection strategy" in response.get_json()['error']
+
+
+@pytest.mark.parametrize('payload, status, message', [
+    ({'id': 7}, 400, "Fields cannot be updated: id"),
+    ({'knowledge_base_content': ''}, 400, "Fields cannot be empty: knowledge_base_content"),
+    ({'ai_max_concurrency': 0}, 400, "ai_max_concurrency must be a positive integer"),
+    ({'candidate_strategy_params': [5]}, 400, "candidate_strategy_params must be an object"),
+    ({'candidate_strategy_params': {'date_window_days': -2}}, 400, "'date_window_days' must be a non-negative integer"),
+    ({'name': 'ap'}, 409, "Reconciliation Type name 'ap' already exists."),
+])
+def test_update_rejects_invalid_payloads(client, recon_type, payload, status, message):
+    response = client.put('/api/reconciliation_types/1', json=payload)
+    assert response.status_code == status and message in response.get_json()['error']
+    db.session.expire_all()
+    assert db.session.get(models.ReconciliationType, 1).name == 'bank'
+
+
+def test_update_unknown_type(client, recon_type):
+    assert client.put('/api/reconciliation_types/99', json={'name': 'x'}).status_code == 404
+
+
+def test_candidate_strategies_list_presets(client):
+    strategies = {entry['name']: entry['default_params'] for entry in client.get('/api/reconciliation_types/candidate_strategies').get_json()}
+    assert strategies == candidate_service.DATE_AMOUNT_BAND_PRESETS
+
+
+COLUMN_MAPPINGS = {'transaction_id': 'internal_id', 'date': 'internal_date',
+                   'description': 'internal_description', 'amount': 'internal_amount'}
+GOOD_CSV = b'transaction_id,date,description,amount\nT-1,2024-07-15,ACME Wire,100.00\n'
+
+
+@pytest.fixture
+def mappings(recon_type):
+    for mapping_id, source_type in ((1, models.MappingSourceType.SOURCE), (2, models.MappingSourceType.TARGET)):
+        db.session.add(models.DataSourceMapping(id=mapping_id, mapping_name=f"{source_type.name.lower()} map",
+                                                source_type=source_type, column_mappings=COLUMN_MAPPINGS,
+                                                date_format_string='%Y-%m-%d'))
+    db.session.commit()
+
+
+@pytest.fixture
+def ingestion_enqueued(monkeypatch):
+    """ Job ids sent to the ingestion task (nothing reaches a broker). """
+    jobs = []
+
+    class Result:
+        id = 'ingest-task'
+    monkeypatch.setattr(routes.ingest_job_files_task, 'delay', lambda job_id: jobs.append(job_id) or Result())
+    return jobs
+
+
+def _upload(client, source=GOOD_CSV, target=GOOD_CSV):
+    return client.post('/api/reconciliations/upload', content_type='multipart/form-data', data={
+        'sourceFile': (io.BytesIO(source), 'bank.csv'), 'targetFile': (io.BytesIO(target), 'ledger.csv'),
+        'reconciliation_type_id': '1', 'source_mapping_id': '1', 'target_mapping_id': '2'})
+
+
+def _ref_counts():
+    db.session.expire_all()
+    return sorted(upload.ref_count for upload in models.UploadedFile.query.all())
+
+
+def test_upload_creates_a_job_and_enqueues_ingestion(client, mappings, ingestion_enqueued):
+    response = _upload(client)
+    assert response.status_code == 201
+    assert response.get_json()['ingestionTaskId'] == 'ingest-task'
+    assert ingestion_enqueued == [response.get_json()['jobId']]
+    assert _ref_counts() == [2] # Identical source and target content share one blob
+
+
+@pytest.mark.parametrize('target, message', [
+    (b'id,date,description,amount\nT-1,2024-07-15,Fee,4.00\n', "Mapped column(s) ['transaction_id'] not found"),
+    (b'transaction_id,date,description,amount\nT-1,07/15/2024,Fee,4.00\n', "No sampled value of date column 'date'"),
+    (b'transaction_id,date,description,amount\nT-1,2024-07-15,Fee,four\n', "No sampled value of amount column 'amount'"),
+    (b'\x1f\x8b\x08\x00' + b'not really gzip' * 8, "does not match mapping"),
+])
+def test_upload_rejected_by_preflight_releases_both_files(client, mappings, ingestion_enqueued, target, message):
+    response = _upload(client, target=target)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith("Target file 'ledger.csv' does not match mapping 'target map': ")
+    assert message in response.get_json()['error']
+    assert models.ReconciliationJob.query.count() == 0 and ingestion_enqueued == []
+    assert _ref_counts() == [0, 0] # Left for upload GC, not kept alive by a job that was never created
+
+
+def test_upload_server_failure_during_preflight_is_not_a_rejection(client, mappings, ingestion_enqueued, monkeypatch):
+    def unreadable(file_path, mapping_config):
+        raise PermissionError(13, 'Permission denied', file_path)
+    monkeypatch.setattr(routes, 'preflight_check', unreadable)
+    response = _upload(client)
+    assert response.status_code == 500 and response.get_json() == {'error': 'File upload failed'}
+    assert models.ReconciliationJob.query.count() == 0 and _ref_counts() == []
+
+
+def test_update_reference_patterns(client, mappings, tmp_path):
+    upload = tmp_path / 'bank.csv'
+    upload.write_bytes(GOOD_CSV)
+    before = ingestion_service.parsed_cache_path(str(upload), routes.mapping_config_for(db.session.get(models.DataSourceMapping, 1)))
+
+    response = client.put('/api/mappings/1/reference_patterns', json={'reference_patterns': [r'INV#?(\d+)', r'CHK\s*\d+']})
+    assert response.status_code == 200
+    assert response.get_json() == {'id': 1, 'name': 'source map', 'referencePatterns': [r'INV#?(\d+)', r'CHK\s*\d+']}
+    db.session.expire_all()
+    mapping = db.session.get(models.DataSourceMapping, 1)
+    assert mapping.reference_patterns == [r'INV#?(\d+)', r'CHK\s*\d+']
+    # Cached parses of the old patterns stop matching
+    assert ingestion_service.parsed_cache_path(str(upload), routes.mapping_config_for(mapping)) != before
+
+    assert client.put('/api/mappings/1/reference_patterns', json={'reference_patterns': []}).get_json()['referencePatterns'] is None
+    db.session.expire_all()
+    assert db.session.get(models.DataSourceMapping, 1).reference_patterns is None
+
+
+@pytest.mark.parametrize('payload, message', [
+    ({}, "JSON payload with reference_patterns required"),
+    ({'reference_patterns': r'INV(\d+)'}, "reference_patterns must be a list of regular expressions"),
+    ({'reference_patterns': ['']}, "reference_patterns must be a list of regular expressions"),
+    ({'reference_patterns': [r'INV(\d+']}, r"Invalid reference pattern 'INV(\\d+'"),
+    ({'reference_patterns': [r'(INV)(\d+)']}, "may have at most one capture group"),
+])
+def test_update_reference_patterns_rejects_invalid_patterns(client, mappings, payload, message):
+    client.put('/api/mappings/1/reference_patterns', json={'reference_patterns': [r'INV(\d+)']})
+    response = client.put('/api/mappings/1/reference_patterns', json=payload)
+    assert response.status_code == 400 and message in response.get_json()['error']
+    db.session.expire_all()
+    assert db.session.get(models.DataSourceMapping, 1).reference_patterns == [r'INV(\d+)'] # Unchanged
+
+
+def test_update_reference_patterns_of_unknown_mapping(client, mappings):
+    response = client.put('/api/mappings/9/reference_patterns', json={'reference_patterns': []})
+    assert response.status_code == 404 and response.get_json() == {'error': 'Mapping ID 9 not found.'}
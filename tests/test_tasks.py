@@ -0,0 +1,106 @@
+# tests/test_tasks.py
+# --- Imports ---
+import importlib
+import os
+import pytest
+
+config = importlib.import_module('agentrec-backend.config')
+models = importlib.import_module('agentrec-backend.models')
+routes = importlib.import_module('agentrec-backend.routes')
+tasks = importlib.import_module('agentrec-backend.tasks')
+ingestion_service = importlib.import_module('agentrec-backend.services.ingestion_service')
+db = models.db
+
+COLUMN_MAPPINGS = {'transaction_id': 'internal_id', 'date': 'internal_date',
+                   'description': 'internal_description', 'amount': 'internal_amount'}
+
+
+@pytest.fixture
+def job(app, tmp_path):
+    """ A job over two small CSVs, with its ingestion not yet run. """
+    paths = []
+    for side in ('source', 'target'):
+        path = str(tmp_path / f'{side}.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('transaction_id,date,description,amount\n1,2024-07-15,Fee,4.00\n2,2024-07-16,Wire,"1,200.00"\n')
+        paths.append(path)
+    db.session.add(models.ReconciliationType(id=1, name='type', knowledge_base_content='kb', ai_prompt_template='-'))
+    db.session.add(models.DataSourceMapping(id=1, mapping_name='csv', source_type=models.MappingSourceType.SOURCE,
+                                            column_mappings=COLUMN_MAPPINGS, date_format_string='%Y-%m-%d'))
+    job = models.ReconciliationJob(reconciliation_type_id=1, source_file=paths[0], target_file=paths[1],
+                                   source_mapping_id=1, target_mapping_id=1, ingestion_stats={'status': 'PENDING'})
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """ Job ids sent to run_reconciliation_task (nothing reaches a broker). """
+    job_ids = []
+
+    class Task:
+        id = 'task-1'
+
+    monkeypatch.setattr(routes.run_reconciliation_task, 'delay', lambda job_id: job_ids.append(job_id) or Task())
+    return job_ids
+
+
+@pytest.mark.parametrize('status', ['PENDING', 'PROCESSING'])
+def test_run_waits_for_ingestion(client, job, dispatched, status):
+    job.ingestion_stats = {'status': status}
+    db.session.commit()
+    response = client.post(f'/api/reconciliations/{job.id}/run')
+    assert response.status_code == 409
+    assert response.get_json()['ingestion'] == {'status': status}
+    assert dispatched == []
+
+
+def test_run_surfaces_failed_ingestion(client, job, dispatched):
+    job.ingestion_stats = {'status': 'FAILED', 'error': "ValueError: Mapping 1 must map to: ..."}
+    db.session.commit()
+    response = client.post(f'/api/reconciliations/{job.id}/run')
+    assert response.status_code == 400
+    assert "ValueError: Mapping 1 must map to" in response.get_json()['error']
+    assert dispatched == []
+
+
+@pytest.mark.parametrize('ingestion_stats', [{'status': 'COMPLETED'}, None])
+def test_run_dispatches_after_ingestion(client, job, dispatched, ingestion_stats):
+    job.ingestion_stats = ingestion_stats # None: ingestion could not be enqueued, the run parses the files
+    db.session.commit()
+    assert client.post(f'/api/reconciliations/{job.id}/run').status_code == 202
+    assert dispatched == [job.id]
+
+
+def test_ingestion_persists_parsed_files_with_the_cache_disabled(app, job, monkeypatch):
+    monkeypatch.setattr(config.Config, 'PARSED_FILE_CACHE_ENABLED', False)
+    monkeypatch.setattr(tasks, 'create_app', lambda: app)
+    stats = tasks.ingest_job_files_task(job.id)
+    assert stats['status'] == 'COMPLETED' and stats['source']['rows'] == 2
+
+    mapping_config = tasks.mapping_config_for(db.session.get(models.DataSourceMapping, 1))
+    assert os.path.exists(ingestion_service.parsed_cache_path(job.source_file, mapping_config))
+    db.session.expire_all() # The task committed through its own app context's session
+    assert db.session.get(models.ReconciliationJob, job.id).ingestion_stats['status'] == 'COMPLETED'
+
+
+def test_ingestion_error_is_stored_on_the_job(app, job, monkeypatch):
+    monkeypatch.setattr(tasks, 'create_app', lambda: app)
+    mapping = db.session.get(models.DataSourceMapping, 1)
+    mapping.column_mappings = {'transaction_id': 'internal_id'}
+    db.session.commit()
+    assert tasks.ingest_job_files_task(job.id)['status'] == 'FAILED'
+    db.session.expire_all()
+    stored = db.session.get(models.ReconciliationJob, job.id).ingestion_stats
+    assert stored['status'] == 'FAILED' and stored['error'].startswith('ValueError')
+    assert tasks.ingestion_error(stored) == f"File ingestion failed: {stored['error']}"
+
+
+def test_run_task_rejects_jobs_still_ingesting(app, job, monkeypatch):
+    monkeypatch.setattr(tasks, 'create_app', lambda: app)
+    with pytest.raises(tasks.ReconciliationError, match='still being ingested'):
+        tasks.run_reconciliation_task(job.id)
+    db.session.expire_all()
+    failed = db.session.get(models.ReconciliationJob, job.id)
+    assert failed.status == models.JobStatus.FAILED and 'still being ingested' in failed.results_summary['error']
@@ -0,0 +1,100 @@
+# tests/test_transaction_set.py
+# --- Imports ---
+from collections.abc import Mapping
+from datetime import date
+from decimal import Decimal
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+import random
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+transaction_set = importlib.import_module('agentrec-backend.services.transaction_set')
+INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_DESC, INTERNAL_AMOUNT_CENTS, INTERNAL_REF = (
+    columns.INTERNAL_ID, columns.INTERNAL_DATE, columns.INTERNAL_AMOUNT, columns.INTERNAL_DESC,
+    columns.INTERNAL_AMOUNT_CENTS, columns.INTERNAL_REF)
+TransactionSet, TransactionView, UsedBitmap = transaction_set.TransactionSet, transaction_set.TransactionView, transaction_set.UsedBitmap
+
+
+@pytest.fixture
+def transactions():
+    return TransactionSet(pd.DataFrame({
+        INTERNAL_ID: ['S-1', 'S-2', 'S-3'],
+        INTERNAL_DATE: [date(2024, 7, 15), date(1969, 12, 31), date(2024, 2, 29)],
+        INTERNAL_DESC: ['ACME Wire', None, 'ACME Wire'],
+        INTERNAL_AMOUNT_CENTS: [10000, -5, 0],
+        INTERNAL_REF: ['INV4471', '', 'INV4471'],
+    }))
+
+
+def test_view_is_a_read_only_mapping(transactions):
+    view = transactions[0]
+    assert isinstance(view, Mapping) and not hasattr(view, '__setitem__')
+    assert list(view) == [INTERNAL_ID, INTERNAL_DATE, INTERNAL_AMOUNT, INTERNAL_AMOUNT_CENTS, INTERNAL_DESC, INTERNAL_REF]
+    assert len(view) == 6 and INTERNAL_AMOUNT in view and 'amount' not in view
+    assert dict(view) == {INTERNAL_ID: 'S-1', INTERNAL_DATE: date(2024, 7, 15), INTERNAL_AMOUNT: Decimal('100.00'),
+                          INTERNAL_AMOUNT_CENTS: 10000, INTERNAL_DESC: 'ACME Wire', INTERNAL_REF: 'INV4471'}
+    assert view == dict(view) # Mapping equality, as code written for record dicts expects
+    with pytest.raises(KeyError):
+        view['amount']
+    assert view.get('amount', 'default') == 'default'
+    with pytest.raises(AttributeError):
+        view.extra = 1 # __slots__: no per-row dict
+
+
+def test_view_decodes_values_on_access(transactions):
+    assert transactions[1][INTERNAL_DATE] == date(1969, 12, 31) # Negative day numbers
+    assert transactions[1][INTERNAL_AMOUNT] == Decimal('-0.05') and transactions[1][INTERNAL_DESC] is None
+    assert transactions[2][INTERNAL_DATE] == date(2024, 2, 29)
+    assert isinstance(transactions[0][INTERNAL_AMOUNT_CENTS], int)
+
+
+def test_views_are_rows_not_copies(transactions):
+    assert transactions[-1].row == 2 and [view.row for view in transactions] == [0, 1, 2]
+    assert transactions[0]._set is transactions
+    with pytest.raises(IndexError):
+        transactions[3]
+    with pytest.raises(IndexError):
+        transactions[-4]
+
+
+def test_descriptions_are_interned(transactions):
+    codes, distinct = transactions.interned(INTERNAL_DESC)
+    assert codes.dtype == np.int32 and codes.tolist() == [0, -1, 0]
+    assert distinct == ['ACME Wire', None]
+    assert transactions.column(INTERNAL_DESC).tolist() == ['ACME Wire', None, 'ACME Wire']
+    assert transactions.column(INTERNAL_ID).tolist() == ['S-1', 'S-2', 'S-3']
+
+
+def test_rows_take_tens_of_bytes():
+    rows = 10_000
+    transactions = TransactionSet(pd.DataFrame({
+        INTERNAL_ID: [f"S-{k}" for k in range(rows)],
+        INTERNAL_DATE: [date(2024, 7, 1 + k % 28) for k in range(rows)],
+        INTERNAL_DESC: [f"Card payment {k % 50}" for k in range(rows)],
+        INTERNAL_AMOUNT_CENTS: [k * 7 for k in range(rows)],
+    }))
+    assert transactions.nbytes() / rows < 40
+
+
+def test_bitmap_sets_and_clears_single_bits():
+    used = UsedBitmap(13) # Not a multiple of 8: the last byte is partly unused
+    assert len(used) == 13 and not any(used[j] for j in range(13))
+    for j in (0, 7, 8, 12):
+        used[j] = True
+    assert [j for j in range(13) if used[j]] == [0, 7, 8, 12]
+    used[7] = False
+    used[7] = False # Clearing twice is a no-op
+    used[8] = True  # So is setting twice
+    assert [j for j in range(13) if used[j]] == [0, 8, 12]
+
+
+def test_bitmap_vectorized_lookup_agrees_with_indexing():
+    rng = random.Random(5)
+    used = UsedBitmap(100)
+    for j in rng.sample(range(100), 30):
+        used[j] = True
+    indices = np.array([rng.randrange(100) for _ in range(200)])
+    assert used.test(indices).tolist() == [used[j] for j in indices]
+    assert used.test(np.empty(0, dtype=np.int32)).tolist() == []
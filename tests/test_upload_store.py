@@ -0,0 +1,132 @@
+# tests/test_upload_store.py
+# --- Imports ---
+import hashlib
+import importlib
+import io
+import os
+import threading
+import pytest
+from werkzeug.datastructures import FileStorage
+
+models = importlib.import_module('agentrec-backend.models')
+routes = importlib.import_module('agentrec-backend.routes')
+upload_store = importlib.import_module('agentrec-backend.services.upload_store')
+db, UploadedFile = models.db, models.UploadedFile
+
+CONTENT = b'transaction_id,date,description,amount\n1,2024-07-15,Fee,4.00\n'
+CONTENT_HASH = hashlib.sha256(CONTENT).hexdigest()
+
+
+def _store(content=CONTENT, filename='bank.csv'):
+    return upload_store.store_upload(FileStorage(stream=io.BytesIO(content), filename=filename))
+
+
+def _row(content_hash=CONTENT_HASH):
+    db.session.expire_all()
+    return UploadedFile.query.filter_by(content_hash=content_hash).one_or_none()
+
+
+@pytest.fixture
+def gc_enqueued(monkeypatch):
+    """ Number of upload GC runs sent to the broker (nothing reaches one). """
+    calls = []
+    monkeypatch.setattr(routes.collect_upload_garbage_task, 'delay', lambda: calls.append(1))
+    return calls
+
+
+def test_identical_uploads_share_one_blob(app):
+    first = _store()
+    db.session.commit()
+    second = _store(filename='renamed.csv')
+    db.session.commit()
+    assert first.storage_path == second.storage_path == os.path.join(app.config['UPLOAD_FOLDER'], CONTENT_HASH)
+    assert _row().ref_count == 2 and _row().original_filename == 'bank.csv'
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == [CONTENT_HASH]
+
+
+def test_release_drops_one_reference_and_ignores_legacy_files(app):
+    path = _store().storage_path
+    _store()
+    db.session.commit()
+    assert upload_store.release_upload(path)
+    db.session.commit()
+    assert _row().ref_count == 1
+    assert not upload_store.release_upload(os.path.join(app.config['UPLOAD_FOLDER'], 'job_1_source_bank.csv'))
+    assert upload_store.release_upload(path) and not upload_store.release_upload(path) # Never below zero
+    db.session.commit()
+    assert _row().ref_count == 0
+
+
+def test_gc_removes_released_blobs_after_the_grace_period(app):
+    path = _store().storage_path
+    db.session.commit()
+    assert upload_store.collect_unreferenced_uploads(grace_seconds=0) == 0 # Still referenced
+    upload_store.release_upload(path)
+    db.session.commit()
+    assert upload_store.collect_unreferenced_uploads(grace_seconds=3600) == 0 # Released just now
+    assert os.path.exists(path)
+    assert upload_store.collect_unreferenced_uploads(grace_seconds=0) == 1
+    assert not os.path.exists(path) and _row() is None
+
+
+def test_gc_removes_stale_partial_and_row_less_uploads(app):
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    partial = os.path.join(folder, f"{upload_store.INCOMING_PREFIX}abc")
+    row_less = os.path.join(folder, 'f' * 64) # Blob of an upload whose job was rolled back
+    legacy = os.path.join(folder, 'job_1_source_bank.csv')
+    for path in (partial, row_less, legacy):
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+    assert upload_store.collect_unreferenced_uploads(grace_seconds=3600) == 0
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(p) for p in (partial, row_less, legacy))
+    upload_store.collect_unreferenced_uploads(grace_seconds=0)
+    assert os.listdir(folder) == [os.path.basename(legacy)]
+
+
+def test_upload_after_gc_stores_the_blob_again(app):
+    path = _store().storage_path
+    upload_store.release_upload(path)
+    db.session.commit()
+    assert upload_store.collect_unreferenced_uploads(grace_seconds=0) == 1
+    assert _store().storage_path == path
+    db.session.commit()
+    assert os.path.exists(path) and _row().ref_count == 1
+
+
+def test_concurrent_uploads_of_the_same_content(app):
+    """ Both references are counted whichever upload creates the row. """
+    barrier, errors = threading.Barrier(2), []
+
+    def upload():
+        try:
+            with app.app_context():
+                barrier.wait()
+                _store()
+                db.session.commit()
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upload) for _ in range(2)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    assert _row().ref_count == 2
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == [CONTENT_HASH]
+
+
+def test_deleting_a_job_releases_uploads_and_enqueues_gc(app, client, gc_enqueued):
+    path = _store().storage_path
+    _store()
+    db.session.add(models.ReconciliationType(id=1, name='type', knowledge_base_content='kb', ai_prompt_template='-'))
+    db.session.add(models.DataSourceMapping(id=1, mapping_name='csv', source_type=models.MappingSourceType.SOURCE,
+                                            column_mappings={'transaction_id': 'internal_id'}))
+    job = models.ReconciliationJob(reconciliation_type_id=1, source_file=path, target_file=path,
+                                   source_mapping_id=1, target_mapping_id=1)
+    db.session.add(job)
+    db.session.commit()
+    assert client.delete(f'/api/reconciliations/{job.id}').status_code == 200
+    assert _row().ref_count == 0
+    assert gc_enqueued == [1]
+    assert os.path.exists(path) # Removed by the GC task, not by the request
@@ -0,0 +1,111 @@
+# tests/test_verdict_cache.py
+# --- Imports ---
+from datetime import datetime, timedelta, timezone
+import importlib
+import pytest
+
+columns = importlib.import_module('agentrec-backend.services.columns')
+models = importlib.import_module('agentrec-backend.models')
+verdict_cache = importlib.import_module('agentrec-backend.services.verdict_cache')
+db, AIVerdictCache, VerdictCache = models.db, models.AIVerdictCache, verdict_cache.VerdictCache
+
+SOURCE = {columns.INTERNAL_ID: 'S-1', columns.INTERNAL_DATE: '2024-07-15', columns.INTERNAL_AMOUNT: 12.5,
+          columns.INTERNAL_DESC: 'Wire  ACME'}
+TARGET = {columns.INTERNAL_ID: 'T-1', columns.INTERNAL_DATE: '2024-07-15', columns.INTERNAL_AMOUNT: '12.50',
+          columns.INTERNAL_DESC: 'ACME wire'}
+MATCHED = {'status': 'Matched', 'confidence': 0.9, 'reasoning': 'Same payment.'}
+
+
+@pytest.fixture
+def recon_type(app):
+    recon_type = models.ReconciliationType(id=1, name='type', knowledge_base_content='kb', ai_prompt_template='prompt')
+    db.session.add(recon_type)
+    db.session.commit()
+    return recon_type
+
+
+def _cache(kb='kb', prompt='prompt', batch_prompt=None):
+    return VerdictCache(1, kb, prompt, batch_prompt)
+
+
+def _stored(cache_verdicts):
+    """ Writes verdicts for (source, target) pairs through one cache, as a finished job would. """
+    cache = _cache()
+    for source, target, verdict in cache_verdicts:
+        cache.put(source, target, verdict)
+    cache.close()
+
+
+def _entries():
+    db.session.expire_all()
+    return AIVerdictCache.query.order_by(AIVerdictCache.id).all()
+
+
+def test_miss_then_hit_after_flush(recon_type):
+    cache = _cache()
+    assert cache.get(SOURCE, TARGET) is None
+    cache.put(SOURCE, TARGET, MATCHED)
+    assert cache.get(SOURCE, TARGET) == MATCHED # Served from the unflushed buffer
+    assert _entries() == [] # Nothing written before flush()
+    cache.close()
+    assert cache.stats() == {'ai_cache_hits': 1, 'ai_cache_misses': 1}
+
+    next_job = _cache()
+    equivalent = dict(SOURCE, **{columns.INTERNAL_AMOUNT: '12.500', columns.INTERNAL_DESC: ' Wire ACME '})
+    assert next_job.get(equivalent, TARGET) == MATCHED
+    assert next_job.get(TARGET, SOURCE) is None # Pair order is part of the key
+    next_job.close()
+    assert _entries()[0].hit_count == 2 # One hit per job
+
+
+def test_ai_errors_are_not_cached(recon_type):
+    _stored([(SOURCE, TARGET, {'status': 'Error', 'reasoning': 'timeout'})])
+    assert _entries() == []
+
+
+def test_concurrent_jobs_upsert_one_entry(recon_type):
+    first, second = _cache(), _cache()
+    first.put(SOURCE, TARGET, MATCHED)
+    second.put(SOURCE, TARGET, dict(MATCHED, status='Partial Match'))
+    first.close()
+    second.close() # Same cache_key: replaces the entry instead of failing on the unique index
+    entries = _entries()
+    assert len(entries) == 1 and entries[0].verdict['status'] == 'Partial Match'
+
+
+@pytest.mark.parametrize('kb, prompt, batch_prompt', [('kb v2', 'prompt', None), ('kb', 'prompt v2', None),
+                                                      ('kb', 'prompt', 'batch prompt')])
+def test_kb_prompt_or_batch_change_misses(recon_type, kb, prompt, batch_prompt):
+    _stored([(SOURCE, TARGET, MATCHED)])
+    assert _cache(kb, prompt, batch_prompt).get(SOURCE, TARGET) is None
+    assert _cache().get(SOURCE, TARGET) == MATCHED
+
+
+def test_editing_kb_or_prompt_invalidates_the_type_entries(recon_type, client):
+    _stored([(SOURCE, TARGET, MATCHED)])
+    assert client.put('/api/reconciliation_types/1', json={'name': 'renamed', 'knowledge_base_content': 'kb'}).status_code == 200
+    assert len(_entries()) == 1 # Unchanged KB: entries kept
+    assert client.put('/api/reconciliation_types/1', json={'knowledge_base_content': 'kb v2'}).status_code == 200
+    assert _entries() == []
+
+    _stored([(SOURCE, TARGET, MATCHED)])
+    assert client.put('/api/reconciliation_types/1', json={'ai_prompt_template': 'prompt v2'}).status_code == 200
+    assert _entries() == []
+
+
+def test_opening_a_cache_does_not_write(recon_type):
+    _stored([(SOURCE, TARGET, MATCHED)])
+    _cache('kb v2').close() # A job under another KB leaves older entries to eviction
+    assert len(_entries()) == 1
+
+
+def test_eviction_applies_age_and_size_limits(recon_type):
+    _stored([(dict(SOURCE, **{columns.INTERNAL_ID: f"S-{k}"}), TARGET, MATCHED) for k in range(4)])
+    now = datetime.now(timezone.utc)
+    for age_days, entry in zip([100, 3, 2, 1], _entries()):
+        entry.last_used_at = now - timedelta(days=age_days)
+    db.session.commit()
+    assert verdict_cache.evict_cache_entries(max_age_days=90, max_entries=0) == 1
+    assert verdict_cache.evict_cache_entries(max_age_days=0, max_entries=2) == 1
+    remaining = [entry.last_used_at.replace(tzinfo=timezone.utc) for entry in _entries()]
+    assert [round((now - used).total_seconds() / 86400) for used in remaining] == [2, 1] # Most recently used kept